@@ -32,7 +32,8 @@ def _generate_potfiles_in():
         return ret
 
     scripts = ["virt-manager", "virt-install",
-               "virt-clone", "virt-image", "virt-convert", "virt-xml"]
+               "virt-clone", "virt-image", "virt-convert", "virt-xml",
+               "virt-cli-server", "virt-migrate"]
 
     potfiles = "\n".join(scripts) + "\n\n"
     potfiles += "\n".join(find("virtManager", "*.py")) + "\n\n"
@@ -145,7 +146,8 @@ class my_build(build):
 
     def _make_bin_wrappers(self):
         cmds = ["virt-manager", "virt-install", "virt-clone",
-                "virt-image", "virt-convert", "virt-xml"]
+                "virt-image", "virt-convert", "virt-xml", "virt-cli-server",
+                "virt-migrate"]
 
         if not os.path.exists("build"):
             os.mkdir("build")
@@ -472,7 +474,8 @@ class TestCommand(TestBaseCommand):
         for t in glob.glob(os.path.join(self._dir, 'tests', '*.py')):
             if (t.endswith("__init__.py") or
                 t.endswith("test_urls.py") or
-                t.endswith("test_inject.py")):
+                t.endswith("test_inject.py") or
+                t.endswith("test_startup.py")):
                 continue
 
             base = os.path.basename(t)
@@ -548,6 +551,14 @@ class TestInitrdInject(TestBaseCommand):
         TestBaseCommand.run(self)
 
 
+class TestStartup(TestBaseCommand):
+    description = "Check CLI tool and virt-manager startup times"
+
+    def run(self):
+        self._testfiles = ["tests.test_startup"]
+        TestBaseCommand.run(self)
+
+
 class CheckPylint(Command):
     user_options = []
     description = "Check code using pylint and pep8"
@@ -559,7 +570,8 @@ class CheckPylint(Command):
 
     def run(self):
         files = ["setup.py", "virt-install", "virt-clone", "virt-image",
-                 "virt-convert", "virt-xml", "virt-manager",
+                 "virt-convert", "virt-xml", "virt-cli-server", "virt-migrate",
+                 "virt-manager",
                  "virtcli", "virtinst", "virtconv", "virtManager",
                  "tests"]
 
@@ -591,7 +603,9 @@ setup(
         "build/virt-install",
         "build/virt-image",
         "build/virt-convert",
-        "build/virt-xml"]),
+        "build/virt-xml",
+        "build/virt-cli-server",
+        "build/virt-migrate"]),
 
     data_files=[
         ("share/virt-manager/", [
@@ -601,6 +615,8 @@ setup(
             "virt-image",
             "virt-convert",
             "virt-xml",
+            "virt-cli-server",
+            "virt-migrate",
         ]),
         ("share/glib-2.0/schemas",
          ["data/org.virt-manager.virt-manager.gschema.xml"]),
@@ -612,7 +628,9 @@ setup(
             "man/virt-clone.1",
             "man/virt-image.1",
             "man/virt-convert.1",
-            "man/virt-xml.1"
+            "man/virt-xml.1",
+            "man/virt-migrate.1",
+            "man/virt-cli-server.1"
         ]),
         ("share/man/man5", ["man/virt-image.5"]),
 
@@ -641,5 +659,6 @@ setup(
         'test': TestCommand,
         'test_urls' : TestURLFetch,
         'test_initrd_inject' : TestInitrdInject,
+        'test_startup' : TestStartup,
     }
 )
@@ -16,6 +16,8 @@
 # MA 02110-1301 USA.
 
 import os
+import shutil
+import tempfile
 import unittest
 
 from virtinst import CapabilitiesParser as capabilities
@@ -270,5 +272,57 @@ class TestCapabilities(unittest.TestCase):
             'pse36', 'sep', 'sse', 'sse2', 'tsc', 'vme']
         test_single_cpu(cpu_64, "athlon", "AMD", athlon_features)
 
+    def testCapsGuestLookup(self):
+        caps = self._buildCaps("capabilities-kvm.xml")
+
+        guest, domain = caps.guest_lookup()
+        self.assertEquals(guest.arch, "i686")
+        self.assertEquals(domain.hypervisor_type, "qemu")
+        guest, domain = caps.guest_lookup(accelerated=True)
+        self.assertEquals(domain.hypervisor_type, "kvm")
+
+        guest, domain = caps.guest_lookup(os_type="hvm", arch="sparc",
+                                          machine="sun4m")
+        self.assertEquals(guest.arch, "sparc")
+        self.assertEquals(domain.hypervisor_type, "qemu")
+
+        self.assertRaises(RuntimeError, caps.guest_lookup,
+                          arch="x86_64", typ="kvm")
+        self.assertRaises(RuntimeError, caps.guest_lookup,
+                          arch="x86_64", machine="sun4m")
+        self.assertRaises(ValueError, caps.guest_lookup, os_type="xen")
+        self.assertEquals(caps.get_archs("hvm")[:3],
+                          ["i686", "x86_64", "mips"])
+
+    def testCapsCache(self):
+        path = os.path.join("tests/capabilities-xml", "capabilities-kvm.xml")
+        xml = file(path).read()
+
+        tmpdir = tempfile.mkdtemp()
+        origfunc = capabilities._cache_path
+        try:
+            capabilities._cache_path = (
+                lambda kind, key: os.path.join(tmpdir, kind))
+
+            caps1 = capabilities.load_capabilities(xml, "qemu:///system")
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, "caps")))
+            caps2 = capabilities.load_capabilities(xml, "qemu:///system")
+            self.assertTrue(caps1 is not caps2)
+            self.assertEquals(caps1.xml, caps2.xml)
+            self.assertEquals(caps1.host.cpu.arch, caps2.host.cpu.arch)
+            self.assertEquals(
+                [(g.os_type, g.arch, len(g.domains)) for g in caps1.guests],
+                [(g.os_type, g.arch, len(g.domains)) for g in caps2.guests])
+
+            # Different XML for the same key must not hit the cache
+            caps3 = capabilities.load_capabilities(
+                xml.replace("<arch>i686</arch>", "<arch>x86_64</arch>", 1),
+                "qemu:///system")
+            self.assertNotEquals(caps1.host.cpu.arch, caps3.host.cpu.arch)
+        finally:
+            capabilities._cache_path = origfunc
+            shutil.rmtree(tmpdir)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,256 @@
+# Copyright (C) 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+import os
+import signal
+import socket
+import StringIO
+import sys
+import time
+import types
+import unittest
+
+from virtinst import cliserver
+
+# pylint: disable=W0212
+# Access to protected member, needed to unittest stuff
+
+_TESTENV = "VIRTINST_TEST_CLISERVER"
+
+
+def _dummy_main():
+    """
+    Stand in for a CLI tool, sys.argv[1] picks what it does
+    """
+    from virtinst import cli
+
+    args = sys.argv[1:]
+    action = args[0]
+    if action == "print":
+        print args[1]
+        print >> sys.stderr, "error output"
+    elif action == "exit":
+        return int(args[1])
+    elif action == "sysexit":
+        sys.exit(int(args[1]))
+    elif action == "interrupt":
+        raise KeyboardInterrupt()
+    elif action == "sleep":
+        time.sleep(30)
+    elif action == "read":
+        print "read: %s" % sys.stdin.readline().strip()
+    elif action == "env":
+        print "env: %s" % os.environ.get(args[1])
+    elif action == "state":
+        print cli.force, cli.quiet, cli.doprompt
+        cli.force = True
+        cli.quiet = True
+        cli.doprompt = False
+
+
+def _run_commands(argvs, stdin="", interrupt_after=None, env=None):
+    """
+    Run each of @argvs with _run_client_session, against a single forked
+    worker. Returns a list of (exit status, stdout, stderr). @env maps
+    argv index -> value to set for _TESTENV in the client.
+    """
+    pairs = [socket.socketpair() for ignore in argvs]
+    pid = os.fork()
+    if pid == 0:
+        try:
+            worker = cliserver._Worker(None)
+            tool = types.ModuleType("dummytool")
+            tool.main = _dummy_main
+            worker._tools["virt-xml"] = tool
+            for clientsock, workersock in pairs:
+                clientsock.close()
+                worker._handle_client(workersock)
+        finally:
+            os._exit(0)  # pylint: disable=W0212
+
+    kicker = None
+    if interrupt_after is not None:
+        # Like hitting Ctrl-C in the client's terminal
+        parentpid = os.getpid()
+        kicker = os.fork()
+        if kicker == 0:
+            time.sleep(interrupt_after)
+            os.kill(parentpid, signal.SIGINT)
+            os._exit(0)  # pylint: disable=W0212
+
+    ret = []
+    origstreams = (sys.stdin, sys.stdout, sys.stderr)
+    origenv = os.environ.get(_TESTENV)
+    try:
+        for idx, argv in enumerate(argvs):
+            clientsock, workersock = pairs[idx]
+            workersock.close()
+
+            os.environ.pop(_TESTENV, None)
+            if env and idx in env:
+                os.environ[_TESTENV] = env[idx]
+
+            sys.stdin = StringIO.StringIO(stdin)
+            sys.stdout = StringIO.StringIO()
+            sys.stderr = StringIO.StringIO()
+            status = cliserver._run_client_session(clientsock,
+                                                   "virt-xml", argv)
+            ret.append((status, sys.stdout.getvalue(),
+                        sys.stderr.getvalue()))
+    finally:
+        (sys.stdin, sys.stdout, sys.stderr) = origstreams
+        os.environ.pop(_TESTENV, None)
+        if origenv is not None:
+            os.environ[_TESTENV] = origenv
+        os.waitpid(pid, 0)
+        if kicker:
+            os.waitpid(kicker, 0)
+
+    return ret
+
+
+class _FakeConn(object):
+    def __init__(self, uri):
+        self.uri = uri
+
+    def getLibVersion(self):
+        return 1
+
+    def invalidate_fetch_cache(self):
+        pass
+
+
+class TestCLIServer(unittest.TestCase):
+    """
+    Tests for the virt-cli-server protocol and workers
+    """
+    def _chanpair(self):
+        a, b = socket.socketpair()
+        return cliserver._Channel(a), cliserver._Channel(b)
+
+    def testChannelFraming(self):
+        a, b = self._chanpair()
+        a.send(exit=0)
+        a.send(stream="stdout", data=u"two\nlines \u00e9")
+        self.assertEquals(b.recv(), {"exit": 0})
+        self.assertEquals(b.recv(),
+                          {"stream": "stdout", "data": u"two\nlines \u00e9"})
+
+        a.close()
+        self.assertEquals(b.recv(), None)
+        b.close()
+
+    def testRemoteOutput(self):
+        a, b = self._chanpair()
+        out = cliserver._RemoteOutput(a, "stderr", True)
+        self.assertTrue(out.isatty())
+
+        out.write("")
+        out.write("foo\n")
+        out.writelines(["bar", u"\u00e9"])
+        a.close()
+
+        msgs = []
+        while True:
+            msg = b.recv()
+            if msg is None:
+                break
+            msgs.append(msg)
+        b.close()
+
+        self.assertEquals([m["stream"] for m in msgs], ["stderr"] * 3)
+        self.assertEquals([m["data"] for m in msgs],
+                          ["foo\n", "bar", u"\u00e9"])
+
+    def testRemoteInput(self):
+        a, b = self._chanpair()
+        inp = cliserver._RemoteInput(a, False)
+        self.assertFalse(inp.isatty())
+
+        # Queue the client's answers up front
+        b.send(data=u"first line\n")
+        b.send(data=u"abc")
+        self.assertEquals(inp.readline(), "first line\n")
+        self.assertEquals(inp.read(3), "abc")
+        self.assertEquals(b.recv(), {"stdin": "readline", "size": -1})
+        self.assertEquals(b.recv(), {"stdin": "read", "size": 3})
+
+        # Client went away while the command waits for input
+        b.close()
+        self.assertRaises(IOError, inp.read)
+        a.close()
+
+    def testRoundTrip(self):
+        results = _run_commands([
+            ["print", "hello"],
+            ["exit", "3"],
+            ["sysexit", "4"],
+            ["interrupt"],
+            ["read"],
+        ], stdin="typed input\n")
+
+        self.assertEquals(results[0], (0, "hello\n", "error output\n"))
+        self.assertEquals(results[1][0], 3)
+        self.assertEquals(results[2][0], 4)
+        self.assertEquals(results[3][0], 1)
+        self.assertTrue("Aborted at user request" in results[3][2])
+        self.assertEquals(results[4], (0, "read: typed input\n", ""))
+
+    def testForwardSigint(self):
+        start = time.time()
+        results = _run_commands([["sleep"]], interrupt_after=1)
+        self.assertTrue(time.time() - start < 20)
+        self.assertEquals(results[0][0], 1)
+        self.assertTrue("Aborted at user request" in results[0][2])
+
+    def testStateReset(self):
+        # The first command flips every setting, the second shouldn't
+        # see that
+        results = _run_commands([["state"], ["state"]])
+        self.assertEquals(results[0][1], "False False True\n")
+        self.assertEquals(results[1][1], "False False True\n")
+
+    def testEnvironment(self):
+        results = _run_commands([["env", _TESTENV], ["env", _TESTENV]],
+                                env={0: "client value"})
+        self.assertEquals(results[0][1], "env: client value\n")
+        # Restored after the first command
+        self.assertEquals(results[1][1], "env: None\n")
+
+    def testConnectionCacheURI(self):
+        cache = cliserver._ConnectionCache()
+        opened = []
+        def opencb(uri):
+            opened.append(uri)
+            return _FakeConn(uri)
+
+        origenv = os.environ.get("LIBVIRT_DEFAULT_URI")
+        try:
+            os.environ["LIBVIRT_DEFAULT_URI"] = "test:///default"
+            conn1 = cache.get(None, opencb)
+            self.assertTrue(cache.get(None, opencb) is conn1)
+            self.assertTrue(cache.get("test:///default", opencb) is conn1)
+
+            # A client with a different default gets its own connection
+            os.environ["LIBVIRT_DEFAULT_URI"] = "test:///other"
+            self.assertFalse(cache.get(None, opencb) is conn1)
+        finally:
+            os.environ.pop("LIBVIRT_DEFAULT_URI", None)
+            if origenv is not None:
+                os.environ["LIBVIRT_DEFAULT_URI"] = origenv
+
+        self.assertEquals(opened, [None, None])
@@ -22,6 +22,7 @@ import logging
 from tests import utils
 
 from virtinst import Cloner
+from virtinst import diskbackend
 
 ORIG_NAME  = "clone-orig"
 CLONE_NAME = "clone-new"
@@ -45,7 +46,7 @@ clone_files = []
 
 for tmpf in os.listdir(clonexml_dir):
     black_list = ["managed-storage", "cross-pool", "force", "skip",
-                   "fullpool"]
+                   "fullpool", "linked"]
     if tmpf.endswith("-out.xml"):
         tmpf = tmpf[0:(len(tmpf) - len("-out.xml"))]
         if tmpf not in clone_files and tmpf not in black_list:
@@ -65,7 +66,8 @@ class TestClone(unittest.TestCase):
             os.unlink(f)
 
     def _clone_helper(self, filebase, disks=None, force_list=None,
-                      skip_list=None, compare=True, useconn=None):
+                      skip_list=None, compare=True, useconn=None,
+                      linked=False):
         """Helper for comparing clone input/output from 2 xml files"""
         infile = os.path.join(clonexml_dir, filebase + "-in.xml")
         in_content = utils.read_file(infile)
@@ -76,6 +78,7 @@ class TestClone(unittest.TestCase):
             cloneobj.force_target = force
         for skip in skip_list or []:
             cloneobj.skip_target = skip
+        cloneobj.linked = linked
 
         cloneobj = self._default_clone_values(cloneobj, disks)
 
@@ -191,6 +194,81 @@ class TestClone(unittest.TestCase):
                                   None, "/tmp/clone2.img"],
                            skip_list=["hda", "fdb"])
 
+    def testCloneLinked(self):
+        base = "linked"
+        self._clone_helper(base, ["%s/new1.qcow2" % POOL1], linked=True)
+
+    def _linked_cloner(self, disks):
+        cloneobj = Cloner(conn)
+        cloneobj.original_xml = utils.read_file(
+            os.path.join(clonexml_dir, "linked-in.xml"))
+        cloneobj.linked = True
+        return self._default_clone_values(cloneobj, disks)
+
+    def testCloneLinkedExistingDest(self):
+        cloneobj = self._linked_cloner([FILE1])
+
+        # FILE1 already exists, overlays are never created on top of
+        # existing storage
+        self.assertRaises(RuntimeError, cloneobj.setup)
+
+    def testCloneLinkedBackingFormat(self):
+        cloneobj = self._linked_cloner(["%s/new1.qcow2" % POOL1])
+        cloneobj.setup()
+
+        volxml = cloneobj.clone_disks[0].get_vol_install().get_xml_config()
+        backing = volxml.split("<backingStore>")[1]
+        backing = backing.split("</backingStore>")[0]
+        self.assertTrue("<path>%s</path>" % P1_VOL1 in backing)
+        self.assertTrue('<format type="vmdk"/>' in backing)
+
+    def testCloneLinkedUnmanaged(self):
+        dest = "/tmp/virtinst-test-linked.qcow2"
+        cloneobj = self._linked_cloner([dest])
+        cloneobj.setup()
+
+        disk = cloneobj.clone_disks[0]
+        self.assertEquals(disk.get_vol_install(), None)
+        self.assertEquals(disk.path, dest)
+
+        # Don't actually run qemu-img, just check how it's called
+        cmds = []
+        class _FakeProc(object):
+            returncode = 0
+            def communicate(self):
+                return "", ""
+        def _fake_popen(cmd, **kwargs):
+            ignore = kwargs
+            cmds.append(cmd)
+            return _FakeProc()
+
+        origpopen = diskbackend.subprocess.Popen
+        diskbackend.subprocess.Popen = _fake_popen
+        try:
+            disk.setup()
+        finally:
+            diskbackend.subprocess.Popen = origpopen
+
+        self.assertEquals(cmds, [["qemu-img", "create", "-f", "qcow2",
+                                  "-b", P1_VOL1, "-F", "vmdk", dest]])
+
+    def testCloneLinkedRunning(self):
+        cloneobj = Cloner(conn)
+        cloneobj.original_guest = "test-clone-simple"
+        cloneobj.clone_running = True
+        cloneobj.linked = True
+        cloneobj = self._default_clone_values(cloneobj,
+                                              ["%s/new1.qcow2" % POOL1])
+
+        # The original is running and can write to hda
+        try:
+            cloneobj.setup_original()
+            raise AssertionError("Linked clone of a running domain "
+                                 "succeeded, expected failure.")
+        except RuntimeError, e:
+            self.assertTrue("must be shutoff" in str(e))
+            self.assertTrue("hda" in str(e))
+
     def testCloneFullPool(self):
         base = "fullpool"
         try:
@@ -0,0 +1,149 @@
+# Copyright (C) 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+import unittest
+
+import libvirt
+
+from virtinst import migrator
+from virtinst.migrator import BatchMigrator, MigrationJob
+
+
+def _make_error(code):
+    e = libvirt.libvirtError("fake error %s" % code)
+    e.err = (code, 0, "fake error %s" % code, 2, None, None, None, -1, -1)
+    return e
+
+
+class _FakeDomain(object):
+    """
+    Just enough of virDomain for BatchMigrator. @errors are raised by
+    successive migrate() calls, @cpurate is cputime added per info() call
+    """
+    def __init__(self, name, memory, cpurate=0, errors=None):
+        self._name = name
+        self._memory = memory
+        self._cpurate = cpurate
+        self._cputime = 0
+        self.errors = errors or []
+        self.migrate_calls = 0
+
+    def name(self):
+        return self._name
+
+    def UUIDString(self):
+        return self._name
+
+    def info(self):
+        self._cputime += self._cpurate
+        return [1, self._memory, self._memory, 1, self._cputime]
+
+    def isActive(self):
+        return True
+
+    def isPersistent(self):
+        return True
+
+    def jobInfo(self):
+        return [0] * 12
+
+    def migrate(self, *args):
+        ignore = args
+        self.migrate_calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+class _FakeMeter(object):
+    def start(self, size=None, text=None):
+        ignore = text
+        self.size = size
+
+    def update(self, done):
+        self.done = done
+
+    def end(self, done):
+        self.done = done
+
+
+class TestMigrator(unittest.TestCase):
+    def setUp(self):
+        self._orig_interval = migrator._POLL_INTERVAL
+        migrator._POLL_INTERVAL = 0
+
+    def tearDown(self):
+        migrator._POLL_INTERVAL = self._orig_interval
+
+    def _make_migrator(self, doms):
+        batch = BatchMigrator(None, None)
+        batch.retry_delay = 0
+        for dom in doms:
+            batch.add_domain(dom)
+        return batch
+
+    def testIsTransient(self):
+        self.assertTrue(migrator._is_transient(
+            _make_error(libvirt.VIR_ERR_OPERATION_TIMEOUT)))
+        self.assertFalse(migrator._is_transient(
+            _make_error(libvirt.VIR_ERR_OPERATION_INVALID)))
+        self.assertFalse(migrator._is_transient(RuntimeError("foo")))
+
+    def testOrderJobs(self):
+        # Busy guests count double, so the small busy one goes first
+        batch = self._make_migrator([
+            _FakeDomain("idle-big", 1000),
+            _FakeDomain("busy-small", 600, cpurate=10 ** 15),
+            _FakeDomain("idle-small", 500)])
+        batch.order_jobs(sample_time=0)
+
+        self.assertEquals([job.name for job in batch.jobs],
+                          ["busy-small", "idle-big", "idle-small"])
+        self.assertEquals(batch.jobs[0].busy, 1.0)
+        self.assertEquals(batch.jobs[1].busy, 0.0)
+
+    def testRetries(self):
+        timeout = libvirt.VIR_ERR_OPERATION_TIMEOUT
+        retried = _FakeDomain("retried", 100,
+                              errors=[_make_error(timeout)])
+        gaveup = _FakeDomain("gaveup", 200,
+                             errors=[_make_error(timeout)] * 5)
+        invalid = _FakeDomain("invalid", 300,
+            errors=[_make_error(libvirt.VIR_ERR_OPERATION_INVALID)])
+        batch = self._make_migrator([retried, gaveup, invalid])
+        batch.retries = 2
+
+        meter = _FakeMeter()
+        try:
+            batch.run(meter, sample_time=0)
+            raise AssertionError("Expected exception, but none raised.")
+        except RuntimeError, e:
+            errors = str(e).splitlines()
+
+        # Every failure is reported, not just the first one
+        self.assertEquals(sorted([err.split(":")[0] for err in errors]),
+                          ["gaveup", "invalid"])
+
+        jobs = dict([(job.name, job) for job in batch.jobs])
+        self.assertEquals(jobs["retried"].state, MigrationJob.STATE_DONE)
+        self.assertEquals(retried.migrate_calls, 2)
+        self.assertEquals(jobs["gaveup"].state, MigrationJob.STATE_FAILED)
+        self.assertEquals(gaveup.migrate_calls, 3)
+        self.assertEquals(jobs["invalid"].state, MigrationJob.STATE_FAILED)
+        self.assertEquals(invalid.migrate_calls, 1)
+
+        self.assertEquals(meter.size, 600 * 1024)
+        self.assertEquals(meter.done, 100 * 1024)
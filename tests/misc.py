@@ -16,15 +16,21 @@
 # MA 02110-1301 USA.
 
 import fnmatch
+import hashlib
 import imp
 import importlib
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 _badmodules = ["gi.repository.Gtk", "gi.repository.GObject",
               "gi.repository.Gdk", "gi.repository.GLib"]
 
+# pylint: disable=W0212
+# Access to protected member, needed to unittest stuff
+
 
 def _restore_modules(fn):
     def wrap(*args, **kwargs):
@@ -83,9 +89,178 @@ class TestMisc(unittest.TestCase):
         """
         Make sure virtinst doesn't pull in any gnome modules
         """
-        files = ["virt-install", "virt-clone", "virt-convert", "virt-image"]
+        files = ["virt-install", "virt-clone", "virt-convert", "virt-image",
+                 "virt-cli-server"]
         files += _find_py("virtinst")
         files += _find_py("virtconv")
         files += _find_py("virtcli")
 
         self._check_modules(files)
+
+
+    def test_initrd_inject_cpio(self):
+        """
+        Check the in process cpio writer used for --initrd-inject
+        """
+        from virtinst import initrdinject
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            initrd = os.path.join(tmpdir, "initrd.img")
+            ks = os.path.join(tmpdir, "test.ks")
+            file(initrd, "w").write("FAKE")
+            file(ks, "w").write("install\n")
+
+            initrdinject.perform_injections(initrd, [ks], tmpdir,
+                                            compress=False)
+            data = file(initrd).read()
+            self.assertTrue(data.startswith("FAKE070701"))
+            self.assertTrue("test.ks\0" in data)
+            self.assertTrue("install\n" in data)
+            self.assertTrue(data.endswith("TRAILER!!!\0\0\0\0"))
+
+            # Second run should be served from the cache, which only
+            # holds the archive
+            cachedir = os.path.join(tmpdir, initrdinject._CACHE_DIRNAME)
+            cached = os.listdir(cachedir)
+            self.assertEquals(len(cached), 1)
+            archive = file(os.path.join(cachedir, cached[0])).read()
+            self.assertEquals(data, "FAKE" + archive)
+
+            file(initrd, "w").write("FAKE")
+            initrdinject.perform_injections(initrd, [ks], tmpdir,
+                                            compress=False)
+            self.assertEquals(file(initrd).read(), data)
+
+            # A different initrd reuses the archive, aligned to 4 bytes
+            file(initrd, "w").write("OTHER")
+            initrdinject.perform_injections(initrd, [ks], tmpdir,
+                                            compress=False)
+            self.assertEquals(file(initrd).read(),
+                              "OTHER\0\0\0" + archive)
+            self.assertEquals(os.listdir(cachedir), cached)
+
+            # Changing the injected file builds a new archive
+            file(ks, "w").write("install\nreboot\n")
+            file(initrd, "w").write("FAKE")
+            initrdinject.perform_injections(initrd, [ks], tmpdir,
+                                            compress=False)
+            self.assertTrue("reboot\n" in file(initrd).read())
+            self.assertEquals(len(os.listdir(cachedir)), 2)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+    def test_checksum_compute(self):
+        """
+        Check compute_checksum against hashlib, and pick_checksum order
+        """
+        from virtinst import checksum
+
+        self.assertEquals(checksum.pick_checksum({}), (None, None))
+        self.assertEquals(
+            checksum.pick_checksum({"sha1": "A", "sha256": " B\n"}),
+            ("sha256", "b"))
+        self.assertEquals(
+            checksum.pick_checksum({"sha256": "a", "sha512": "b"}),
+            ("sha512", "b"))
+        self.assertEquals(checksum.pick_checksum({"md5": "a"}),
+                          (None, None))
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "disk.img")
+            content = "disk contents\n" * 1000
+            file(path, "w").write(content)
+            empty = os.path.join(tmpdir, "empty.img")
+            file(empty, "w").write("")
+
+            for csumtype in ["sha256", "sha512"]:
+                self.assertEquals(checksum.compute_checksum(path, csumtype),
+                                  hashlib.new(csumtype, content).hexdigest())
+                self.assertEquals(checksum.compute_checksum(empty, csumtype),
+                                  hashlib.new(csumtype).hexdigest())
+
+            self.assertRaises(ValueError,
+                              checksum.compute_checksum, path, "md5")
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+    def test_checksum_verify(self):
+        """
+        Check the verified cache is invalidated when the file changes,
+        and that verify_checksums reports every failure at once
+        """
+        from virtinst import checksum
+
+        tmpdir = tempfile.mkdtemp()
+        origcachedir = checksum._get_cache_dir
+        checksum._get_cache_dir = lambda: os.path.join(tmpdir, "cache")
+        try:
+            path = os.path.join(tmpdir, "disk.img")
+            file(path, "w").write("good")
+            csums = {"sha256": hashlib.sha256("good").hexdigest()}
+            csumtype, csumvalue = checksum.pick_checksum(csums)
+
+            self.assertFalse(checksum._cache_lookup(path, csumtype,
+                                                    csumvalue))
+            checksum.verify_checksums([(path, csums)])
+            self.assertTrue(checksum._cache_lookup(path, csumtype,
+                                                   csumvalue))
+            self.assertFalse(checksum._cache_lookup(path, csumtype,
+                                                    "0" + csumvalue[1:]))
+
+            # Size change
+            st = os.stat(path)
+            file(path, "a").write("!")
+            os.utime(path, (st.st_atime, st.st_mtime))
+            self.assertFalse(checksum._cache_lookup(path, csumtype,
+                                                    csumvalue))
+
+            # mtime change
+            file(path, "w").write("good")
+            checksum.verify_checksums([(path, csums)])
+            st = os.stat(path)
+            os.utime(path, (st.st_atime, st.st_mtime - 10))
+            self.assertFalse(checksum._cache_lookup(path, csumtype,
+                                                    csumvalue))
+
+            # Inode change, same size and mtime
+            checksum.verify_checksums([(path, csums)])
+            st = os.stat(path)
+            newpath = path + ".new"
+            file(newpath, "w").write("evil")
+            os.utime(newpath, (st.st_atime, st.st_mtime))
+            keep = path + ".keep"
+            os.link(path, keep)
+            os.rename(newpath, path)
+            self.assertNotEquals(os.stat(path).st_ino, st.st_ino)
+            self.assertFalse(checksum._cache_lookup(path, csumtype,
+                                                    csumvalue))
+
+            # Cache isn't consulted when disabled, and the mismatch for
+            # the replaced file is reported along with the other errors
+            bad = os.path.join(tmpdir, "bad.img")
+            file(bad, "w").write("bad")
+            missing = os.path.join(tmpdir, "missing.img")
+            try:
+                checksum.verify_checksums([
+                    (path, csums),
+                    (bad, {"sha512": hashlib.sha512("good").hexdigest()}),
+                    (missing, csums),
+                    (keep, csums),
+                ], use_cache=False)
+                raise AssertionError("Expected ValueError")
+            except ValueError, e:
+                lines = str(e).splitlines()
+            self.assertEquals(len(lines), 3)
+            self.assertTrue([l for l in lines if path in l and
+                             "does not match" in l])
+            self.assertTrue([l for l in lines if bad in l and
+                             "does not match" in l])
+            self.assertTrue([l for l in lines if missing in l and
+                             "Error checking" in l])
+        finally:
+            checksum._get_cache_dir = origcachedir
+            shutil.rmtree(tmpdir)
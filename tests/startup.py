@@ -0,0 +1,89 @@
+# Copyright (C) 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+import imp
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+_topdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that quick CLI invocations and a bare engine import should
+# not need to load
+_virtinst_heavy = ["virtinst.guest", "virtinst.osdict",
+                   "virtinst.capabilities", "virtinst.devicedisk",
+                   "virtinst.storage", "virtinst.nodedev"]
+_virtmanager_heavy = ["virtManager.details", "virtManager.create",
+                      "virtManager.host", "virtManager.clone",
+                      "virtManager.migrate", "virtManager.preferences"]
+
+
+def have_gi():
+    try:
+        imp.find_module("gi")
+        return True
+    except ImportError:
+        return False
+
+
+def run_python(args):
+    """
+    Run @args with the test python from the top of the source tree,
+    return (seconds, output)
+    """
+    start = time.time()
+    proc = subprocess.Popen([sys.executable] + args, cwd=_topdir,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT)
+    output = proc.communicate()[0]
+    elapsed = time.time() - start
+    if proc.returncode != 0:
+        raise AssertionError("%s failed with exit code %s:\n%s" %
+                             (args, proc.returncode, output))
+    return elapsed, output
+
+
+def _loaded_modules(code, prefix):
+    output = run_python(["-c", code + "\n"
+        "import sys\n"
+        "print ' '.join([m for m in sys.modules if sys.modules[m]])\n"])[1]
+    lastline = output.strip().splitlines()[-1]
+    return [m for m in lastline.split() if m.startswith(prefix)]
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Make sure CLI tool and virt-manager startup doesn't pull in modules
+    it has no use for. Timings are checked by tests/test_startup.py,
+    which isn't part of the default suite.
+    """
+    def testVirtinstImportIsLazy(self):
+        loaded = _loaded_modules("import virtinst\nimport virtinst.cli",
+                                 "virtinst.")
+        found = [m for m in _virtinst_heavy if m in loaded]
+        self.assertEquals(found, [])
+
+    def testEngineImportIsLazy(self):
+        if not have_gi():
+            return
+
+        code = "import virtinst\nimport virtManager.engine"
+        loaded = _loaded_modules(code, "virtManager.")
+        found = [m for m in _virtmanager_heavy if m in loaded]
+        self.assertEquals(found, [])
@@ -19,6 +19,7 @@ import os
 import unittest
 
 from virtinst import StoragePool, StorageVolume
+from virtinst import cli
 
 from tests import utils
 
@@ -146,6 +147,19 @@ class TestStorage(unittest.TestCase):
         createVol(self.conn, poolobj,
                   volname=invol.name() + "clone", clone_vol=invol)
 
+    def testVolumeCacheLookup(self):
+        # Use a connection without the test suite fetch caching
+        conn = cli.getConnection("test:///default")
+        poolobj = createPool(conn, StoragePool.TYPE_DIR, "pool-dir")
+        self.assertEquals(conn.fetch_all_vols(), [])
+
+        # New volumes should be picked up by the incremental cache
+        vol = createVol(conn, poolobj)
+        vols = conn.fetch_vols_by_path(vol.path())
+        self.assertEquals([v.name for v in vols], [vol.name()])
+        self.assertEquals(conn.fetch_vols_by_backing_store(vol.path()), [])
+        self.assertEquals(conn.fetch_backing_store_index(), {})
+
     def testFSPool(self):
         poolobj = createPool(self.conn,
                              StoragePool.TYPE_FS, "pool-fs")
@@ -0,0 +1,65 @@
+# Copyright (C) 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+"""
+Startup time checks, run with 'python setup.py test_startup'. These are
+wall clock measurements, so they stay out of the default suite.
+"""
+
+import unittest
+
+from tests.startup import have_gi, run_python
+
+# How much slower than a bare interpreter startup, measured in the same
+# run, the commands may be. Best of several runs, in seconds.
+_RUNS = 3
+_CLI_OVERHEAD = 1.0
+_ENGINE_OVERHEAD = 2.0
+
+
+def _best_time(args):
+    return min([run_python(args)[0] for ignore in range(_RUNS)])
+
+
+class TestStartupTime(unittest.TestCase):
+    """
+    Make sure CLI tool and virt-manager startup stays cheap
+    """
+    baseline = None
+
+    def _check_overhead(self, args, overhead):
+        if TestStartupTime.baseline is None:
+            TestStartupTime.baseline = _best_time(["-c", "pass"])
+
+        elapsed = _best_time(args) - TestStartupTime.baseline
+        self.assertTrue(elapsed <= overhead,
+            "'%s' took %.2fs longer than python startup, allowed %.2fs" %
+            (" ".join(args), elapsed, overhead))
+
+    def testVirtInstallVersion(self):
+        self._check_overhead(["virt-install", "--version"], _CLI_OVERHEAD)
+
+    def testVirtXMLHelp(self):
+        self._check_overhead(["virt-xml", "--help"], _CLI_OVERHEAD)
+
+    def testEngineImport(self):
+        if not have_gi():
+            return
+
+        self._check_overhead(
+            ["-c", "import virtinst\nimport virtManager.engine"],
+            _ENGINE_OVERHEAD)
@@ -17,8 +17,14 @@
 
 import unittest
 import virtconv
+import virtconv.diskcfg
 import os
 import glob
+import hashlib
+import shutil
+import StringIO
+import tarfile
+import tempfile
 from tests import utils
 
 BASE = "tests/virtconv-files"
@@ -121,3 +127,80 @@ class TestVirtConv(unittest.TestCase):
         in_dir = out_dir = virtimage_output
 
         self._compare_files(base, in_type, out_type, in_dir, out_dir)
+
+    def testConvertDisksCopy(self):
+        """
+        Copies without conversion are sparse, and run through the
+        parallel conversion pool
+        """
+        tmpdir = tempfile.mkdtemp(prefix="virtconv-test")
+        try:
+            indir = os.path.join(tmpdir, "in")
+            outdir = os.path.join(tmpdir, "out")
+            os.mkdir(indir)
+
+            blocksize = 1024 * 1024
+            disks = []
+            for name in ["disk1.raw", "disk2.raw"]:
+                f = open(os.path.join(indir, name), "wb")
+                f.write("x" * 512)
+                f.seek(4 * blocksize)
+                f.write("y" * 512)
+                f.close()
+                disks.append(virtconv.diskcfg.disk(name,
+                    virtconv.diskcfg.DISK_FORMAT_RAW))
+
+            virtconv.diskcfg.convert_disks(disks, indir, outdir, "none",
+                                           max_workers=2)
+
+            for name in ["disk1.raw", "disk2.raw"]:
+                inpath = os.path.join(indir, name)
+                outpath = os.path.join(outdir, name)
+                self.assertEquals(open(inpath).read(), open(outpath).read())
+                self.assertTrue(os.stat(outpath).st_blocks * 512 <
+                                os.path.getsize(outpath))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def testConvertDisksOVA(self):
+        """
+        Disks are streamed out of an OVA and checked against the manifest
+        """
+        tmpdir = tempfile.mkdtemp(prefix="virtconv-test")
+        try:
+            outdir = os.path.join(tmpdir, "out")
+            ova = os.path.join(tmpdir, "test.ova")
+            data = "x" * 512 + "\0" * (4 * 1024 * 1024) + "y" * 512
+
+            tar = tarfile.open(ova, "w")
+            info = tarfile.TarInfo("disk1.raw")
+            info.size = len(data)
+            tar.addfile(info, StringIO.StringIO(data))
+            tar.close()
+
+            def _make_disk(csum):
+                d = virtconv.diskcfg.disk("disk1.raw",
+                                          virtconv.diskcfg.DISK_FORMAT_RAW)
+                d.archive = ova
+                d.archive_size = len(data)
+                d.csum_dict = {"sha1": csum}
+                return d
+
+            d = _make_disk(hashlib.sha1(data).hexdigest())
+            virtconv.diskcfg.convert_disks([d], tmpdir, outdir, "none")
+            outpath = os.path.join(outdir, "disk1.raw")
+            self.assertEquals(open(outpath).read(), data)
+            self.assertTrue(os.stat(outpath).st_blocks * 512 <
+                            os.path.getsize(outpath))
+
+            d = _make_disk("0" * 40)
+            self.assertRaises(RuntimeError, virtconv.diskcfg.convert_disks,
+                              [d], tmpdir, outdir + "2", "none")
+
+            # A disk missing from the archive is an error too
+            d = _make_disk(hashlib.sha1(data).hexdigest())
+            d.path = "missing.raw"
+            self.assertRaises(RuntimeError, virtconv.diskcfg.convert_disks,
+                              [d], tmpdir, outdir + "3", "none")
+        finally:
+            shutil.rmtree(tmpdir)
@@ -71,6 +71,7 @@ class vmmAddHardware(vmmGObjectUI):
         self.fs_units = "mb"
 
         self._dev = None
+        self._hostdev_refresh_pending = False
 
         self.builder.connect_signals({
             "on_create_cancel_clicked" : self.close,
@@ -109,6 +110,13 @@ class vmmAddHardware(vmmGObjectUI):
 
         self.set_initial_state()
 
+        # Node devices are loaded on demand, so the host device list
+        # may be filled in after the page is shown
+        self._conn_signals = [
+            self.conn.connect("nodedev-added", self._nodedevs_changed),
+            self.conn.connect("nodedev-removed", self._nodedevs_changed),
+        ]
+
     def show(self, parent):
         logging.debug("Showing addhw")
         self.reset_state()
@@ -127,6 +135,10 @@ class vmmAddHardware(vmmGObjectUI):
         return 1
 
     def _cleanup(self):
+        for handle in self._conn_signals:
+            self.conn.disconnect(handle)
+        self._conn_signals = []
+
         self.vm = None
         self.conn = None
         self._dev = None
@@ -881,6 +893,22 @@ class vmmAddHardware(vmmGObjectUI):
         model.append([_("Spice server"), "spice"])
         model.append([_("VNC server"), "vnc"])
 
+    def _nodedevs_changed(self, conn_ignore, name_ignore):
+        if self._hostdev_refresh_pending:
+            return
+        self._hostdev_refresh_pending = True
+        self.idle_add(self._refresh_host_device_model)
+
+    def _refresh_host_device_model(self):
+        self._hostdev_refresh_pending = False
+        if (not self.conn or not self.is_visible() or
+            self.widget("create-pages").get_current_page() != PAGE_HOSTDEV):
+            return
+
+        (ignore, devtype, devcap,
+         subtype, subcap) = self.get_config_host_device_type_info()
+        self.populate_host_device_model(devtype, devcap, subtype, subcap)
+
     def populate_host_device_model(self, devtype, devcap, subtype, subcap):
         devlist = self.widget("host-device")
         model = devlist.get_model()
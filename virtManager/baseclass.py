@@ -21,9 +21,11 @@
 import logging
 import os
 import sys
+import time
 import traceback
 
 from virtManager import config
+from virtManager import module_trace
 
 # pylint: disable=E0611
 from gi.repository import Gdk
@@ -33,6 +35,14 @@ from gi.repository import Gtk
 # pylint: enable=E0611
 
 
+def _callback_name(func):
+    obj = getattr(func, "im_self", None)
+    name = getattr(func, "__name__", str(func))
+    if obj is not None:
+        name = "%s.%s" % (obj.__class__.__name__, name)
+    return name
+
+
 class vmmGObject(GObject.GObject):
     _leak_check = True
 
@@ -41,12 +51,22 @@ class vmmGObject(GObject.GObject):
         """
         Make sure idle functions are run thread safe
         """
+        profiler = module_trace.profiler
         def cb():
+            if profiler:
+                profiler.idle_dequeued()
+                start = time.time()
             try:
                 return func(*args, **kwargs)
             except:
                 print traceback.format_exc()
+            finally:
+                if profiler:
+                    profiler.record_mainloop(_callback_name(func),
+                                             time.time() - start)
             return False
+        if profiler:
+            profiler.idle_queued()
         return GLib.idle_add(cb)
 
     def __init__(self):
@@ -151,6 +171,7 @@ class vmmGObject(GObject.GObject):
         def emitwrap(_s, *_a):
             self.emit(_s, *_a)
             return False
+        emitwrap.__name__ = "%s.emit(%s)" % (self.__class__.__name__, signal)
 
         self.idle_add(emitwrap, signal, *args)
 
@@ -158,11 +179,18 @@ class vmmGObject(GObject.GObject):
         """
         Make sure timeout functions are run thread safe
         """
+        profiler = module_trace.profiler
         def cb():
+            if profiler:
+                start = time.time()
             try:
                 return func(*args)
             except:
                 print traceback.format_exc()
+            finally:
+                if profiler:
+                    profiler.record_mainloop(_callback_name(func),
+                                             time.time() - start)
             return False
         ret = GLib.timeout_add(timeout, cb)
         self.add_gobject_timeout(ret)
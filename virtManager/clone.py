@@ -149,6 +149,7 @@ class vmmCloneVM(vmmGObjectUI):
             "on_clone_delete_event" : self.close,
             "on_clone_cancel_clicked" : self.close,
             "on_clone_ok_clicked" : self.finish,
+            "on_clone_linked_toggled" : self.linked_toggled,
 
             # Change mac dialog
             "on_vmm_change_mac_delete_event": self.change_mac_close,
@@ -226,6 +227,7 @@ class vmmCloneVM(vmmGObjectUI):
     # Populate state
     def reset_state(self):
         self.widget("clone-cancel").grab_focus()
+        self.widget("clone-linked").set_active(False)
 
         # Populate default clone values
         self.setup_clone_info()
@@ -251,6 +253,7 @@ class vmmCloneVM(vmmGObjectUI):
         if not new_name:
             new_name = design.generate_clone_name()
         design.clone_name = new_name
+        design.linked = self.widget("clone-linked").get_active()
 
         # Erase any clone_policy from the original design, so that we
         # get the entire device list.
@@ -595,6 +598,23 @@ class vmmCloneVM(vmmGObjectUI):
 
         self.change_mac.show_all()
 
+    def linked_toggled(self, src):
+        if not self.clone_design:
+            return
+        self.clone_design.linked = src.get_active()
+
+        # Linked clone paths get a different suffix
+        for row in self.storage_list.values():
+            if (row[STORAGE_INFO_MANUAL_PATH] or
+                not row[STORAGE_INFO_CAN_CLONE]):
+                continue
+            try:
+                row[STORAGE_INFO_NEW_PATH] = self.generate_clone_path_name(
+                    row[STORAGE_INFO_ORIG_PATH])
+            except Exception, e:
+                logging.debug("Generating linked clone path failed: %s", e)
+        self.populate_storage_lists()
+
     def storage_combo_changed(self, src, target):
         idx = src.get_active()
         row = self.storage_list[target]
@@ -386,6 +386,31 @@ class vmmConfig(object):
     def set_auto_redirection(self, state):
         self.conf.set("/console/auto-redirect", state)
 
+    # Guest inspection
+    def get_inspection_workers(self):
+        return self.conf.get("/inspection/workers")
+    def get_inspection_nice(self):
+        return self.conf.get("/inspection/nice")
+
+    # Screenshot thumbnails
+    def get_thumbnail_interval(self):
+        return self.conf.get("/thumbnails/interval")
+    def get_thumbnail_workers(self):
+        return self.conf.get("/thumbnails/workers")
+    def get_thumbnail_host_streams(self):
+        return self.conf.get("/thumbnails/host-streams")
+    def get_thumbnail_bandwidth(self):
+        return self.conf.get("/thumbnails/bandwidth")
+    def get_thumbnail_size(self):
+        return self.conf.get("/thumbnails/size")
+
+    def get_console_log_serial(self):
+        return self.conf.get("/console/log-serial")
+    def set_console_log_serial(self, state):
+        self.conf.set("/console/log-serial", state)
+    def get_console_ssh_persist(self):
+        return self.conf.get("/console/ssh-persist")
+
     # Show VM details toolbar
     def get_details_show_toolbar(self):
         res = self.conf.get("/details/show-toolbar")
@@ -527,6 +552,9 @@ class vmmConfig(object):
         self.conf.set("/manager-window-height", h)
 
     # URI autoconnect
+    def get_conn_max_parallel_open(self):
+        return max(1, self.conf.get("/connections/max-parallel-open"))
+
     def get_conn_autoconnect(self, uri):
         uris = self.conf.get("/connections/autoconnect")
         return ((uris is not None) and (uri in uris))
@@ -36,10 +36,12 @@ from virtinst import pollhelpers
 from virtinst import util
 
 from virtManager import connectauth
+from virtManager import module_trace
 from virtManager.baseclass import vmmGObject
 from virtManager.domain import vmmDomain
 from virtManager.interface import vmmInterface
-from virtManager.mediadev import vmmMediaDevice
+from virtManager.jobmonitor import vmmJobMonitor
+from virtManager.mediadev import vmmMediaDevice, MEDIA_CDROM
 from virtManager.netdev import vmmNetDevice
 from virtManager.network import vmmNetwork
 from virtManager.nodedev import vmmNodeDevice
@@ -58,6 +60,7 @@ class vmmConnection(vmmGObject):
         "pool-removed": (GObject.SignalFlags.RUN_FIRST, None, [str]),
         "pool-started": (GObject.SignalFlags.RUN_FIRST, None, [str]),
         "pool-stopped": (GObject.SignalFlags.RUN_FIRST, None, [str]),
+        "pool-refreshed": (GObject.SignalFlags.RUN_FIRST, None, [str]),
         "interface-added": (GObject.SignalFlags.RUN_FIRST, None, [str]),
         "interface-removed": (GObject.SignalFlags.RUN_FIRST, None, [str]),
         "interface-started": (GObject.SignalFlags.RUN_FIRST, None, [str]),
@@ -78,6 +81,14 @@ class vmmConnection(vmmGObject):
     STATE_ACTIVE = 2
     STATE_INACTIVE = 3
 
+    # Stats polling setting: (config getter, vmmDomain callback)
+    _STATS_POLL_SETTINGS = {
+        "net": ("get_stats_enable_net_poll",
+                "toggle_sample_network_traffic"),
+        "disk": ("get_stats_enable_disk_poll", "toggle_sample_disk_io"),
+        "mem": ("get_stats_enable_memory_poll", "toggle_sample_mem_stats"),
+    }
+
     def __init__(self, uri):
         vmmGObject.__init__(self)
 
@@ -100,8 +111,16 @@ class vmmConnection(vmmGObject):
 
         self._xml_flags = {}
 
-        # Physical network interfaces: name -> virtinst.NodeDevice
+        # Node devices we have loaded: name -> vmmNodeDevice
         self.nodedevs = {}
+        # Capability types loaded so far -> set of nodedev names. Only
+        # the types something asked for are listed, None means all.
+        self._nodedev_types = {}
+        # Pending (name, event) nodedev lifecycle events, and our event
+        # callback ID. Without events, loaded types are re-listed on
+        # every nodedev poll.
+        self._nodedev_events = []
+        self._nodedev_event_id = None
         # Physical network interfaces: name (eth0) -> vmmNetDevice
         self.netdevs = {}
         # Physical media devices: vmmMediaDevice.key -> vmmMediaDevice
@@ -118,6 +137,15 @@ class vmmConnection(vmmGObject):
         self.record = []
         self.hostinfo = None
 
+        # Lookup indexes, updated as objects come and go in tick()
+        self._net_name_index = {}
+        self._pool_name_index = {}
+        self._pool_path_index = {}
+        # Volume target path -> vmmStorageVolume, and the volume
+        # generation of every pool that index was built from
+        self._vol_path_index = {}
+        self._vol_index_gens = {}
+
         self.netdev_initialized = False
         self.netdev_error = ""
         self.netdev_use_libvirt = False
@@ -126,7 +154,27 @@ class vmmConnection(vmmGObject):
         self.mediadev_error = ""
         self.mediadev_use_libvirt = False
 
+        # Stats polling settings, shared by all our VMs
+        self._stats_poll = {}
+
+        # Serializes tick()
+        self._tick_lock = threading.RLock()
+        # Object types (tick() poll* args) we have polled at least once,
+        # and the on demand loads we've asked the tick thread for
+        self._polled = set()
+        self._poll_requested = set()
+        # Remaining staged initial load ticks, and their start time
+        self._load_stages = []
+        self._open_start = None
+
+        # Progress poller shared by all our VMs' save/migrate jobs
+        self._job_monitor = None
+        # Limits concurrent virDomainScreenshot streams to this host
+        self._screenshot_sem = threading.Semaphore(
+            max(1, self.config.get_thumbnail_host_streams()))
+
         self._init_virtconn()
+        self._init_stats_poll()
 
 
     @staticmethod
@@ -182,6 +230,32 @@ class vmmConnection(vmmGObject):
         self._backend.cb_clear_cache = clear_cache
 
 
+    def _init_stats_poll(self):
+        """
+        Listen for stats polling setting changes once for the connection,
+        rather than once per VM, and pass them on to every VM
+        """
+        for name in self._STATS_POLL_SETTINGS:
+            self._stats_poll_changed(name, notify=False)
+
+        self.add_gconf_handle(self.config.on_stats_enable_net_poll_changed(
+            self._stats_poll_changed, "net"))
+        self.add_gconf_handle(self.config.on_stats_enable_disk_poll_changed(
+            self._stats_poll_changed, "disk"))
+        self.add_gconf_handle(self.config.on_stats_enable_memory_poll_changed(
+            self._stats_poll_changed, "mem"))
+
+    def _stats_poll_changed(self, name, notify=True):
+        getter, vm_cb = self._STATS_POLL_SETTINGS[name]
+        self._stats_poll[name] = getattr(self.config, getter)()
+        if not notify:
+            return
+        for vm in self.vms.values():
+            getattr(vm, vm_cb)()
+
+    def get_stats_poll_enabled(self, name):
+        return self._stats_poll[name]
+
     def _init_netdev(self):
         """
         Determine how we will be polling for net devices (HAL or libvirt)
@@ -209,8 +283,14 @@ class vmmConnection(vmmGObject):
     def _init_mediadev(self):
         if self.is_nodedev_capable():
             try:
-                self.connect("nodedev-added", self._nodedev_mediadev_added)
-                self.connect("nodedev-removed", self._nodedev_mediadev_removed)
+                # Don't use our connect() override, which would force
+                # node devices to be loaded right away
+                vmmGObject.connect(self, "nodedev-added",
+                                   self._nodedev_mediadev_added)
+                vmmGObject.connect(self, "nodedev-removed",
+                                   self._nodedev_mediadev_removed)
+                for name in self._nodedev_types.get("storage", []):
+                    self._nodedev_mediadev_added(None, name)
                 self.mediadev_use_libvirt = True
             except Exception, e:
                 self.mediadev_error = _("Could not build media "
@@ -278,11 +358,14 @@ class vmmConnection(vmmGObject):
             for uuid in self.vms.keys():
                 self.emit("vm-added", uuid)
         elif name == "mediadev-added":
+            self._ensure_nodedev_type("storage")
             for dev in self.mediadevs.values():
                 self.emit("mediadev-added", dev)
         elif name == "nodedev-added":
             for key in self.nodedevs.keys():
                 self.emit("nodedev-added", key)
+        elif name == "interface-added":
+            self._ensure_polled(polliface=True)
 
         return handle_id
 
@@ -463,6 +546,14 @@ class vmmConnection(vmmGObject):
                          _supportname.startswith("SUPPORT_")]:
         locals()[_supportname] = getattr(virtinst.VirtualConnection,
                                          _supportname)
+    def get_screenshot_semaphore(self):
+        return self._screenshot_sem
+
+    def get_job_monitor(self):
+        if not self._job_monitor:
+            self._job_monitor = vmmJobMonitor(self)
+        return self._job_monitor
+
     def check_support(self, *args):
         return self._backend.check_support(*args)
 
@@ -626,6 +717,7 @@ class vmmConnection(vmmGObject):
     #################################
 
     def _build_libvirt_netdev_list(self):
+        self._ensure_polled(polliface=True)
         bridges = []
         netdev_list = {}
 
@@ -681,13 +773,30 @@ class vmmConnection(vmmGObject):
     def get_pool(self, uuid):
         return self.pools[uuid]
     def get_interface(self, name):
+        self._ensure_polled(polliface=True)
         return self.interfaces[name]
     def get_nodedev(self, name):
         return self.nodedevs[name]
     def get_nodedevs(self, devtype=None, devcap=None):
+        """
+        Return parsed NodeDevice objects with capability @devtype. The
+        first request for a type lists just those devices, and their
+        XML is only parsed here, when somebody actually wants them.
+        """
+        self._ensure_nodedev_type(devtype)
         retdevs = []
-        for dev in self.nodedevs.values():
+        if devtype:
+            devs = [self.nodedevs[name] for name in
+                    self._nodedev_types.get(devtype, [])
+                    if name in self.nodedevs]
+        else:
+            devs = self.nodedevs.values()
+
+        for dev in devs:
             xmlobj = dev.get_xmlobj()
+
+            # Listing by capability also returns devices that merely
+            # have @devtype as a secondary capability
             if devtype and xmlobj.device_type != devtype:
                 continue
 
@@ -725,36 +834,73 @@ class vmmConnection(vmmGObject):
         return count
 
     def get_net_by_name(self, name):
-        for net in self.nets.values():
-            if net.get_name() == name:
-                return net
+        return self._net_name_index.get(name)
 
     def get_pool_by_path(self, path):
-        for pool in self.pools.values():
-            if pool.get_target_path() == path:
-                return pool
-        return None
+        return self._pool_path_index.get(path)
 
     def get_pool_by_name(self, name):
-        for p in self.pools.values():
-            if p.get_name() == name:
-                return p
-        return None
+        return self._pool_name_index.get(name)
     def get_default_pool(self):
         return self.get_pool_by_name("default")
 
     def get_vol_by_path(self, path):
+        """
+        Look up a volume from the pools' cached volume lists. This never
+        lists volumes itself, the lists are kept up to date by pool refresh.
+        """
+        self._sync_vol_index()
+        return self._vol_path_index.get(path)
+
+
+    #################
+    # Index helpers #
+    #################
+
+    def _rebuild_net_index(self, *ignore):
+        index = {}
+        for net in self.nets.values():
+            index[net.get_name()] = net
+        self._net_name_index = index
+
+    def _rebuild_pool_index(self, *ignore):
+        names = {}
+        paths = {}
         for pool in self.pools.values():
-            for vol in pool.get_volumes().values():
-                if vol.get_target_path() == path:
-                    return vol
-        return None
+            names[pool.get_name()] = pool
+            paths.setdefault(pool.get_target_path(), pool)
+        self._pool_name_index = names
+        self._pool_path_index = paths
+
+    def _sync_vol_index(self):
+        gens = dict([(uuid, pool.get_volumes_generation())
+                     for uuid, pool in self.pools.items()])
+        if gens == self._vol_index_gens:
+            return
+
+        index = {}
+        for pool in self.pools.values():
+            for vol in pool.get_volumes(refresh=False).values():
+                path = vol.get_target_path()
+                if path:
+                    index.setdefault(path, vol)
+        self._vol_path_index = index
+        self._vol_index_gens = gens
+
+    def _clear_indexes(self):
+        self._net_name_index = {}
+        self._pool_name_index = {}
+        self._pool_path_index = {}
+        self._vol_path_index = {}
+        self._vol_index_gens = {}
 
     def list_vm_uuids(self):
         return self.vms.keys()
     def list_net_uuids(self):
         return self.nets.keys()
     def list_net_device_paths(self):
+        if not self.netdev_initialized:
+            self._init_netdev()
         # Update netdev list
         if self.netdev_use_libvirt:
             self.netdevs = self._build_libvirt_netdev_list()
@@ -762,6 +908,7 @@ class vmmConnection(vmmGObject):
     def list_pool_uuids(self):
         return self.pools.keys()
     def list_interface_names(self):
+        self._ensure_polled(polliface=True)
         return self.interfaces.keys()
 
 
@@ -832,6 +979,8 @@ class vmmConnection(vmmGObject):
     def _nodedev_mediadev_added(self, ignore1, name):
         if name in self.mediadevs:
             return
+        if name not in self._nodedev_types.get("storage", []):
+            return
 
         vobj = self.get_nodedev(name)
         mediadev = vmmMediaDevice.mediadev_from_nodedev(vobj)
@@ -867,8 +1016,14 @@ class vmmConnection(vmmGObject):
         self._backend.close()
         self.record = []
 
+        if self._job_monitor:
+            self._job_monitor.cleanup()
+            self._job_monitor = None
+
+        self._deregister_nodedev_events()
         cleanup(self.nodedevs)
         self.nodedevs = {}
+        self._nodedev_types = {}
 
         cleanup(self.netdevs)
         self.netdevs = {}
@@ -888,6 +1043,10 @@ class vmmConnection(vmmGObject):
         cleanup(self.vms)
         self.vms = {}
 
+        self._polled = set()
+        self._poll_requested = set()
+        self._load_stages = []
+        self._clear_indexes()
         self._change_state(self.STATE_DISCONNECTED)
 
     def _cleanup(self):
@@ -925,6 +1084,7 @@ class vmmConnection(vmmGObject):
 
     def _open_thread(self):
         logging.debug("Background 'open connection' thread is running")
+        self._open_start = time.time()
 
         while True:
             libexc = None
@@ -992,10 +1152,19 @@ class vmmConnection(vmmGObject):
             logging.debug("conn version=%s", self._backend.conn_version())
             logging.debug("%s capabilities:\n%s",
                           self.get_uri(), self.caps.xml)
-            self.schedule_priority_tick(stats_update=True,
-                                        pollvm=True, pollnet=True,
-                                        pollpool=True, polliface=True,
-                                        pollnodedev=True, pollmedia=True)
+            logging.debug("%s: connection opened in %.2fs",
+                          self.get_uri(), time.time() - self._open_start)
+
+            self._register_nodedev_events()
+
+            # Load the VM list first, so the manager is usable as soon as
+            # possible, then storage and networks. Interfaces and node
+            # devices are only loaded when something asks for them.
+            self._load_stages = [
+                ("vms", {"stats_update": True, "pollvm": True}),
+                ("pools and networks", {"pollnet": True, "pollpool": True}),
+            ]
+            self._schedule_load_stage()
 
         if self.state == self.STATE_DISCONNECTED:
             if self.connectError:
@@ -1027,10 +1196,128 @@ class vmmConnection(vmmGObject):
                     (lambda obj, key: vmmInterface(self, obj, key)))
 
     def _update_nodedevs(self, dopoll):
+        """
+        Refresh the nodedev cache. @dopoll is True to refresh every type
+        loaded so far, or a list of capability types to load. With
+        lifecycle events, loaded types are only updated from the events.
+
+        Returns (gone, new, current, typemap)
+        """
+        current = self.nodedevs.copy()
+        typemap = dict([(devtype, names.copy()) for devtype, names in
+                        self._nodedev_types.items()])
+        gone = {}
+        new = {}
         if not dopoll or not self.is_nodedev_capable():
-            return {}, {}, self.nodedevs
-        return pollhelpers.fetch_nodedevs(self._backend, self.nodedevs.copy(),
-                    (lambda obj, key: vmmNodeDevice(self, obj, key)))
+            return gone, new, current, typemap
+
+        if dopoll is True:
+            devtypes = typemap.keys()
+            if self._nodedev_event_id is not None:
+                devtypes = []
+        else:
+            devtypes = dopoll
+
+        for devtype in devtypes:
+            try:
+                found = pollhelpers.list_nodedevs(self._backend, devtype)
+            except Exception, e:
+                logging.debug("Unable to list %s node devices: %s",
+                              devtype or "all", e)
+                continue
+
+            for name, backend in found.items():
+                if name in current:
+                    continue
+                try:
+                    if backend is None:
+                        backend = self._backend.nodeDeviceLookupByName(name)
+                except libvirt.libvirtError, e:
+                    logging.debug("Unable to look up nodedev %s: %s",
+                                  name, e)
+                    continue
+                current[name] = vmmNodeDevice(self, backend, name)
+                new[name] = current[name]
+            typemap[devtype] = set(found.keys())
+
+        self._apply_nodedev_events(current, typemap, new)
+
+        # Drop devices that no loaded type lists anymore
+        alive = set()
+        for names in typemap.values():
+            alive.update(names)
+        for name in current.keys():
+            if name not in alive:
+                gone[name] = current.pop(name)
+
+        return gone, new, current, typemap
+
+    def _apply_nodedev_events(self, current, typemap, new):
+        while self._nodedev_events:
+            name, event = self._nodedev_events.pop(0)
+
+            if event == libvirt.VIR_NODE_DEVICE_EVENT_DELETED:
+                for names in typemap.values():
+                    names.discard(name)
+                continue
+            if (event != libvirt.VIR_NODE_DEVICE_EVENT_CREATED or
+                name in current):
+                continue
+
+            try:
+                backend = self._backend.nodeDeviceLookupByName(name)
+                obj = vmmNodeDevice(self, backend, name)
+                devtype = obj.get_xmlobj().device_type
+            except:
+                logging.debug("Error fetching new nodedev %s", name,
+                              exc_info=True)
+                continue
+
+            # Types nobody asked for yet will be listed when they are
+            if devtype in typemap:
+                typemap[devtype].add(name)
+            elif None not in typemap:
+                continue
+            if None in typemap:
+                typemap[None].add(name)
+            current[name] = obj
+            new[name] = obj
+
+    def _nodedev_event_cb(self, conn, dev, event, detail, opaque):
+        ignore = conn
+        ignore = detail
+        ignore = opaque
+        # Called from the libvirt event loop thread, let the tick thread
+        # do the actual work
+        self._nodedev_events.append((dev.name(), event))
+        self.schedule_priority_tick(pollnodedev=True)
+
+    def _register_nodedev_events(self):
+        if (not self.is_nodedev_capable() or
+            not self.check_support(
+                self._backend.SUPPORT_CONN_NODEDEV_EVENTS)):
+            return
+
+        try:
+            self._nodedev_event_id = (
+                self._backend.nodeDeviceEventRegisterAny(None,
+                    libvirt.VIR_NODE_DEVICE_EVENT_ID_LIFECYCLE,
+                    self._nodedev_event_cb, None))
+            logging.debug("%s: using nodedev lifecycle events",
+                          self.get_uri())
+        except Exception, e:
+            logging.debug("Unable to register nodedev events: %s", e)
+
+    def _deregister_nodedev_events(self):
+        self._nodedev_events = []
+        if self._nodedev_event_id is None:
+            return
+
+        try:
+            self._backend.nodeDeviceEventDeregisterAny(self._nodedev_event_id)
+        except Exception, e:
+            logging.debug("Error deregistering nodedev events: %s", e)
+        self._nodedev_event_id = None
 
     def _update_vms(self, dopoll):
         if not dopoll:
@@ -1038,6 +1325,83 @@ class vmmConnection(vmmGObject):
         return pollhelpers.fetch_vms(self._backend, self.vms.copy(),
                     (lambda obj, key: vmmDomain(self, obj, key)))
 
+    def _init_vm_status(self, vms):
+        """
+        Fill in the state of many new VMs with one getAllDomainStats call,
+        rather than an info() call per VM. VMs we miss fetch their state
+        on first use. Returns the UUIDs of the VMs that were filled in.
+        """
+        ret = set()
+        if not self.check_support(
+            self._backend.SUPPORT_CONN_GETALLDOMAINSTATS):
+            return ret
+
+        try:
+            stats = self._backend.getAllDomainStats(
+                libvirt.VIR_DOMAIN_STATS_STATE)
+        except Exception, e:
+            logging.debug("Error fetching bulk domain state: %s", e)
+            return ret
+
+        for backend, statdict in stats:
+            uuid = backend.UUIDString()
+            if uuid in vms and "state.state" in statdict:
+                vms[uuid].init_status(statdict["state.state"])
+                ret.add(uuid)
+        return ret
+
+
+    def _schedule_load_stage(self):
+        if not self._load_stages:
+            return
+        name, kwargs = self._load_stages[0]
+        kwargs = kwargs.copy()
+        kwargs["load_stage"] = name
+        self.schedule_priority_tick(**kwargs)
+
+    def _finish_load_stage(self, name, start):
+        if not self._load_stages or self._load_stages[0][0] != name:
+            return
+        self._load_stages.pop(0)
+        logging.debug("%s: loaded %s in %.2fs, %.2fs after opening",
+                      self.get_uri(), name, time.time() - start,
+                      time.time() - (self._open_start or start))
+        self._schedule_load_stage()
+
+    def _ensure_polled(self, **kwargs):
+        """
+        Make sure the object types passed as tick() poll* args get polled
+        at least once. This is how interfaces and node devices are loaded
+        on demand: the tick thread fetches them, and callers pick them up
+        from the *-added signals.
+        """
+        need = dict([(key, True) for key in kwargs
+                     if key not in self._polled and
+                     key not in self._poll_requested])
+        if not need or self.state != self.STATE_ACTIVE:
+            return
+
+        logging.debug("%s: loading %s on demand", self.get_uri(),
+                      ", ".join(sorted(need.keys())))
+        self._poll_requested.update(need.keys())
+        self.schedule_priority_tick(**need)
+
+    def _ensure_nodedev_type(self, devtype):
+        """
+        Make sure nodedevs with capability @devtype (None for all of
+        them) get listed. Like _ensure_polled, this doesn't wait for them.
+        """
+        key = ("pollnodedev", devtype)
+        if (devtype in self._nodedev_types or
+            key in self._poll_requested or
+            self.state != self.STATE_ACTIVE or
+            not self.is_nodedev_capable()):
+            return
+
+        logging.debug("%s: loading %s nodedevs on demand",
+                      self.get_uri(), devtype or "all")
+        self._poll_requested.add(key)
+        self.schedule_priority_tick(pollnodedev=[devtype])
 
     def _obj_signal_proxy(self, obj, signal, key):
         ignore = obj
@@ -1049,26 +1413,84 @@ class vmmConnection(vmmGObject):
             kwargs["stats_update"] = False
         self.idle_emit("priority-tick", kwargs)
 
-    def tick(self, stats_update,
-             pollvm=False, pollnet=False,
-             pollpool=False, polliface=False,
-             pollnodedev=False, pollmedia=False):
-        """ main update function: polls for new objects, updates stats, ..."""
+    def tick(self, stats_update, load_stage=None, **kwargs):
+        """
+        main update function: polls for new objects, updates stats, ...
+
+        @load_stage: Name of the initial load stage this tick is for. The
+            next stage is scheduled when it completes.
+        """
+        start = time.time()
+        self._tick_lock.acquire()
+        try:
+            return self._tick(stats_update, **kwargs)
+        finally:
+            self._tick_lock.release()
+            if module_trace.profiler:
+                module_trace.profiler.record_tick(self.get_uri(), "total",
+                                                  time.time() - start)
+            if load_stage:
+                self._finish_load_stage(load_stage, start)
+
+    def _profiled(self, section, func, *args):
+        """
+        Call func(*args), recording the time taken as tick @section
+        when profiling
+        """
+        if not module_trace.profiler:
+            return func(*args)
+
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            module_trace.profiler.record_tick(self.get_uri(), section,
+                                              time.time() - start)
+
+    def _tick(self, stats_update,
+              pollvm=False, pollnet=False,
+              pollpool=False, polliface=False,
+              pollnodedev=False, pollmedia=False):
         if self.state != self.STATE_ACTIVE:
             return
 
+        polled = []
+        for name, val in [("pollvm", pollvm), ("pollnet", pollnet),
+                          ("pollpool", pollpool), ("polliface", polliface)]:
+            if val:
+                self._polled.add(name)
+                polled.append(name)
+        if isinstance(pollnodedev, list):
+            polled.extend([("pollnodedev", t) for t in pollnodedev])
+
         if not pollvm:
             stats_update = False
 
         self.hostinfo = self._backend.getInfo()
 
-        (goneNets, newNets, nets) = self._update_nets(pollnet)
-        (gonePools, newPools, pools) = self._update_pools(pollpool)
-        (goneInterfaces,
-         newInterfaces, interfaces) = self._update_interfaces(polliface)
-        (goneNodedevs,
-         newNodedevs, nodedevs) = self._update_nodedevs(pollnodedev)
-        (goneVMs, newVMs, vms) = self._update_vms(pollvm)
+        (goneNets, newNets, nets) = self._profiled("list nets",
+            self._update_nets, pollnet)
+        (gonePools, newPools, pools) = self._profiled("list pools",
+            self._update_pools, pollpool)
+        (goneInterfaces, newInterfaces,
+         interfaces) = self._profiled("list interfaces",
+            self._update_interfaces, polliface)
+        (goneNodedevs, newNodedevs,
+         nodedevs, nodedevTypes) = self._profiled("list nodedevs",
+            self._update_nodedevs, pollnodedev)
+        (goneVMs, newVMs, vms) = self._profiled("list vms",
+            self._update_vms, pollvm)
+        prefilledVMs = set()
+        if len(newVMs) > 1:
+            prefilledVMs = self._init_vm_status(newVMs)
+        for uuid, vm in newVMs.items():
+            if uuid in prefilledVMs:
+                continue
+            try:
+                vm.force_update_status()
+            except:
+                logging.debug("Error fetching status for new VM %s",
+                              uuid, exc_info=True)
 
         def tick_send_signals():
             """
@@ -1082,14 +1504,20 @@ class vmmConnection(vmmGObject):
 
             self.vms = vms
             self.nodedevs = nodedevs
+            self._nodedev_types = nodedevTypes
             self.interfaces = interfaces
             self.pools = pools
             self.nets = nets
+            # Let failed on demand loads be retried
+            self._poll_requested.difference_update(polled)
 
-            # Make sure device polling is setup
-            if not self.netdev_initialized:
-                self._init_netdev()
+            if goneNets or newNets:
+                self._rebuild_net_index()
+            if gonePools or newPools:
+                self._rebuild_pool_index()
 
+            # Make sure device polling is setup. netdevs are set up on
+            # first use, since they need interfaces and node devices
             if not self.mediadev_initialized:
                 self._init_mediadev()
 
@@ -1106,6 +1534,7 @@ class vmmConnection(vmmGObject):
                 self.emit("net-removed", uuid)
                 obj.cleanup()
             for uuid, obj in newNets.items():
+                obj.connect("config-changed", self._rebuild_net_index)
                 obj.connect("started", self._obj_signal_proxy,
                             "net-started", uuid)
                 obj.connect("stopped", self._obj_signal_proxy,
@@ -1117,10 +1546,13 @@ class vmmConnection(vmmGObject):
                 self.emit("pool-removed", uuid)
                 obj.cleanup()
             for uuid, obj in newPools.items():
+                obj.connect("config-changed", self._rebuild_pool_index)
                 obj.connect("started", self._obj_signal_proxy,
                             "pool-started", uuid)
                 obj.connect("stopped", self._obj_signal_proxy,
                             "pool-stopped", uuid)
+                obj.connect("refreshed", self._obj_signal_proxy,
+                            "pool-refreshed", uuid)
                 self.emit("pool-added", uuid)
 
             # Update interface states
@@ -1153,6 +1585,10 @@ class vmmConnection(vmmGObject):
 
         if pollvm:
             for key in vms:
+                if key in prefilledVMs:
+                    # Already have fresh state from the bulk query, stats
+                    # sampling will start with the next tick
+                    continue
                 if key in updateVMs:
                     add_to_ticklist([vms[key]], (True,))
                 else:
@@ -1163,14 +1599,15 @@ class vmmConnection(vmmGObject):
             add_to_ticklist(pools.values())
         if polliface:
             add_to_ticklist(interfaces.values())
-        if pollnodedev:
-            add_to_ticklist(nodedevs.values())
         if pollmedia:
-            add_to_ticklist(self.mediadevs.values())
+            # Only CDROMs tell us about media changes
+            add_to_ticklist([dev for dev in self.mediadevs.values() if
+                             dev.get_media_type() == MEDIA_CDROM])
 
         for obj, args in ticklist:
             try:
-                obj.tick(*args)
+                self._profiled("%s tick" % obj.__class__.__name__,
+                               obj.tick, *args)
             except Exception, e:
                 logging.exception("Tick for %s failed", obj)
                 if (isinstance(e, libvirt.libvirtError) and
@@ -1183,7 +1620,8 @@ class vmmConnection(vmmGObject):
                                   "Ignoring.")
 
         if stats_update:
-            self._recalculate_stats(updateVMs.values())
+            self._profiled("stats", self._recalculate_stats,
+                           updateVMs.values())
             self.idle_emit("resources-sampled")
 
         return 1
@@ -21,6 +21,7 @@
 #
 
 # pylint: disable=E0611
+from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gtk
 from gi.repository import Gdk
@@ -31,11 +32,13 @@ from gi.repository import SpiceClientGLib
 
 import libvirt
 
+import hashlib
 import logging
 import os
 import Queue
 import signal
 import socket
+import subprocess
 import threading
 
 from virtManager.autodrawer import AutoDrawer
@@ -152,8 +155,75 @@ class _TunnelScheduler(object):
 _tunnel_sched = _TunnelScheduler()
 
 
-class _Tunnel(object):
+class _SSHMultiplexer(object):
+    """
+    Share one authenticated SSH connection per host between all console
+    tunnels, using OpenSSH connection multiplexing. The first tunnel to a
+    host becomes the master, later ones (other SPICE channels, other
+    console windows) open channels over it without a new handshake or
+    password prompt. The master exits on its own once no tunnel has
+    used it for the configured number of seconds.
+
+    Only instantiated once for the whole app, like _TunnelScheduler.
+    """
     def __init__(self):
+        self._supported = None
+        self._control_dir = None
+
+    def _check_support(self):
+        # ControlPersist needs OpenSSH 5.6. An unknown -o option makes
+        # ssh fail before it gets to -V
+        if self._supported is None:
+            try:
+                devnull = open(os.devnull, "w")
+                try:
+                    self._supported = not subprocess.call(
+                        ["ssh", "-o", "ControlPersist=1", "-V"],
+                        stdout=devnull, stderr=devnull)
+                finally:
+                    devnull.close()
+            except Exception, e:
+                logging.debug("Error checking ssh ControlPersist: %s", e)
+                self._supported = False
+            logging.debug("ssh connection sharing supported: %s",
+                          self._supported)
+        return self._supported
+
+    def _get_control_dir(self):
+        if not self._control_dir:
+            basedir = GLib.get_user_runtime_dir() or GLib.get_user_cache_dir()
+            path = os.path.join(basedir, "virt-manager", "ssh")
+            if not os.path.exists(path):
+                os.makedirs(path, 0700)
+            self._control_dir = path
+        return self._control_dir
+
+    def get_args(self, host, port, user, persist):
+        """
+        Return ssh options to share a connection to the passed host
+        """
+        if persist <= 0 or not self._check_support():
+            return []
+
+        try:
+            # Hash the name, unix socket paths are limited to ~100 chars
+            key = "%s@%s:%s" % (user or "", host, port or "")
+            path = os.path.join(self._get_control_dir(),
+                                "ssh-%s" % hashlib.sha1(key).hexdigest()[:16])
+        except Exception, e:
+            logging.debug("Error setting up ssh control dir: %s", e)
+            return []
+
+        return ["-o", "ControlMaster=auto",
+                "-o", "ControlPath=%s" % path,
+                "-o", "ControlPersist=%d" % persist]
+
+_ssh_mux = _SSHMultiplexer()
+
+
+class _Tunnel(object):
+    def __init__(self, persist=0):
+        self._persist = persist
         self.outfd = None
         self.errfd = None
         self.pid = None
@@ -227,6 +297,7 @@ class _Tunnel(object):
         if ginfo.connuser:
             argv += ['-l', ginfo.connuser]
 
+        argv += _ssh_mux.get_args(host, port, ginfo.connuser, self._persist)
         argv += [host]
 
         # Build 'nc' command run on the remote host
@@ -290,12 +361,13 @@ class _Tunnel(object):
 
 
 class Tunnels(object):
-    def __init__(self, ginfo):
+    def __init__(self, ginfo, persist=0):
         self.ginfo = ginfo
+        self._persist = persist
         self._tunnels = []
 
     def open_new(self):
-        t = _Tunnel()
+        t = _Tunnel(self._persist)
         fd, cb, args = t.open(self.ginfo)
         self._tunnels.append(t)
         _tunnel_sched.schedule(cb, args)
@@ -1379,7 +1451,8 @@ class vmmConsolePages(vmmGObjectUI):
             self.set_enable_accel()
 
             if ginfo.need_tunnel():
-                self.tunnels = Tunnels(ginfo)
+                self.tunnels = Tunnels(ginfo,
+                                       self.config.get_console_ssh_persist())
             self.viewer.open_ginfo(ginfo)
         except Exception, e:
             logging.exception("Error connection to graphical console")
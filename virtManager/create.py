@@ -708,10 +708,7 @@ class vmmCreate(vmmGObjectUI):
         model.clear()
 
         default = 0
-        archs = []
-        for guest in self.caps.guests:
-            if guest.os_type == self.capsguest.os_type:
-                archs.append(guest.arch)
+        archs = self.caps.get_archs(self.capsguest.os_type)
 
         # Combine x86/i686 to avoid confusion
         if (self.conn.caps.host.cpu.arch == "x86_64" and
@@ -749,7 +746,8 @@ class vmmCreate(vmmGObjectUI):
         model = lst.get_model()
         model.clear()
 
-        machines = self.capsdomain.machines
+        # Copy it, the caps object is shared and we sort it below
+        machines = (self.capsdomain.machines or [])[:]
         if self.capsguest.arch in ["i686", "x86_64"]:
             machines = []
         machines.sort()
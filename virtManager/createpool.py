@@ -41,6 +41,7 @@ class vmmCreatePool(vmmGObjectUI):
         self.conn = conn
 
         self._pool = None
+        self._sources_refresh_pending = False
 
         self.builder.connect_signals({
             "on_pool_forward_clicked" : self.forward,
@@ -62,6 +63,13 @@ class vmmCreatePool(vmmGObjectUI):
         self.set_initial_state()
         self.set_page(PAGE_NAME)
 
+        # SCSI hosts and disks come from node devices, which are loaded
+        # on demand and may show up after the page is populated
+        self._conn_signals = [
+            self.conn.connect("nodedev-added", self._nodedevs_changed),
+            self.conn.connect("nodedev-removed", self._nodedevs_changed),
+        ]
+
     def show(self, parent):
         logging.debug("Showing new pool wizard")
         self.reset_state()
@@ -74,6 +82,10 @@ class vmmCreatePool(vmmGObjectUI):
         return 1
 
     def _cleanup(self):
+        for handle in self._conn_signals:
+            self.conn.disconnect(handle)
+        self._conn_signals = []
+
         self.conn = None
         self._pool = None
 
@@ -158,6 +170,21 @@ class vmmCreatePool(vmmGObjectUI):
         for f in formats:
             model.append([f, f])
 
+    def _nodedevs_changed(self, conn_ignore, name_ignore):
+        if self._sources_refresh_pending:
+            return
+        self._sources_refresh_pending = True
+        self.idle_add(self._refresh_pool_sources)
+
+    def _refresh_pool_sources(self):
+        self._sources_refresh_pending = False
+        if (not self.conn or not self._pool or
+            not self.topwin.get_visible() or
+            self._pool.type not in [StoragePool.TYPE_SCSI,
+                                    StoragePool.TYPE_DISK]):
+            return
+        self.populate_pool_sources()
+
     def populate_pool_sources(self):
         source_list = self.widget("pool-source-path")
         source_model = source_list.get_model()
@@ -24,10 +24,14 @@ from gi.repository import Gdk
 # pylint: enable=E0611
 
 import os
+import Queue
 import stat
+import threading
 import traceback
 import logging
 
+import libvirt
+
 import virtinst
 from virtinst import util
 
@@ -43,13 +47,118 @@ STORAGE_ROW_ICON_SHOW = 4
 STORAGE_ROW_ICON = 5
 STORAGE_ROW_ICON_SIZE = 6
 STORAGE_ROW_TOOLTIP = 7
+STORAGE_ROW_VM = 8
+
+# Max number of storage volumes we delete in parallel
+DELETE_MAX_WORKERS = 4
+
+# (libvirt wipe algorithm name, label)
+WIPE_ALGORITHMS = [
+    (None, _("Don't wipe")),
+    ("zero", _("Zeros")),
+    ("random", _("Random data")),
+    ("nnsa", _("NNSA (4 passes)")),
+    ("dod", _("DoD 5220.22-M (4 passes)")),
+    ("bsi", _("BSI (9 passes)")),
+    ("gutmann", _("Gutmann (35 passes)")),
+]
+
+
+class _StorageDeleter(object):
+    """
+    Delete a batch of storage paths for a single connection. Paths are
+    resolved to volumes in one pass over the connection's cached volume
+    list, and then deleted concurrently by a bounded pool of threads.
+    """
+    def __init__(self, conn, wipe_alg=None, max_workers=DELETE_MAX_WORKERS):
+        self.conn = conn
+        self.wipe_alg = wipe_alg
+        self.max_workers = max_workers
+
+    def _resolve_paths(self, paths):
+        pathmap = {}
+        for pool in self.conn.pools.values():
+            for vol in pool.get_volumes(refresh=False).values():
+                pathmap[vol.get_target_path()] = vol.get_backend()
+
+        ret = {}
+        for path in paths:
+            vol = pathmap.get(path)
+            if not vol:
+                # Not in our cache, it may have been created behind our back
+                try:
+                    vol = self.conn.get_backend().storageVolLookupByPath(path)
+                except:
+                    logging.debug("Path '%s' is not managed. "
+                                  "Deleting locally", path)
+            ret[path] = vol
+        return ret
+
+    def _wipe_vol(self, vol, path):
+        if not self.wipe_alg:
+            return
+        alg = getattr(libvirt,
+            "VIR_STORAGE_VOL_WIPE_ALG_%s" % self.wipe_alg.upper())
+        logging.debug("Wiping path '%s' with algorithm '%s'",
+                      path, self.wipe_alg)
+        vol.wipePattern(alg, 0)
+
+    def _delete_path(self, path, vol):
+        logging.debug("Deleting path: %s", path)
+        if vol:
+            self._wipe_vol(vol, path)
+            vol.delete(0)
+        else:
+            if self.wipe_alg:
+                logging.debug("Not wiping unmanaged path '%s'", path)
+            os.unlink(path)
+
+    def delete(self, paths, progress_cb):
+        """
+        Delete all @paths, calling @progress_cb after each one finishes.
+        Returns a list of (error, details) tuples for failed paths.
+        """
+        errors = []
+        if not paths:
+            return errors
+
+        queue = Queue.Queue()
+        for path, vol in self._resolve_paths(paths).items():
+            queue.put((path, vol))
+
+        def worker():
+            while True:
+                try:
+                    path, vol = queue.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    self._delete_path(path, vol)
+                except Exception, e:
+                    errors.append((_("Error deleting path '%s': %s") %
+                                   (path, str(e)),
+                                   "".join(traceback.format_exc())))
+                progress_cb(path)
+
+        threads = []
+        for ignore in range(min(self.max_workers, len(paths))):
+            t = threading.Thread(target=worker,
+                                 name="Deleting storage for %s" %
+                                 self.conn.get_uri())
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        return errors
 
 
 class vmmDeleteDialog(vmmGObjectUI):
     def __init__(self):
         vmmGObjectUI.__init__(self, "delete.ui", "vmm-delete")
-        self.vm = None
-        self.conn = None
+        self.vms = []
 
         self.builder.connect_signals({
             "on_vmm_delete_delete_event" : self.close,
@@ -67,10 +176,21 @@ class vmmDeleteDialog(vmmGObjectUI):
 
         prepare_storage_list(self.widget("delete-storage-list"))
 
+        # [wipe algorithm, label]
+        wipe_combo = self.widget("delete-wipe")
+        wipe_model = Gtk.ListStore(str, str)
+        wipe_combo.set_model(wipe_model)
+        uiutil.set_combo_text_column(wipe_combo, 1)
+        for alg, label in WIPE_ALGORITHMS:
+            wipe_model.append([alg, label])
+
     def show(self, vm, parent):
-        logging.debug("Showing delete wizard")
-        self.vm = vm
-        self.conn = vm.conn
+        self.show_multiple([vm], parent)
+
+    def show_multiple(self, vms, parent):
+        logging.debug("Showing delete wizard for %s",
+                      [vm.get_name() for vm in vms])
+        self.vms = vms[:]
 
         self.reset_state()
         self.topwin.set_transient_for(parent)
@@ -79,24 +199,27 @@ class vmmDeleteDialog(vmmGObjectUI):
     def close(self, ignore1=None, ignore2=None):
         logging.debug("Closing delete wizard")
         self.topwin.hide()
-        self.vm = None
-        self.conn = None
+        self.vms = []
         return 1
 
     def _cleanup(self):
-        self.vm = None
-        self.conn = None
+        self.vms = []
+
+    def _get_title_name(self):
+        if len(self.vms) == 1:
+            return "'%s'" % self.vms[0].get_name()
+        return _("%d virtual machines") % len(self.vms)
 
     def reset_state(self):
         # Set VM name in title'
-        title_str = ("<span size='large' color='white'>%s '%s'</span>" %
-                     (_("Delete"), util.xml_escape(self.vm.get_name())))
+        title_str = ("<span size='large' color='white'>%s %s</span>" %
+                     (_("Delete"), util.xml_escape(self._get_title_name())))
         self.widget("header-label").set_markup(title_str)
 
         self.widget("delete-cancel").grab_focus()
 
         # Show warning message if VM is running
-        vm_active = self.vm.is_active()
+        vm_active = bool([vm for vm in self.vms if vm.is_active()])
         uiutil.set_grid_row_visible(
             self.widget("delete-warn-running-vm-box"), vm_active)
 
@@ -104,13 +227,20 @@ class vmmDeleteDialog(vmmGObjectUI):
         self.widget("delete-remove-storage").set_active(True)
         self.widget("delete-remove-storage").toggled()
 
-        populate_storage_list(self.widget("delete-storage-list"),
-                              self.vm, self.conn)
+        can_wipe = bool([vm for vm in self.vms if
+                         vm.conn.check_support(
+                            vm.conn.SUPPORT_STORAGE_VOL_WIPE_PATTERN)])
+        self.widget("delete-wipe").set_active(0)
+        self.widget("delete-wipe").set_sensitive(can_wipe)
+
+        populate_storage_list(self.widget("delete-storage-list"), self.vms)
 
     def toggle_remove_storage(self, src):
         dodel = src.get_active()
         uiutil.set_grid_row_visible(
             self.widget("delete-storage-scroll"), dodel)
+        uiutil.set_grid_row_visible(
+            self.widget("delete-wipe-box"), dodel)
 
     def get_config_format(self):
         format_combo = self.widget("vol-format")
@@ -120,7 +250,16 @@ class vmmDeleteDialog(vmmGObjectUI):
             return model.get_value(format_combo.get_active_iter(), 0)
         return None
 
+    def get_config_wipe_alg(self):
+        combo = self.widget("delete-wipe")
+        if combo.get_active_iter() is None:
+            return None
+        return combo.get_model().get_value(combo.get_active_iter(), 0)
+
     def get_paths_to_delete(self):
+        """
+        Return a list of (vm, path) pairs of storage to remove
+        """
         del_list = self.widget("delete-storage-list")
         model = del_list.get_model()
 
@@ -129,10 +268,11 @@ class vmmDeleteDialog(vmmGObjectUI):
             for row in model:
                 if (not row[STORAGE_ROW_CANT_DELETE] and
                     row[STORAGE_ROW_CONFIRM]):
-                    paths.append(row[STORAGE_ROW_PATH])
+                    paths.append((row[STORAGE_ROW_VM],
+                                  row[STORAGE_ROW_PATH]))
         return paths
 
-    def _finish_cb(self, error, details):
+    def _finish_cb(self, error, details, conns):
         self.topwin.set_sensitive(True)
         self.topwin.get_window().set_cursor(
             Gdk.Cursor.new(Gdk.CursorType.TOP_LEFT_ARROW))
@@ -140,7 +280,8 @@ class vmmDeleteDialog(vmmGObjectUI):
         if error is not None:
             self.err.show_err(error, details=details)
 
-        self.conn.schedule_priority_tick(pollvm=True)
+        for conn in conns:
+            conn.schedule_priority_tick(pollvm=True, pollpool=True)
         self.close()
 
     def finish(self, src_ignore):
@@ -149,7 +290,7 @@ class vmmDeleteDialog(vmmGObjectUI):
         if devs:
             title = _("Are you sure you want to delete the storage?")
             message = (_("The following paths will be deleted:\n\n%s") %
-                       "\n".join(devs))
+                       "\n".join([d[1] for d in devs]))
             ret = self.err.chkbox_helper(
                 self.config.get_confirm_delstorage,
                 self.config.set_confirm_delstorage,
@@ -161,46 +302,98 @@ class vmmDeleteDialog(vmmGObjectUI):
         self.topwin.get_window().set_cursor(
             Gdk.Cursor.new(Gdk.CursorType.WATCH))
 
-        title = _("Deleting virtual machine '%s'") % self.vm.get_name()
+        if len(self.vms) == 1:
+            title = (_("Deleting virtual machine '%s'") %
+                     self.vms[0].get_name())
+        else:
+            title = _("Deleting %d virtual machines") % len(self.vms)
         text = title
         if devs:
             text = title + _(" and selected storage (this may take a while)")
 
-        progWin = vmmAsyncJob(self._async_delete, [devs],
-                              self._finish_cb, [],
+        conns = []
+        for vm in self.vms:
+            if vm.conn not in conns:
+                conns.append(vm.conn)
+
+        progWin = vmmAsyncJob(self._async_delete,
+                              [self.vms[:], devs, self.get_config_wipe_alg()],
+                              self._finish_cb, [conns],
                               title, text, self.topwin)
         progWin.run()
 
-    def _async_delete(self, asyncjob, paths):
+    def _async_delete(self, asyncjob, vms, paths, wipe_alg):
+        vm_errors = []
         storage_errors = []
-        details = ""
-
-        try:
-            if self.vm.is_active():
-                logging.debug("Forcing VM '%s' power off.", self.vm.get_name())
-                self.vm.destroy()
-
-            conn = self.conn.get_backend()
-            meter = asyncjob.get_meter()
-
-            for path in paths:
+        meter = asyncjob.get_meter()
+
+        def add_vm_error(vm, e):
+            vm_errors.append((
+                _("Error deleting virtual machine '%s': %s") %
+                (vm.get_name(), str(e)),
+                "".join(traceback.format_exc())))
+
+        # Don't touch the storage of any VM we failed to stop
+        deletevms = []
+        for vm in vms:
+            try:
+                if vm.is_active():
+                    logging.debug("Forcing VM '%s' power off.", vm.get_name())
+                    vm.destroy()
+                deletevms.append(vm)
+            except Exception, e:
+                add_vm_error(vm, e)
+
+        # Group the storage by connection, since that's what the volume
+        # lookups and deletes run against
+        conns = []
+        conn_paths = {}
+        for vm, path in paths:
+            if vm not in deletevms:
+                continue
+            if vm.conn not in conns:
+                conns.append(vm.conn)
+                conn_paths[vm.conn] = []
+            if path not in conn_paths[vm.conn]:
+                conn_paths[vm.conn].append(path)
+
+        total = sum([len(l) for l in conn_paths.values()])
+        if total:
+            meter.start(size=total, text=_("Deleting storage"))
+            lock = threading.Lock()
+            progress = {"done": 0}
+
+            def progress_cb(path):
+                lock.acquire()
                 try:
-                    logging.debug("Deleting path: %s", path)
-                    meter.start(text=_("Deleting path '%s'") % path)
-                    self._async_delete_path(conn, path, meter)
-                except Exception, e:
-                    storage_errors.append((str(e),
-                                          "".join(traceback.format_exc())))
-                meter.end(0)
-
-            logging.debug("Removing VM '%s'", self.vm.get_name())
-            self.vm.delete()
-
-        except Exception, e:
-            error = (_("Error deleting virtual machine '%s': %s") %
-                      (self.vm.get_name(), str(e)))
-            details = "".join(traceback.format_exc())
-
+                    progress["done"] += 1
+                    meter.text = _("Deleted path '%s'") % path
+                    meter.update(progress["done"])
+                finally:
+                    lock.release()
+
+            for conn in conns:
+                deleter = _StorageDeleter(conn, wipe_alg=wipe_alg)
+                storage_errors += deleter.delete(conn_paths[conn],
+                                                 progress_cb)
+            meter.end(total)
+
+        for vm in deletevms:
+            try:
+                logging.debug("Removing VM '%s'", vm.get_name())
+                vm.delete()
+            except Exception, e:
+                add_vm_error(vm, e)
+
+        error = None
+        details = ""
+        for errinfo in vm_errors:
+            details += "%s\n%s\n" % (errinfo[0], errinfo[1])
+        if vm_errors:
+            error = vm_errors[0][0]
+            if len(vm_errors) > 1:
+                error = _("Errors encountered while deleting "
+                          "virtual machines.")
 
         storage_errstr = ""
         for errinfo in storage_errors:
@@ -212,10 +405,11 @@ class vmmDeleteDialog(vmmGObjectUI):
         # We had extra storage errors. If there was another error message,
         # errors to it. Otherwise, build the main error around them.
         if details:
-            details += "\n\n"
-            details += _("Additionally, there were errors removing"
-                                    " certain storage devices: \n")
-            details += storage_errstr
+            if storage_errstr:
+                details += "\n\n"
+                details += _("Additionally, there were errors removing"
+                                        " certain storage devices: \n")
+                details += storage_errstr
         else:
             error = _("Errors encountered while removing certain "
                                "storage devices.")
@@ -224,24 +418,17 @@ class vmmDeleteDialog(vmmGObjectUI):
         if error:
             asyncjob.set_error(error, details)
 
-    def _async_delete_path(self, conn, path, ignore):
-        vol = None
 
-        try:
-            vol = conn.storageVolLookupByPath(path)
-        except:
-            logging.debug("Path '%s' is not managed. Deleting locally", path)
-
-        if vol:
-            vol.delete(0)
-        else:
-            os.unlink(path)
-
-
-def populate_storage_list(storage_list, vm, conn):
+def populate_storage_list(storage_list, vms):
     model = storage_list.get_model()
     model.clear()
 
+    seen = []
+    for vm in vms:
+        _populate_vm_storage(model, vm, vm.conn, len(vms) > 1, seen)
+
+
+def _populate_vm_storage(model, vm, conn, show_name, seen):
     diskdata = [(disk.target, disk.path, disk.read_only, disk.shareable) for
                 disk in vm.get_disk_devices()]
 
@@ -253,6 +440,14 @@ def populate_storage_list(storage_list, vm, conn):
         if not path:
             continue
 
+        # Storage shared between multiple selected VMs is only listed once
+        if (conn, path) in seen:
+            continue
+        seen.append((conn, path))
+
+        if show_name:
+            target = "%s: %s" % (vm.get_name(), target)
+
         # There are a few pieces here
         # 1) Can we even delete the storage? If not, make the checkbox
         #    inconsistent. self.can_delete decides this for us, and if
@@ -282,14 +477,14 @@ def populate_storage_list(storage_list, vm, conn):
         icon_size = Gtk.IconSize.LARGE_TOOLBAR
 
         row = [default, not can_del, path, target,
-               bool(info), icon, icon_size, info]
+               bool(info), icon, icon_size, info, vm]
         model.append(row)
 
 
 def prepare_storage_list(storage_list):
     # Checkbox, deleteable?, storage path, target (hda), icon stock,
-    # icon size, tooltip
-    model = Gtk.ListStore(bool, bool, str, str, bool, str, int, str)
+    # icon size, tooltip, owning vm
+    model = Gtk.ListStore(bool, bool, str, str, bool, str, int, str, object)
     storage_list.set_model(model)
     storage_list.set_tooltip_column(STORAGE_ROW_TOOLTIP)
 
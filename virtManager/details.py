@@ -325,6 +325,14 @@ def lookup_nodedev(vmmconn, hostdev):
     return found_dev
 
 
+def _hw_row_key(dev):
+    """
+    Key identifying a device row across XML reparses: the device's
+    xpath in the domain XML if it has one, the object itself otherwise
+    """
+    return dev.get_root_xpath() or id(dev)
+
+
 class vmmDetails(vmmGObjectUI):
     __gsignals__ = {
         "action-save-domain": (GObject.SignalFlags.RUN_FIRST, None, [str, str]),
@@ -545,6 +553,7 @@ class vmmDetails(vmmGObjectUI):
         self.vm.connect("status-changed", self.refresh_vm_state)
         self.vm.connect("config-changed", self.refresh_vm_state)
         self.vm.connect("resources-sampled", self.refresh_resources)
+        self.topwin.connect("focus-in-event", self._focus_in_event)
 
         self.fsDetails = vmmFSDetails(self.vm)
         self.fsDetails.set_initial_state()
@@ -596,6 +605,7 @@ class vmmDetails(vmmGObjectUI):
         self.fsDetails.topwin.show_all()
 
         self.emit("details-opened")
+        self._refresh_xml()
         self.refresh_vm_state()
 
     def customize_finish(self, src):
@@ -2349,21 +2359,29 @@ class vmmDetails(vmmGObjectUI):
     # Details page refresh #
     ########################
 
-    def refresh_resources(self, ignore):
-        details = self.widget("details-pages")
-        page = details.get_current_page()
-
-        # If the dialog is visible, we want to make sure the XML is always
-        # up to date
+    def _refresh_xml(self):
+        """
+        Pull in XML changes made outside of this dialog. Our own changes
+        and VM state changes already emit config-changed, so we only need
+        this when the window is shown or the user comes back to it.
+        """
         try:
-            if self.is_visible():
-                self.vm.refresh_xml()
+            self.vm.refresh_xml()
         except libvirt.libvirtError, e:
             if util.exception_is_libvirt_error(e, "VIR_ERR_NO_DOMAIN"):
                 self.close()
                 return
             raise
 
+    def _focus_in_event(self, ignore1, ignore2):
+        if self.is_visible():
+            self._refresh_xml()
+        return False
+
+    def refresh_resources(self, ignore):
+        details = self.widget("details-pages")
+        page = details.get_current_page()
+
         # Stats page needs to be refreshed every tick
         if (page == DETAILS_PAGE_DETAILS and
             self.get_hw_selection(HW_LIST_COL_TYPE) == HW_LIST_TYPE_STATS):
@@ -3255,47 +3273,54 @@ class vmmDetails(vmmGObjectUI):
         hw_list = self.widget("hw-list")
         hw_list_model = hw_list.get_model()
 
-        currentDevices = []
-
-        def dev_cmp(origdev, newdev):
-            if isinstance(origdev, str):
-                return False
+        # Index the current rows by device key, and count rows per type
+        # so we can find insert positions without rescanning the model.
+        # ListStore iters persist across inserts and removals.
+        rowindex = {}
+        typecounts = {}
+        for row in hw_list_model:
+            rowtype = row[HW_LIST_COL_TYPE]
+            typecounts[rowtype] = typecounts.get(rowtype, 0) + 1
 
-            if origdev == newdev:
-                return True
+            rowdev = row[HW_LIST_COL_DEVICE]
+            if not isinstance(rowdev, str):
+                rowindex[_hw_row_key(rowdev)] = row.iter
 
-            if not origdev.get_root_xpath():
-                return False
+        currentKeys = set()
 
-            return origdev.get_root_xpath() == newdev.get_root_xpath()
+        def add_hw_list_option(hwtype, name, info, icon_name):
+            insertAt = 0
+            for rowtype, count in typecounts.items():
+                if rowtype <= hwtype:
+                    insertAt += count
+            typecounts[hwtype] = typecounts.get(hwtype, 0) + 1
 
-        def add_hw_list_option(idx, name, page_id, info, icon_name):
-            hw_list_model.insert(idx, [name, icon_name,
-                                       Gtk.IconSize.LARGE_TOOLBAR,
-                                       page_id, info])
+            hw_list_model.insert(insertAt, [name, icon_name,
+                                            Gtk.IconSize.LARGE_TOOLBAR,
+                                            hwtype, info])
 
         def update_hwlist(hwtype, info, name, icon_name):
             """
             See if passed hw is already in list, and if so, update info.
             If not in list, add it!
             """
-            currentDevices.append(info)
+            key = _hw_row_key(info)
+            currentKeys.add(key)
 
-            insertAt = 0
-            for row in hw_list_model:
-                rowdev = row[HW_LIST_COL_DEVICE]
-                if dev_cmp(rowdev, info):
-                    # Update existing HW info
-                    row[HW_LIST_COL_DEVICE] = info
-                    row[HW_LIST_COL_LABEL] = name
-                    row[HW_LIST_COL_ICON_NAME] = icon_name
-                    return
-
-                if row[HW_LIST_COL_TYPE] <= hwtype:
-                    insertAt += 1
+            _iter = rowindex.get(key)
+            if _iter is None:
+                add_hw_list_option(hwtype, name, info, icon_name)
+                return
 
-            # Add the new HW row
-            add_hw_list_option(insertAt, name, hwtype, info, icon_name)
+            # Update existing HW info, only touching what changed so
+            # we don't emit needless row-changed signals
+            row = hw_list_model[_iter]
+            if row[HW_LIST_COL_DEVICE] is not info:
+                row[HW_LIST_COL_DEVICE] = info
+            if row[HW_LIST_COL_LABEL] != name:
+                row[HW_LIST_COL_LABEL] = name
+            if row[HW_LIST_COL_ICON_NAME] != icon_name:
+                row[HW_LIST_COL_ICON_NAME] = icon_name
 
         # Populate list of disks
         for disk in self.vm.get_disk_devices():
@@ -3436,16 +3461,10 @@ class vmmDetails(vmmGObjectUI):
             update_hwlist(HW_LIST_TYPE_PANIC, rng,
                           _("Panic Notifier"), "system-run")
 
-        devs = range(len(hw_list_model))
-        devs.reverse()
-        for i in devs:
-            _iter = hw_list_model.iter_nth_child(None, i)
-            olddev = hw_list_model[i][HW_LIST_COL_DEVICE]
-
+        for key, _iter in rowindex.items():
             # Existing device, don't remove it
-            if type(olddev) is str or olddev in currentDevices:
+            if key in currentKeys:
                 continue
-
             hw_list_model.remove(_iter)
 
     def repopulate_boot_list(self, bootdevs=None, dev_select=None):
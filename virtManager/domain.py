@@ -24,8 +24,10 @@ from gi.repository import GObject
 
 import logging
 import os
-import time
+import re
+import StringIO
 import threading
+import time
 
 import libvirt
 
@@ -103,46 +105,6 @@ def find_device(guest, origdev):
     return None
 
 
-def start_job_progress_thread(vm, meter, progtext):
-    current_thread = threading.currentThread()
-
-    def jobinfo_cb():
-        while True:
-            time.sleep(.5)
-
-            if not current_thread.isAlive():
-                return False
-
-            try:
-                jobinfo = vm.job_info()
-                data_total      = float(jobinfo[3])
-                # data_processed  = float(jobinfo[4])
-                data_remaining  = float(jobinfo[5])
-
-                # data_total is 0 if the job hasn't started yet
-                if not data_total:
-                    continue
-
-                if not meter.started:
-                    meter.start(size=data_total,
-                                text=progtext)
-
-                progress = data_total - data_remaining
-                meter.update(progress)
-            except:
-                logging.exception("Error calling jobinfo")
-                return False
-
-        return True
-
-    if vm.getjobinfo_supported:
-        t = threading.Thread(target=jobinfo_cb,
-                             name="job progress reporting",
-                             args=())
-        t.daemon = True
-        t.start()
-
-
 class vmmInspectionData(object):
     def __init__(self):
         self.type = None
@@ -157,42 +119,83 @@ class vmmInspectionData(object):
         self.error = False
 
 
+# Start of the full domain definition embedded in snapshot XML. libvirt
+# always formats it after the snapshot's own metadata.
+_SNAPSHOT_DOMAIN_RE = re.compile(r"<domain[\s>]")
+
+
 class vmmDomainSnapshot(vmmLibvirtObject):
     """
-    Class wrapping a virDomainSnapshot object
+    Class wrapping a virDomainSnapshot object. XML is only fetched once
+    something asks for it.
     """
     def __init__(self, conn, backend):
         vmmLibvirtObject.__init__(self, conn, backend, backend.getName(),
                                   DomainSnapshot)
 
-        self.refresh_xml()
+        # DomainSnapshot of just the snapshot metadata
+        self._summary = None
 
     def get_name(self):
-        return self.get_xmlobj().name
+        return self.get_key()
     def _XMLDesc(self, flags):
         return self._backend.getXMLDesc(flags=flags)
 
+    def refresh_xml(self, forcesignal=False):
+        # Nothing listens for snapshot config-changed, so don't have it
+        # reparse the full XML behind our back; get_xmlobj() will
+        self._invalidate_xml()
+        self._xml = self._XMLDesc(self._active_xml_flags)
+        self._is_xml_valid = True
+        self._xmlobj = None
+        self._summary = None
+
+        if forcesignal:
+            self.idle_emit("config-changed")
+
+    def _get_summary(self):
+        """
+        Most of a snapshot's XML is the guest definition, which we only
+        need for the details of the selected snapshot. For listing, skip
+        it and parse just the metadata in front.
+        """
+        if not self._summary:
+            xml = self._get_raw_xml()
+            match = _SNAPSHOT_DOMAIN_RE.search(xml)
+            if match:
+                xml = xml[:match.start()] + "</domainsnapshot>"
+            self._summary = self._build_xmlobj(xml)
+        return self._summary
+
+    def get_description(self):
+        return self._get_summary().description
+    def get_parent_name(self):
+        return self._get_summary().parent
+    def get_creation_time(self):
+        return self._get_summary().creationTime or 0
+    def get_memory_type(self):
+        return self._get_summary().memory_type
+    def get_disk_snapshot_modes(self):
+        return [disk.snapshot for disk in self._get_summary().disks]
+
     def delete(self, force=True):
         ignore = force
         self._backend.delete()
 
     def run_status(self):
-        status = DomainSnapshot.state_str_to_int(self.get_xmlobj().state)
+        status = DomainSnapshot.state_str_to_int(self._get_summary().state)
         return vmmDomain.pretty_run_status(status)
     def run_status_icon_name(self):
-        status = DomainSnapshot.state_str_to_int(self.get_xmlobj().state)
+        status = DomainSnapshot.state_str_to_int(self._get_summary().state)
         if status not in vm_status_icons:
             logging.debug("Unknown status %d, using NOSTATE", status)
             status = libvirt.VIR_DOMAIN_NOSTATE
         return vm_status_icons[status]
 
     def is_external(self):
-        if self.get_xmlobj().memory_type == "external":
+        if self.get_memory_type() == "external":
             return True
-        for disk in self.get_xmlobj().disks:
-            if disk.snapshot == "external":
-                return True
-        return False
+        return "external" in self.get_disk_snapshot_modes()
 
 
 class vmmDomain(vmmLibvirtObject):
@@ -204,6 +207,7 @@ class vmmDomain(vmmLibvirtObject):
         "status-changed": (GObject.SignalFlags.RUN_FIRST, None, [int, int]),
         "resources-sampled": (GObject.SignalFlags.RUN_FIRST, None, []),
         "inspection-changed": (GObject.SignalFlags.RUN_FIRST, None, []),
+        "thumbnail-changed": (GObject.SignalFlags.RUN_FIRST, None, []),
         "pre-startup": (GObject.SignalFlags.RUN_FIRST, None, [object]),
     }
 
@@ -250,6 +254,10 @@ class vmmDomain(vmmLibvirtObject):
         self._id = None
         self._name = None
         self._snapshot_list = None
+        # Snapshot name -> vmmDomainSnapshot, kept across refreshes so
+        # we don't fetch and parse the XML of every snapshot each time
+        self._snapshot_cache = {}
+        self._snapshot_lock = threading.Lock()
 
         self.lastStatus = libvirt.VIR_DOMAIN_SHUTOFF
 
@@ -269,6 +277,8 @@ class vmmDomain(vmmLibvirtObject):
         self._stats_disk_skip = []
 
         self.inspection = vmmInspectionData()
+        # Path of the latest screenshot thumbnail, see vmmThumbnailService
+        self._thumbnail = None
 
         if isinstance(self._backend, Guest):
             return
@@ -276,8 +286,9 @@ class vmmDomain(vmmLibvirtObject):
         self._libvirt_init()
 
     def _cleanup(self):
-        for snap in self._snapshot_list or []:
+        for snap in self._snapshot_cache.values():
             snap.cleanup()
+        self._snapshot_cache = {}
         self._snapshot_list = None
 
     def _libvirt_init(self):
@@ -298,22 +309,16 @@ class vmmDomain(vmmLibvirtObject):
         (self._inactive_xml_flags,
          self._active_xml_flags) = self.conn.get_dom_flags(self._backend)
 
+        # Stats settings changes are passed on to us by the connection,
+        # so we don't register per VM settings listeners
         self.toggle_sample_network_traffic()
         self.toggle_sample_disk_io()
         self.toggle_sample_mem_stats()
 
-        self.force_update_status()
-
-        # Hook up listeners that need to be cleaned up
-        self.add_gconf_handle(
-            self.config.on_stats_enable_net_poll_changed(
-                                        self.toggle_sample_network_traffic))
-        self.add_gconf_handle(
-            self.config.on_stats_enable_disk_poll_changed(
-                                        self.toggle_sample_disk_io))
-        self.add_gconf_handle(
-            self.config.on_stats_enable_memory_poll_changed(
-                                        self.toggle_sample_mem_stats))
+        # Status is filled in by the connection from a bulk query when
+        # possible, or fetched on first use. Don't signal that initial
+        # status, and leave fetching the XML until someone needs it
+        self.lastStatus = None
 
         self.connect("status-changed", self._update_start_vcpus)
         self.connect("pre-startup", self._prestartup_nodedev_check)
@@ -370,8 +375,18 @@ class vmmDomain(vmmLibvirtObject):
         return self._id
 
     def status(self):
+        if self.lastStatus is None:
+            self.force_update_status()
         return self.lastStatus
 
+    def init_status(self, status):
+        """
+        Set the initial status from a bulk query, without signalling.
+        Does nothing if we already know our status
+        """
+        if self.lastStatus is None:
+            self.lastStatus = self._normalize_status(status)
+
     def get_cloning(self):
         return self.cloning
     def set_cloning(self, val):
@@ -967,16 +982,63 @@ class vmmDomain(vmmLibvirtObject):
     def open_console(self, devname, stream, flags=0):
         return self._backend.openConsole(devname, stream, flags)
 
+    def take_screenshot(self):
+        """
+        Grab the guest's first display, returns (mimetype, data). Waits
+        if the connection already has as many screenshot streams open
+        as we allow.
+        """
+        sem = self.conn.get_screenshot_semaphore()
+        sem.acquire()
+        stream = None
+        try:
+            stream = self.conn.get_backend().newStream(0)
+            screen = 0
+            flags = 0
+            mime = self._backend.screenshot(stream, screen, flags)
+
+            ret = StringIO.StringIO()
+            def _write_cb(_stream, data, userdata):
+                ignore = stream
+                ignore = userdata
+                ret.write(data)
+
+            stream.recvAll(_write_cb, None)
+            return mime, ret.getvalue()
+        finally:
+            try:
+                if stream:
+                    stream.finish()
+            except:
+                pass
+            sem.release()
+
     def refresh_snapshots(self):
         self._snapshot_list = None
 
     def list_snapshots(self):
-        if self._snapshot_list is None:
-            newlist = []
-            for rawsnap in self._backend.listAllSnapshots():
-                newlist.append(vmmDomainSnapshot(self.conn, rawsnap))
-            self._snapshot_list = newlist
-        return self._snapshot_list[:]
+        self._snapshot_lock.acquire()
+        try:
+            if self._snapshot_list is None:
+                newlist = []
+                oldcache = self._snapshot_cache
+                self._snapshot_cache = {}
+                for rawsnap in self._backend.listAllSnapshots():
+                    name = rawsnap.getName()
+                    snap = oldcache.pop(name, None)
+                    if snap:
+                        snap.change_name_backend(rawsnap)
+                    else:
+                        snap = vmmDomainSnapshot(self.conn, rawsnap)
+                    self._snapshot_cache[name] = snap
+                    newlist.append(snap)
+
+                for snap in oldcache.values():
+                    snap.cleanup()
+                self._snapshot_list = newlist
+            return self._snapshot_list[:]
+        finally:
+            self._snapshot_lock.release()
 
     def revert_to_snapshot(self, snap):
         self._backend.revertToSnapshot(snap.get_backend())
@@ -989,7 +1051,16 @@ class vmmDomain(vmmLibvirtObject):
 
         if not redefine:
             logging.debug("Creating snapshot flags=%s xml=\n%s", flags, xml)
-        self._backend.snapshotCreateXML(xml, flags)
+        rawsnap = self._backend.snapshotCreateXML(xml, flags)
+
+        # Don't reuse cached XML from a deleted snapshot of the same name
+        self._snapshot_lock.acquire()
+        try:
+            snap = self._snapshot_cache.get(rawsnap.getName())
+        finally:
+            self._snapshot_lock.release()
+        if snap:
+            snap.refresh_xml()
 
 
     ########################
@@ -1285,8 +1356,9 @@ class vmmDomain(vmmLibvirtObject):
     def save(self, filename=None, meter=None):
         self._install_abort = True
 
-        if meter:
-            start_job_progress_thread(self, meter, _("Saving domain to disk"))
+        if meter and self.getjobinfo_supported:
+            self.conn.get_job_monitor().add_job(
+                self, meter, _("Saving domain to disk"))
 
         if not self.managedsave_supported:
             self._backend.save(filename)
@@ -1324,8 +1396,9 @@ class vmmDomain(vmmLibvirtObject):
         logging.debug("Migrating: conn=%s flags=%s dname=%s uri=%s rate=%s",
                       destconn, flags, newname, interface, rate)
 
-        if meter:
-            start_job_progress_thread(self, meter, _("Migrating domain"))
+        if meter and self.getjobinfo_supported:
+            self.conn.get_job_monitor().add_job(
+                self, meter, _("Migrating domain"))
 
         self._backend.migrate(destconn, flags, newname, interface, rate)
 
@@ -1424,7 +1497,7 @@ class vmmDomain(vmmLibvirtObject):
         return [(x + y) / 2 for x, y in zip(data[0:end], data[end:end * 2])]
 
     def toggle_sample_network_traffic(self, ignore=None):
-        self._enable_net_poll = self.config.get_stats_enable_net_poll()
+        self._enable_net_poll = self.conn.get_stats_poll_enabled("net")
 
         if self._enable_net_poll and len(self.record) > 1:
             rxBytes, txBytes = self._sample_network_traffic()
@@ -1432,7 +1505,7 @@ class vmmDomain(vmmLibvirtObject):
             self.record[0]["netTxKB"] = txBytes / 1024
 
     def toggle_sample_disk_io(self, ignore=None):
-        self._enable_disk_poll = self.config.get_stats_enable_disk_poll()
+        self._enable_disk_poll = self.conn.get_stats_poll_enabled("disk")
 
         if self._enable_disk_poll and len(self.record) > 1:
             rdBytes, wrBytes = self._sample_disk_io()
@@ -1440,7 +1513,7 @@ class vmmDomain(vmmLibvirtObject):
             self.record[0]["diskWrKB"] = wrBytes / 1024
 
     def toggle_sample_mem_stats(self, ignore=None):
-        self._enable_mem_stats = self.config.get_stats_enable_memory_poll()
+        self._enable_mem_stats = self.conn.get_stats_poll_enabled("mem")
 
 
     ###################
@@ -1584,6 +1657,9 @@ class vmmDomain(vmmLibvirtObject):
         """
         status = self._normalize_status(status)
 
+        if self.lastStatus is None:
+            self.lastStatus = status
+            return
         if status == self.lastStatus:
             return
 
@@ -1599,6 +1675,12 @@ class vmmDomain(vmmLibvirtObject):
     def inspection_data_updated(self):
         self.idle_emit("inspection-changed")
 
+    def get_thumbnail(self):
+        return self._thumbnail
+    def set_thumbnail(self, path):
+        self._thumbnail = path
+        self.idle_emit("thumbnail-changed")
+
 
     ##################
     # config helpers #
@@ -32,22 +32,13 @@ import threading
 import libvirt
 from virtinst import util
 
+from virtManager import module_trace
 from virtManager import packageutils
-from virtManager.about import vmmAbout
+from virtManager.asyncjob import vmmAsyncJob
 from virtManager.baseclass import vmmGObject
-from virtManager.clone import vmmCloneVM
-from virtManager.connect import vmmConnect
 from virtManager.connection import vmmConnection
-from virtManager.preferences import vmmPreferences
-from virtManager.manager import vmmManager
-from virtManager.migrate import vmmMigrateDialog
-from virtManager.details import vmmDetails
-from virtManager.asyncjob import vmmAsyncJob
-from virtManager.create import vmmCreate
-from virtManager.host import vmmHost
 from virtManager.error import vmmErrorDialog
 from virtManager.systray import vmmSystray
-from virtManager.delete import vmmDeleteDialog
 
 # Enable this to get a report of leaked objects on app shutdown
 # gtk3/pygobject has issues here as of Fedora 18
@@ -60,6 +51,13 @@ DETAILS_CONSOLE = 3
 (PRIO_HIGH,
  PRIO_LOW) = range(1, 3)
 
+# Periodic ticks are dropped past this many queued ticks. Priority ticks
+# are always queued, dropping them would leave on demand loads pending
+TICK_QUEUE_MAX = 100
+
+# Seconds between profile summaries in the log, with --profile
+PROFILE_LOG_INTERVAL = 60
+
 
 class vmmEngine(vmmGObject):
     __gsignals__ = {
@@ -76,10 +74,15 @@ class vmmEngine(vmmGObject):
         self.windowCreate = None
         self.windowManager = None
         self.windowMigrate = None
+        self.windowProfiler = None
 
         self.conns = {}
         self.err = vmmErrorDialog()
 
+        # URIs waiting to be autoconnected, and those currently opening
+        self._autostart_queue = []
+        self._autostart_pending = []
+
         self.timer = None
         self.last_timeout = 0
 
@@ -97,11 +100,18 @@ class vmmEngine(vmmGObject):
                                             target=self._handle_tick_queue,
                                             args=())
         self._tick_thread.daemon = True
-        self._tick_queue = Queue.PriorityQueue(100)
+        self._tick_queue = Queue.PriorityQueue()
 
         self.inspection = None
         self._create_inspection_thread()
 
+        self.thumbnails = None
+        self._create_thumbnail_service()
+
+        # Needs to be running before any connection is opened so they
+        # can register for lifecycle events
+        self._start_libvirt_event_loop()
+
         # Counter keeping track of how many manager and details windows
         # are open. When it is decremented to 0, close the app or
         # keep running in system tray if enabled
@@ -121,6 +131,8 @@ class vmmEngine(vmmGObject):
             self.config.on_view_system_tray_changed(self.system_tray_changed))
 
         self.schedule_timer()
+        if module_trace.profiler:
+            self.timeout_add(PROFILE_LOG_INTERVAL * 1000, self._log_profile)
         self.load_stored_uris()
 
         self._tick_thread.start()
@@ -202,6 +214,7 @@ class vmmEngine(vmmGObject):
         if ret:
             tryuri = "qemu:///system"
         else:
+            from virtManager.connect import vmmConnect
             tryuri = vmmConnect.default_uri(always_system=True)
 
         if tryuri is None:
@@ -233,10 +246,28 @@ class vmmEngine(vmmGObject):
             self.register_conn(conn, skip_config=True)
 
     def autostart_conns(self):
-        for uri in self.conns:
-            conn = self.conns[uri]["conn"]
-            if conn.get_autoconnect():
-                self.connect_to_uri(uri)
+        """
+        Open all autoconnect URIs, but only a limited number at once so
+        a long list of remote hosts doesn't swamp the app on startup
+        """
+        self._autostart_queue = [uri for uri in self.conns
+                                 if self.conns[uri]["conn"].get_autoconnect()]
+        if not self._autostart_queue:
+            return
+
+        limit = self.config.get_conn_max_parallel_open()
+        logging.debug("Autoconnecting %d URIs, %d at a time",
+                      len(self._autostart_queue), limit)
+        for ignore in range(limit):
+            self._autostart_next()
+
+    def _autostart_next(self):
+        while self._autostart_queue:
+            uri = self._autostart_queue.pop(0)
+            conn = self.connect_to_uri(uri)
+            if conn and conn.get_state() == conn.STATE_CONNECTING:
+                self._autostart_pending.append(uri)
+                return
 
 
     def _do_vm_removed(self, conn, vmuuid):
@@ -248,6 +279,11 @@ class vmmEngine(vmmGObject):
         del(self.conns[hvuri]["windowDetails"][vmuuid])
 
     def _do_conn_changed(self, conn):
+        if (conn.get_state() != conn.STATE_CONNECTING and
+            conn.get_uri() in self._autostart_pending):
+            self._autostart_pending.remove(conn.get_uri())
+            self._autostart_next()
+
         if (conn.get_state() == conn.STATE_ACTIVE or
             conn.get_state() == conn.STATE_CONNECTING):
             return
@@ -278,7 +314,7 @@ class vmmEngine(vmmGObject):
         self.timer = self.timeout_add(interval, self.tick)
 
     def _add_obj_to_tick_queue(self, obj, isprio, **kwargs):
-        if self._tick_queue.full():
+        if not isprio and self._tick_queue.qsize() >= TICK_QUEUE_MAX:
             if not self._tick_thread_slow:
                 logging.debug("Tick is slow, not running at requested rate.")
                 self._tick_thread_slow = True
@@ -299,6 +335,25 @@ class vmmEngine(vmmGObject):
                                         stats_update=True, pollvm=True)
         return 1
 
+    def _log_profile(self):
+        logging.debug("%s", module_trace.profiler.get_summary())
+        return 1
+
+    def _start_libvirt_event_loop(self):
+        try:
+            libvirt.virEventRegisterDefaultImpl()
+        except Exception, e:
+            logging.debug("Unable to register libvirt event impl: %s", e)
+            return
+
+        def _run_loop():
+            while True:
+                libvirt.virEventRunDefaultImpl()
+
+        t = threading.Thread(name="libvirt event loop", target=_run_loop)
+        t.daemon = True
+        t.start()
+
     def _handle_tick_queue(self):
         while True:
             ignore1, ignore2, obj, kwargs = self._tick_queue.get()
@@ -360,6 +415,10 @@ class vmmEngine(vmmGObject):
             self.inspection.cleanup()
             self.inspection = None
 
+        if self.thumbnails:
+            self.thumbnails.cleanup()
+            self.thumbnails = None
+
         if self.timer is not None:
             GLib.source_remove(self.timer)
 
@@ -392,6 +451,10 @@ class vmmEngine(vmmGObject):
             self.windowMigrate.cleanup()
             self.windowMigrate = None
 
+        if self.windowProfiler:
+            self.windowProfiler.cleanup()
+            self.windowProfiler = None
+
         if self.delete_dialog:
             self.delete_dialog.cleanup()
             self.delete_dialog = None
@@ -433,6 +496,17 @@ class vmmEngine(vmmGObject):
 
         self.application.remove_window(self._appwindow)
 
+    def _create_thumbnail_service(self):
+        if self.config.get_thumbnail_interval() <= 0:
+            logging.debug("Guest thumbnails disabled")
+            return
+
+        from virtManager.thumbnails import vmmThumbnailService
+        self.thumbnails = vmmThumbnailService()
+        self.thumbnails.start()
+        self.connect("conn-added", self.thumbnails.conn_added)
+        self.connect("conn-removed", self.thumbnails.conn_removed)
+
     def _create_inspection_thread(self):
         logging.debug("libguestfs inspection support: %s",
                       self.config.support_inspection)
@@ -458,6 +532,7 @@ class vmmEngine(vmmGObject):
             "windowHost": None,
             "windowDetails": {},
             "windowClone": None,
+            "windowEvacuate": None,
             "probeConnection": probe
         }
 
@@ -505,6 +580,8 @@ class vmmEngine(vmmGObject):
                 self.conns[uri]["windowHost"].cleanup()
             if self.conns[uri]["windowClone"]:
                 self.conns[uri]["windowClone"].cleanup()
+            if self.conns[uri]["windowEvacuate"]:
+                self.conns[uri]["windowEvacuate"].cleanup()
 
             details = self.conns[uri]["windowDetails"]
             for win in details.values():
@@ -631,15 +708,26 @@ class vmmEngine(vmmGObject):
     def _do_show_about(self, src):
         try:
             if self.windowAbout is None:
+                from virtManager.about import vmmAbout
                 self.windowAbout = vmmAbout()
             self.windowAbout.show()
         except Exception, e:
             src.err.show_err(_("Error launching 'About' dialog: %s") % str(e))
 
+    def _do_show_profiler(self, src):
+        try:
+            if self.windowProfiler is None:
+                from virtManager.profiler import vmmProfiler
+                self.windowProfiler = vmmProfiler()
+            self.windowProfiler.show(src.topwin)
+        except Exception, e:
+            src.err.show_err(_("Error launching profiler: %s") % str(e))
+
     def _get_preferences(self):
         if self.windowPreferences:
             return self.windowPreferences
 
+        from virtManager.preferences import vmmPreferences
         obj = vmmPreferences()
         self.windowPreferences = obj
         return self.windowPreferences
@@ -655,11 +743,13 @@ class vmmEngine(vmmGObject):
             return self.conns[uri]["windowHost"]
 
         con = self._lookup_conn(uri)
+        from virtManager.host import vmmHost
         obj = vmmHost(con)
 
         obj.connect("action-exit-app", self.exit_app)
         obj.connect("action-view-manager", self._do_show_manager)
         obj.connect("action-restore-domain", self._do_restore_domain)
+        obj.connect("action-evacuate-host", self._do_show_evacuate)
         obj.connect("host-opened", self.increment_window_counter)
         obj.connect("host-closed", self.decrement_window_counter)
 
@@ -685,6 +775,7 @@ class vmmEngine(vmmGObject):
             if len(self.conns.keys()) == 0:
                 self.exit_app(src)
 
+        from virtManager.connect import vmmConnect
         obj = vmmConnect()
         obj.connect("completed", completed)
         obj.connect("cancelled", cancelled)
@@ -711,6 +802,7 @@ class vmmEngine(vmmGObject):
 
         con = self._lookup_conn(uri)
 
+        from virtManager.details import vmmDetails
         obj = vmmDetails(con.get_vm(uuid))
         obj.connect("action-save-domain", self._do_save_domain)
         obj.connect("action-destroy-domain", self._do_destroy_domain)
@@ -768,6 +860,7 @@ class vmmEngine(vmmGObject):
         if self.windowManager:
             return self.windowManager
 
+        from virtManager.manager import vmmManager
         obj = vmmManager()
         obj.connect("action-suspend-domain", self._do_suspend_domain)
         obj.connect("action-resume-domain", self._do_resume_domain)
@@ -779,11 +872,13 @@ class vmmEngine(vmmGObject):
         obj.connect("action-save-domain", self._do_save_domain)
         obj.connect("action-migrate-domain", self._do_show_migrate)
         obj.connect("action-delete-domain", self._do_delete_domain)
+        obj.connect("action-delete-domains", self._do_delete_domains)
         obj.connect("action-clone-domain", self._do_show_clone)
         obj.connect("action-show-domain", self._do_show_vm)
         obj.connect("action-show-preferences", self._do_show_preferences)
         obj.connect("action-show-create", self._do_show_create)
         obj.connect("action-show-about", self._do_show_about)
+        obj.connect("action-show-profiler", self._do_show_profiler)
         obj.connect("action-show-host", self._do_show_host)
         obj.connect("action-show-connect", self._do_show_connect)
         obj.connect("action-exit-app", self.exit_app)
@@ -818,6 +913,7 @@ class vmmEngine(vmmGObject):
         if self.windowCreate:
             return self.windowCreate
 
+        from virtManager.create import vmmCreate
         obj = vmmCreate(self)
         obj.connect("action-show-domain", self._do_show_vm)
         self.windowCreate = obj
@@ -835,6 +931,7 @@ class vmmEngine(vmmGObject):
             vm = conn.get_vm(uuid)
 
             if not self.windowMigrate:
+                from virtManager.migrate import vmmMigrateDialog
                 self.windowMigrate = vmmMigrateDialog(vm, self)
 
             self.windowMigrate.set_state(vm)
@@ -842,6 +939,16 @@ class vmmEngine(vmmGObject):
         except Exception, e:
             src.err.show_err(_("Error launching migrate dialog: %s") % str(e))
 
+    def _do_show_evacuate(self, src, uri):
+        try:
+            if not self.conns[uri]["windowEvacuate"]:
+                from virtManager.evacuate import vmmEvacuateDialog
+                self.conns[uri]["windowEvacuate"] = vmmEvacuateDialog(
+                    self._lookup_conn(uri), self)
+            self.conns[uri]["windowEvacuate"].show(src.topwin)
+        except Exception, e:
+            src.err.show_err(_("Error launching migrate dialog: %s") % str(e))
+
     def _do_show_clone(self, src, uri, uuid):
         con = self._lookup_conn(uri)
         orig_vm = con.get_vm(uuid)
@@ -849,6 +956,7 @@ class vmmEngine(vmmGObject):
 
         try:
             if clone_window is None:
+                from virtManager.clone import vmmCloneVM
                 clone_window = vmmCloneVM(orig_vm)
                 self.conns[uri]["windowClone"] = clone_window
             else:
@@ -1119,5 +1227,17 @@ class vmmEngine(vmmGObject):
         vm = conn.get_vm(uuid)
 
         if not self.delete_dialog:
+            from virtManager.delete import vmmDeleteDialog
             self.delete_dialog = vmmDeleteDialog()
         self.delete_dialog.show(vm, src.topwin)
+
+    def _do_delete_domains(self, src, vmids):
+        vms = []
+        for uri, uuid in vmids:
+            conn = self._lookup_conn(uri)
+            vms.append(conn.get_vm(uuid))
+
+        if not self.delete_dialog:
+            from virtManager.delete import vmmDeleteDialog
+            self.delete_dialog = vmmDeleteDialog()
+        self.delete_dialog.show_multiple(vms, src.topwin)
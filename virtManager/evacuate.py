@@ -0,0 +1,159 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import logging
+
+# pylint: disable=E0611
+from gi.repository import Gtk
+# pylint: enable=E0611
+
+from virtinst import BatchMigrator
+
+from virtManager.baseclass import vmmGObjectUI
+from virtManager.asyncjob import vmmAsyncJob
+
+
+class vmmEvacuateDialog(vmmGObjectUI):
+    """
+    Migrate every running guest off a connection with a BatchMigrator
+    """
+    def __init__(self, conn, engine):
+        vmmGObjectUI.__init__(self, "evacuate.ui", "vmm-evacuate")
+        self.conn = conn
+        self.engine = engine
+
+        self.builder.connect_signals({
+            "on_vmm_evacuate_delete_event" : self.close,
+            "on_evacuate_cancel_clicked" : self.close,
+            "on_evacuate_finish_clicked" : self.finish,
+            "on_evacuate_dest_changed" : self.dest_changed,
+        })
+        self.bind_escape_key_close()
+
+        self.init_state()
+
+    def show(self, parent):
+        logging.debug("Showing evacuate dialog for %s", self.conn.get_uri())
+        self.reset_state()
+        self.topwin.set_transient_for(parent)
+        self.topwin.present()
+
+    def close(self, ignore1=None, ignore2=None):
+        logging.debug("Closing evacuate dialog")
+        self.topwin.hide()
+        return 1
+
+    def _cleanup(self):
+        self.conn = None
+        self.engine = None
+        self.widget("evacuate-dest").get_model().clear()
+
+    def init_state(self):
+        # [label, conn]
+        model = Gtk.ListStore(str, object)
+        combo = self.widget("evacuate-dest")
+        combo.set_model(model)
+        text = Gtk.CellRendererText()
+        combo.pack_start(text, True)
+        combo.add_attribute(text, "text", 0)
+        model.set_sort_column_id(0, Gtk.SortType.ASCENDING)
+
+    def _get_running_vms(self):
+        return [vm for vm in [self.conn.get_vm(uuid) for uuid in
+                              self.conn.list_vm_uuids()]
+                if vm.is_active()]
+
+    def reset_state(self):
+        count = len(self._get_running_vms())
+        self.widget("evacuate-summary").set_text(
+            _("Migrate all %(count)d running guests on %(host)s to "
+              "another host.") % {"count": count,
+                                  "host": self.conn.get_hostname()})
+
+        model = self.widget("evacuate-dest").get_model()
+        model.clear()
+        for uri, entry in self.engine.conns.items():
+            destconn = entry["conn"]
+            if (uri == self.conn.get_uri() or
+                destconn.get_driver() != self.conn.get_driver() or
+                not destconn.is_active()):
+                continue
+            model.append([destconn.get_pretty_desc_inactive(), destconn])
+
+        self.widget("evacuate-dest").set_active(len(model) and 0 or -1)
+        self.widget("evacuate-offline").set_active(False)
+        self.widget("evacuate-cancel").grab_focus()
+        self.dest_changed(None)
+
+    def dest_changed(self, ignore):
+        self.widget("evacuate-finish").set_sensitive(
+            bool(self.get_config_destconn()))
+
+    def get_config_destconn(self):
+        combo = self.widget("evacuate-dest")
+        idx = combo.get_active()
+        if idx == -1:
+            return None
+        return combo.get_model()[idx][1]
+
+    def _finish_cb(self, error, details, destconn):
+        self.topwin.set_sensitive(True)
+        self.conn.schedule_priority_tick(pollvm=True)
+        destconn.schedule_priority_tick(pollvm=True)
+
+        if error:
+            self.err.show_err(_("Unable to migrate all guests: %s") % error,
+                              details=details)
+        else:
+            self.close()
+
+    def finish(self, ignore):
+        destconn = self.get_config_destconn()
+        if not destconn:
+            return self.err.val_err(_("A destination connection is "
+                                      "required."))
+
+        migrator = BatchMigrator(self.conn.get_backend().libvirtconn,
+                                 destconn.get_backend().libvirtconn)
+        migrator.max_parallel = int(
+            self.widget("evacuate-parallel").get_value())
+        migrator.bandwidth = int(
+            self.widget("evacuate-bandwidth").get_value())
+        migrator.live = not self.widget("evacuate-offline").get_active()
+
+        self.topwin.set_sensitive(False)
+        progWin = vmmAsyncJob(
+            self._async_evacuate, [migrator],
+            self._finish_cb, [destconn],
+            _("Migrating guests"),
+            (_("Migrating all running guests from %s to %s. "
+               "This may take a while.") %
+             (self.conn.get_hostname(), destconn.get_hostname())),
+            self.topwin, cancel_cb=(self._cancel_evacuate, migrator))
+        progWin.run()
+
+    def _cancel_evacuate(self, asyncjob, migrator):
+        logging.debug("Cancelling batch migration")
+        migrator.cancel()
+        asyncjob.job_canceled = True
+
+    def _async_evacuate(self, asyncjob, migrator):
+        meter = asyncjob.get_meter()
+        migrator.add_running_domains()
+        migrator.run(meter=meter)
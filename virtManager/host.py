@@ -56,6 +56,7 @@ class vmmHost(vmmGObjectUI):
         "action-exit-app": (GObject.SignalFlags.RUN_FIRST, None, []),
         "action-view-manager": (GObject.SignalFlags.RUN_FIRST, None, []),
         "action-restore-domain": (GObject.SignalFlags.RUN_FIRST, None, [str]),
+        "action-evacuate-host": (GObject.SignalFlags.RUN_FIRST, None, [str]),
         "host-closed": (GObject.SignalFlags.RUN_FIRST, None, []),
         "host-opened": (GObject.SignalFlags.RUN_FIRST, None, []),
     }
@@ -75,7 +76,6 @@ class vmmHost(vmmGObjectUI):
         self.addvol = None
         self.addinterface = None
         self.volmenu = None
-        self._in_refresh = False
 
         self.active_edits = []
 
@@ -95,6 +95,7 @@ class vmmHost(vmmGObjectUI):
             "on_host_page_switch": self.page_changed,
 
             "on_menu_restore_saved_activate": self.restore_domain,
+            "on_menu_evacuate_activate": self.evacuate_host,
 
             "on_net_add_clicked": self.add_network,
             "on_net_delete_clicked": self.delete_network,
@@ -144,6 +145,7 @@ class vmmHost(vmmGObjectUI):
         self.conn.connect("pool-removed", self.repopulate_storage_pools)
         self.conn.connect("pool-started", self.refresh_storage_pool)
         self.conn.connect("pool-stopped", self.refresh_storage_pool)
+        self.conn.connect("pool-refreshed", self.storage_pool_refreshed)
 
         self.conn.connect("interface-added", self.repopulate_interfaces)
         self.conn.connect("interface-removed", self.repopulate_interfaces)
@@ -348,6 +350,9 @@ class vmmHost(vmmGObjectUI):
     def restore_domain(self, src_ignore):
         self.emit("action-restore-domain", self.conn.get_uri())
 
+    def evacuate_host(self, src_ignore):
+        self.emit("action-evacuate-host", self.conn.get_uri())
+
     def exit_app(self, src_ignore):
         self.emit("action-exit-app")
 
@@ -390,6 +395,7 @@ class vmmHost(vmmGObjectUI):
     def conn_state_changed(self, ignore1=None):
         conn_active = (self.conn.get_state() == vmmConnection.STATE_ACTIVE)
         self.widget("menu_file_restore_saved").set_sensitive(conn_active)
+        self.widget("menu_file_evacuate").set_sensitive(conn_active)
         self.widget("net-add").set_sensitive(conn_active and
             self.conn.is_network_capable())
         self.widget("pool-add").set_sensitive(conn_active and
@@ -732,26 +738,18 @@ class vmmHost(vmmGObjectUI):
                             _("Error deleting pool '%s'") % pool.get_name())
 
     def pool_refresh(self, src_ignore):
-        if self._in_refresh:
-            logging.debug("Already refreshing the pool, skipping")
-            return
-
         pool = self.current_pool()
         if pool is None:
             return
 
-        self._in_refresh = True
-
-        def cb():
-            try:
-                pool.refresh()
-                self.idle_add(self.refresh_current_pool)
-            finally:
-                self._in_refresh = False
+        def cb(error):
+            if error:
+                self.err.show_err(_("Error refreshing pool '%s'") %
+                                  pool.get_name(), details=str(error))
 
+        # Duplicate requests for a pool are merged by the refresh queue
         logging.debug("Refresh pool '%s'", pool.get_name())
-        vmmAsyncJob.simple_async_noshow(cb, [], self,
-                            _("Error refreshing pool '%s'") % pool.get_name())
+        pool.refresh_async(cb)
 
     def delete_vol(self, src_ignore):
         vol = self.current_vol()
@@ -804,8 +802,8 @@ class vmmHost(vmmGObjectUI):
         cp = self.current_pool()
         if cp is None:
             return
-        cp.refresh()
-        self.refresh_storage_pool(None, cp.get_uuid())
+        # UI is updated by the pool-refreshed signal
+        cp.refresh_async()
 
     def current_pool(self):
         model, _iter = self.widget("pool-list").get_selection().get_selected()
@@ -937,6 +935,13 @@ class vmmHost(vmmGObjectUI):
         # update vol list
         self.pool_selected(self.widget("pool-list").get_selection())
 
+    def storage_pool_refreshed(self, src_ignore, uuid):
+        refresh_pool_in_list(self.widget("pool-list"), self.conn, uuid)
+        curpool = self.current_pool()
+        if not curpool or curpool.get_uuid() != uuid:
+            return
+        self.populate_pool_state(uuid)
+
     def reset_pool_state(self):
         self.widget("pool-details").set_sensitive(False)
         self.widget("pool-name").set_text("")
@@ -1308,10 +1313,15 @@ def populate_storage_pools(pool_list, conn, curpool):
 
 
 def populate_storage_volumes(list_widget, pool, sensitive_cb):
-    vols = pool and pool.get_volumes() or {}
+    """
+    Sync the volume list with the pool's cached volumes. Existing rows
+    are updated in place rather than rebuilding the whole list, so
+    refreshing a large pool doesn't reset the view and selection.
+    """
+    vols = pool and pool.get_volumes(refresh=False) or {}
     model = list_widget.get_model()
-    model.clear()
 
+    rows = {}
     for key in vols.keys():
         vol = vols[key]
 
@@ -1340,7 +1350,22 @@ def populate_storage_volumes(list_widget, pool, sensitive_cb):
         row = [key, name, cap, fmt, namestr]
         if sensitive_cb:
             row.append(sensitive_cb(fmt))
-        model.append(row)
+        rows[key] = row
+
+    _iter = model.get_iter_first()
+    while _iter:
+        key = model[_iter][0]
+        row = rows.pop(key, None)
+        if row is None:
+            if not model.remove(_iter):
+                _iter = None
+            continue
+        if list(model[_iter]) != row:
+            model[_iter] = row
+        _iter = model.iter_next(_iter)
+
+    for key in sorted(rows.keys()):
+        model.append(rows[key])
 
 
 def get_pool_size_percent(conn, uuid):
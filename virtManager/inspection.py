@@ -19,15 +19,79 @@
 
 from Queue import Queue, Empty
 from threading import Thread
+import cPickle
+import ctypes
+import errno
 import logging
 import os
+import platform
 import re
+import stat
 
 from guestfs import GuestFS  # pylint: disable=F0401
 
 from virtManager.baseclass import vmmGObject
 from virtManager.domain import vmmInspectionData
 
+# Bump when the contents of vmmInspectionData change
+_CACHE_VERSION = 1
+_CACHE_FILENAME = "inspection.cache"
+
+# ioprio_set(2) isn't wrapped by python or glibc
+_IOPRIO_SYSCALLS = {
+    "x86_64": 251,
+    "i386": 289,
+    "i686": 289,
+    "aarch64": 30,
+    "ppc64": 273,
+    "ppc64le": 273,
+    "s390x": 282,
+}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_IDLE = 3
+_IOPRIO_CLASS_SHIFT = 13
+
+
+def _disk_identity(path):
+    """
+    What we trust to mean a disk's contents haven't changed. Writes
+    don't update the mtime of a block device node, so we can only go
+    by size there.
+    """
+    st = os.stat(path)
+    if stat.S_ISBLK(st.st_mode):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            size = os.lseek(fd, 0, os.SEEK_END)
+        finally:
+            os.close(fd)
+        return (path, size, None)
+    return (path, st.st_size, int(st.st_mtime))
+
+
+def _lower_priority(nice):
+    """
+    Lower the CPU and IO priority of the calling thread. On Linux both
+    are per thread and inherited by children, so this also covers the
+    appliance libguestfs launches from the thread.
+    """
+    try:
+        os.nice(nice)
+    except OSError:
+        logging.debug("Error setting inspection nice level", exc_info=True)
+
+    sysno = _IOPRIO_SYSCALLS.get(platform.machine())
+    if sysno is None:
+        return
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.syscall(sysno, _IOPRIO_WHO_PROCESS, 0,
+                        _IOPRIO_CLASS_IDLE << _IOPRIO_CLASS_SHIFT) != 0:
+            logging.debug("Error setting inspection IO priority: %s",
+                          os.strerror(ctypes.get_errno()))
+    except Exception:
+        logging.debug("Error setting inspection IO priority", exc_info=True)
+
 
 class vmmInspection(vmmGObject):
     # Can't find a way to make Thread release our reference
@@ -41,6 +105,8 @@ class vmmInspection(vmmGObject):
         self._wait = 5 * 1000  # 5 seconds
 
         self._q = Queue()
+        self._work = Queue()
+        self._workers = []
         self._conns = {}
         self._vmseen = {}
         self._cached_data = {}
@@ -48,6 +114,8 @@ class vmmInspection(vmmGObject):
     def _cleanup(self):
         self._thread = None
         self._q = Queue()
+        self._work = Queue()
+        self._workers = []
         self._conns = {}
         self._vmseen = {}
         self._cached_data = {}
@@ -76,6 +144,16 @@ class vmmInspection(vmmGObject):
         # interactivity (although it shouldn't affect interactivity at
         # all).
         def cb():
+            nworkers = max(1, self.config.get_inspection_workers())
+            nice = self.config.get_inspection_nice()
+            logging.debug("Starting %d inspection workers, nice=%d",
+                          nworkers, nice)
+            for idx in range(nworkers):
+                t = Thread(name="inspection worker %d" % idx,
+                           target=self._worker, args=(nice,))
+                t.daemon = True
+                t.start()
+                self._workers.append(t)
             self._thread.start()
             return 0
 
@@ -87,6 +165,13 @@ class vmmInspection(vmmGObject):
             self._process_queue()
             self._process_vms()
 
+    def _worker(self, nice):
+        _lower_priority(nice)
+        while True:
+            conn, vm, key = self._work.get()
+            self._inspect_vm(conn, vm, key)
+            self._work.task_done()
+
     # Process everything on the queue.  If the queue is empty when
     # called, block.
     def _process_queue(self):
@@ -115,24 +200,25 @@ class vmmInspection(vmmGObject):
             # Nothing - just a signal for the inspection thread to wake up.
             pass
 
-    # Any VMs we've not seen yet?  If so, process them.
+    # Any VMs we've not seen yet, or whose disks changed since we
+    # looked?  If so, hand them to the workers.
     def _process_vms(self):
         for conn in self._conns.itervalues():
             for vmuuid in conn.list_vm_uuids():
                 if not conn.is_active():
                     break
 
-                def set_inspection_error(vm):
-                    data = vmmInspectionData()
-                    data.error = True
-                    self._set_vm_inspection_data(vm, data)
-
                 prettyvm = vmuuid
                 try:
                     vm = conn.get_vm(vmuuid)
                     prettyvm = conn.get_uri() + ":" + vm.get_name()
+                    key = self._get_cache_key(vm)
 
-                    if vmuuid in self._vmseen:
+                    # Disks of running VMs change all the time, only
+                    # look at them again on the next launch
+                    seen = vmuuid in self._vmseen
+                    if seen and (vm.is_active() or
+                                 self._vmseen[vmuuid] == key):
                         data = self._cached_data.get(vmuuid)
                         if not data:
                             continue
@@ -143,52 +229,128 @@ class vmmInspection(vmmGObject):
                         continue
 
                     # Whether success or failure, we've "seen" this VM now.
-                    self._vmseen[vmuuid] = True
-                    try:
-                        data = self._process(conn, vm, vmuuid)
-                        if data:
-                            self._set_vm_inspection_data(vm, data)
-                        else:
-                            set_inspection_error(vm)
-                    except:
-                        set_inspection_error(vm)
-                        raise
+                    self._vmseen[vmuuid] = key
+                    self._work.put((conn, vm, key))
                 except:
                     logging.exception("%s: exception while processing",
                                       prettyvm)
 
-    def _process(self, conn, vm, vmuuid):
-        if re.search(r"^guestfs-", vm.get_name()):
-            logging.debug("ignore libvirt/guestfs temporary VM %s",
-                          vm.get_name())
-            return None
+    def _inspect_vm(self, conn, vm, key):
+        def set_inspection_error(vm):
+            data = vmmInspectionData()
+            data.error = True
+            self._set_vm_inspection_data(vm, data)
 
-        g = GuestFS(close_on_exit=False)
-        prettyvm = conn.get_uri() + ":" + vm.get_name()
-        ignore = vmuuid
+        prettyvm = vm.get_uuid()
+        try:
+            prettyvm = conn.get_uri() + ":" + vm.get_name()
+
+            data = key and self._load_cache(vm, key)
+            if data:
+                logging.debug("%s: using inspection data cached on disk",
+                              prettyvm)
+                self._set_vm_inspection_data(vm, data)
+                return
 
+            try:
+                data = self._process(conn, vm)
+                if data:
+                    self._set_vm_inspection_data(vm, data)
+                    if key:
+                        self._save_cache(vm, key, data)
+                else:
+                    set_inspection_error(vm)
+            except:
+                set_inspection_error(vm)
+                raise
+        except:
+            logging.exception("%s: exception while processing", prettyvm)
+
+    def _get_inspect_disks(self, vm):
         disks = []
         for disk in vm.get_disk_devices():
             if (disk.path and
                 (disk.type == "block" or disk.type == "file") and
                 not disk.device == "cdrom"):
                 disks.append(disk)
+        return disks
+
+    ##########################
+    # On disk results cache  #
+    ##########################
 
+    def _get_cache_key(self, vm):
+        """
+        Identity of the VM's disks, or None if we can't tell
+        """
+        try:
+            return tuple([_disk_identity(disk.path) for disk in
+                          self._get_inspect_disks(vm)])
+        except (IOError, OSError):
+            return None
+
+    def _load_cache(self, vm, key):
+        path = vm.get_uuid()
+        try:
+            path = os.path.join(vm.get_cache_dir(), _CACHE_FILENAME)
+            f = open(path, "rb")
+            try:
+                version, cachekey, datadict = cPickle.load(f)
+            finally:
+                f.close()
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                logging.debug("Error reading %s", path, exc_info=True)
+            return None
+        except Exception:
+            logging.debug("Error reading %s", path, exc_info=True)
+            return None
+
+        if version != _CACHE_VERSION or cachekey != key:
+            return None
+        data = vmmInspectionData()
+        data.__dict__.update(datadict)
+        return data
+
+    def _save_cache(self, vm, key, data):
+        path = vm.get_uuid()
+        try:
+            path = os.path.join(vm.get_cache_dir(), _CACHE_FILENAME)
+            tmp = path + ".tmp"
+            f = open(tmp, "wb")
+            try:
+                cPickle.dump((_CACHE_VERSION, key, data.__dict__), f,
+                             cPickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            logging.debug("Error writing %s", path, exc_info=True)
+
+    def _process(self, conn, vm):
+        if re.search(r"^guestfs-", vm.get_name()):
+            logging.debug("ignore libvirt/guestfs temporary VM %s",
+                          vm.get_name())
+            return None
+
+        prettyvm = conn.get_uri() + ":" + vm.get_name()
+
+        disks = self._get_inspect_disks(vm)
         if not disks:
             logging.debug("%s: nothing to inspect", prettyvm)
             return None
 
-        # Add the disks.  Note they *must* be added with readonly flag set.
         for disk in disks:
-            path = disk.path
-            driver_type = disk.driver_type
-
-            if not (os.path.exists(path) and os.access(path, os.R_OK)):
+            if not (os.path.exists(disk.path) and
+                    os.access(disk.path, os.R_OK)):
                 logging.debug("%s: cannot access '%s', skipping inspection",
-                              prettyvm, path)
+                              prettyvm, disk.path)
                 return None
 
-            g.add_drive_opts(path, readonly=1, format=driver_type)
+        # Add the disks.  Note they *must* be added with readonly flag set.
+        g = GuestFS(close_on_exit=False)
+        for disk in disks:
+            g.add_drive_opts(disk.path, readonly=1, format=disk.driver_type)
 
         g.launch()
 
@@ -268,7 +430,7 @@ class vmmInspection(vmmGObject):
             logging.debug("# apps: %d", len(apps))
 
         data = vmmInspectionData()
-        data.type = str(type)
+        data.type = str(typ)
         data.distro = str(distro)
         data.major_version = int(major_version)
         data.minor_version = int(minor_version)
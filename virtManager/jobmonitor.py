@@ -0,0 +1,264 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import logging
+import threading
+import time
+
+import libvirt
+
+from virtManager.baseclass import vmmGObject
+
+# Bounds for the poll interval, in seconds. We poll quickly while a job
+# is starting up or close to finishing, and back off for long jobs.
+_MIN_INTERVAL = .25
+_MAX_INTERVAL = 2.0
+_DEFAULT_INTERVAL = .5
+# How many polls we want over the remaining time of the shortest job
+_POLLS_PER_ETA = 10
+# Weight of the newest sample in the throughput average
+_RATE_WEIGHT = .3
+
+
+class vmmMonitoredJob(object):
+    """
+    A save or migrate job registered with vmmJobMonitor
+    """
+    def __init__(self, vm, meter, progtext, thread):
+        self.vm = vm
+        self.meter = meter
+        self.progtext = progtext
+        # The job is over when the thread that started it is done
+        self.thread = thread
+        self.completed = False
+
+        self.data_total = 0
+        self.data_processed = 0
+        self._last_time = None
+        self._rate = 0
+
+    def _get_throughput(self):
+        """
+        Average bytes/second transferred over the last few polls
+        """
+        return self._rate
+    throughput = property(_get_throughput)
+
+    def _get_eta(self):
+        """
+        Estimated seconds until the job finishes, or None if unknown
+        """
+        if not self._rate or not self.data_total:
+            return None
+        return max(0, self.data_total - self.data_processed) / self._rate
+    eta = property(_get_eta)
+
+    def is_finished(self):
+        return self.completed or not self.thread.isAlive()
+
+    def update(self, data_total, data_processed, now=None):
+        """
+        Record a new jobinfo sample and push it to the meter. Returns
+        True if the job made progress.
+        """
+        if now is None:
+            now = time.time()
+        if not data_total:
+            # Job hasn't started yet
+            return False
+
+        progressed = data_processed > self.data_processed
+        if self._last_time is not None and now > self._last_time:
+            rate = ((data_processed - self.data_processed) /
+                    (now - self._last_time))
+            if self._rate:
+                rate = (_RATE_WEIGHT * rate +
+                        (1 - _RATE_WEIGHT) * self._rate)
+            self._rate = max(0, rate)
+
+        self._last_time = now
+        self.data_total = data_total
+        self.data_processed = data_processed
+
+        if not self.meter.started:
+            self.meter.start(size=data_total, text=self.progtext)
+        self.meter.update(data_processed)
+        return progressed
+
+
+class vmmJobMonitor(vmmGObject):
+    """
+    Polls the progress of every save/migrate job running on a connection
+    from a single thread, rather than a thread per job. The poll interval
+    adapts to how fast the jobs are moving, and if libvirt supports job
+    completion events we stop polling a job as soon as it's done.
+    """
+    def __init__(self, conn):
+        vmmGObject.__init__(self)
+
+        self.conn = conn
+        self._jobs = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._event_id = None
+
+    def _cleanup(self):
+        self._deregister_events()
+        self._lock.acquire()
+        try:
+            self._jobs = []
+        finally:
+            self._lock.release()
+        self._wakeup.set()
+        self.conn = None
+
+    def add_job(self, vm, meter, progtext):
+        """
+        Report progress of @vm's job to @meter until the calling thread,
+        which is expected to be blocked in the save/migrate call, exits.
+        """
+        job = vmmMonitoredJob(vm, meter, progtext,
+                              threading.currentThread())
+
+        self._lock.acquire()
+        try:
+            self._jobs.append(job)
+            if not self._thread or not self._thread.isAlive():
+                self._register_events()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="job monitor %s" % self.conn.get_uri())
+                self._thread.daemon = True
+                self._thread.start()
+        finally:
+            self._lock.release()
+
+        self._wakeup.set()
+        return job
+
+    def get_jobs(self):
+        self._lock.acquire()
+        try:
+            return self._jobs[:]
+        finally:
+            self._lock.release()
+
+
+    ###################
+    # Job completions #
+    ###################
+
+    def _register_events(self):
+        if self._event_id is not None:
+            return
+        if (not hasattr(libvirt, "VIR_DOMAIN_EVENT_ID_JOB_COMPLETED") or
+            not self.conn.check_support(
+                self.conn.SUPPORT_CONN_JOB_COMPLETED_EVENT)):
+            return
+
+        try:
+            self._event_id = self.conn.get_backend().domainEventRegisterAny(
+                None, libvirt.VIR_DOMAIN_EVENT_ID_JOB_COMPLETED,
+                self._job_completed_cb, None)
+            logging.debug("%s: using job completed events",
+                          self.conn.get_uri())
+        except Exception, e:
+            logging.debug("Unable to register job completed events: %s", e)
+
+    def _deregister_events(self):
+        if self._event_id is None:
+            return
+
+        try:
+            self.conn.get_backend().domainEventDeregisterAny(self._event_id)
+        except Exception, e:
+            logging.debug("Error deregistering job completed events: %s", e)
+        self._event_id = None
+
+    def _job_completed_cb(self, conn, dom, params, opaque):
+        ignore = conn
+        ignore = opaque
+        # Called from the libvirt event loop thread
+        uuid = dom.UUIDString()
+        for job in self.get_jobs():
+            if job.vm.get_uuid() != uuid:
+                continue
+
+            data_total = params.get("data_total", job.data_total)
+            job.update(data_total, params.get("data_processed", data_total))
+            job.completed = True
+        self._wakeup.set()
+
+
+    ###########
+    # Polling #
+    ###########
+
+    def _poll_job(self, job, now):
+        try:
+            jobinfo = job.vm.job_info()
+        except Exception, e:
+            logging.debug("Error calling jobinfo for %s: %s",
+                          job.vm.get_name(), e)
+            job.completed = True
+            return False
+
+        data_total = float(jobinfo[3])
+        data_remaining = float(jobinfo[5])
+        return job.update(data_total, data_total - data_remaining, now)
+
+    def _get_interval(self, jobs, progressed, interval):
+        if not [job for job in jobs if job.data_total]:
+            # Nothing has started yet
+            return _DEFAULT_INTERVAL
+        if not progressed:
+            # Jobs are stuck, or the guest is dirtying memory as fast as
+            # we send it. Back off.
+            return min(_MAX_INTERVAL, interval * 2)
+
+        etas = [job.eta for job in jobs if job.eta is not None]
+        if not etas:
+            return _DEFAULT_INTERVAL
+        return max(_MIN_INTERVAL,
+                   min(_MAX_INTERVAL, min(etas) / _POLLS_PER_ETA))
+
+    def _run(self):
+        interval = _MIN_INTERVAL
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+
+            self._lock.acquire()
+            try:
+                self._jobs = [job for job in self._jobs
+                              if not job.is_finished()]
+                jobs = self._jobs[:]
+                if not jobs:
+                    self._thread = None
+                    return
+            finally:
+                self._lock.release()
+
+            now = time.time()
+            progressed = False
+            for job in jobs:
+                if self._poll_job(job, now):
+                    progressed = True
+            interval = self._get_interval(jobs, progressed, interval)
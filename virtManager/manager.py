@@ -29,6 +29,7 @@ from gi.repository import GdkPixbuf
 
 from virtinst import util
 
+from virtManager import module_trace
 from virtManager import sharedui
 from virtManager import uiutil
 from virtManager.connection import vmmConnection
@@ -92,6 +93,7 @@ class vmmManager(vmmGObjectUI):
         "action-show-connect": (GObject.SignalFlags.RUN_FIRST, None, []),
         "action-show-domain": (GObject.SignalFlags.RUN_FIRST, None, [str, str]),
         "action-show-about": (GObject.SignalFlags.RUN_FIRST, None, []),
+        "action-show-profiler": (GObject.SignalFlags.RUN_FIRST, None, []),
         "action-show-host": (GObject.SignalFlags.RUN_FIRST, None, [str]),
         "action-show-preferences": (GObject.SignalFlags.RUN_FIRST, None, []),
         "action-show-create": (GObject.SignalFlags.RUN_FIRST, None, [str]),
@@ -105,6 +107,7 @@ class vmmManager(vmmGObjectUI):
         "action-save-domain": (GObject.SignalFlags.RUN_FIRST, None, [str, str]),
         "action-migrate-domain": (GObject.SignalFlags.RUN_FIRST, None, [str, str]),
         "action-delete-domain": (GObject.SignalFlags.RUN_FIRST, None, [str, str]),
+        "action-delete-domains": (GObject.SignalFlags.RUN_FIRST, None, [object]),
         "action-clone-domain": (GObject.SignalFlags.RUN_FIRST, None, [str, str]),
         "action-exit-app": (GObject.SignalFlags.RUN_FIRST, None, []),
         "manager-closed": (GObject.SignalFlags.RUN_FIRST, None, []),
@@ -121,12 +124,15 @@ class vmmManager(vmmGObjectUI):
         # Mapping of VM UUID -> tree model rows to
         # allow O(1) access instead of O(n)
         self.rows = {}
+        # VM row key -> (thumbnail path, pixbuf) for hover previews
+        self._thumbnails = {}
 
         w, h = self.config.get_manager_window_size()
         self.topwin.set_default_size(w or 550, h or 550)
         self.prev_position = None
 
-        self.vmmenu = sharedui.VMActionMenu(self, self.current_vm)
+        self.vmmenu = sharedui.VMActionMenu(self, self.current_vm,
+                                            current_vms_cb=self.current_vms)
         self.connmenu = Gtk.Menu()
         self.connmenu_items = {}
 
@@ -163,8 +169,13 @@ class vmmManager(vmmGObjectUI):
 
             "on_menu_edit_preferences_activate": self.show_preferences,
             "on_menu_help_about_activate": self.show_about,
+            "on_menu_help_profiler_activate": self.show_profiler,
         })
 
+        # Only useful when started with --profile
+        self.widget("menu_help_profiler").set_visible(
+            bool(module_trace.profiler))
+
         # There seem to be ref counting issues with calling
         # list.get_column, so avoid it
         self.diskcol = None
@@ -232,6 +243,7 @@ class vmmManager(vmmGObjectUI):
 
     def _cleanup(self):
         self.rows = None
+        self._thumbnails = None
 
         self.diskcol = None
         self.guestcpucol = None
@@ -349,7 +361,9 @@ class vmmManager(vmmGObjectUI):
 
         model = Gtk.TreeStore(*rowtypes)
         vmlist.set_model(model)
-        vmlist.set_tooltip_column(ROW_HINT)
+        vmlist.set_has_tooltip(True)
+        vmlist.connect("query-tooltip", self._vmlist_query_tooltip)
+        vmlist.get_selection().set_mode(Gtk.SelectionMode.MULTIPLE)
         vmlist.set_headers_visible(True)
         vmlist.set_level_indentation(
                 -(_style_get_prop(vmlist, "expander-size") + 3))
@@ -423,15 +437,29 @@ class vmmManager(vmmGObjectUI):
     ##################
 
     def current_row(self):
+        """
+        Return the selected row, or None if zero or multiple rows
+        are selected
+        """
         vmlist = self.widget("vm-list")
         selection = vmlist.get_selection()
-        active = selection.get_selected()
+        treestore, paths = selection.get_selected_rows()
 
-        treestore, treeiter = active
-        if treeiter is not None:
-            return treestore[treeiter]
+        if len(paths) == 1:
+            return treestore[paths[0]]
         return None
 
+    def current_vms(self):
+        """
+        Return every VM in the current selection
+        """
+        vmlist = self.widget("vm-list")
+        selection = vmlist.get_selection()
+        treestore, paths = selection.get_selected_rows()
+
+        return [treestore[path][ROW_HANDLE] for path in paths
+                if not treestore[path][ROW_IS_CONN]]
+
     def current_vm(self):
         row = self.current_row()
         if not row or row[ROW_IS_CONN]:
@@ -495,6 +523,9 @@ class vmmManager(vmmGObjectUI):
     def show_about(self, src_ignore):
         self.emit("action-show-about")
 
+    def show_profiler(self, src_ignore):
+        self.emit("action-show-profiler")
+
     def show_preferences(self, src_ignore):
         self.emit("action-show-preferences")
 
@@ -515,6 +546,12 @@ class vmmManager(vmmGObjectUI):
                 self.emit("action-show-host", conn.get_uri())
 
     def do_delete(self, ignore=None):
+        vms = self.current_vms()
+        if len(vms) > 1:
+            self.emit("action-delete-domains",
+                      [(vm.conn.get_uri(), vm.get_uuid()) for vm in vms])
+            return
+
         conn = self.current_conn()
         vm = self.current_vm()
         if vm is None:
@@ -605,6 +642,7 @@ class vmmManager(vmmGObjectUI):
         vm.connect("status-changed", self.vm_status_changed)
         vm.connect("resources-sampled", self.vm_row_updated)
         vm.connect("inspection-changed", self.vm_inspection_changed)
+        vm.connect("thumbnail-changed", self.vm_thumbnail_changed)
 
         vmlist = self.widget("vm-list")
         model = vmlist.get_model()
@@ -725,6 +763,7 @@ class vmmManager(vmmGObjectUI):
         # add the connection to the treeModel
         vmlist = self.widget("vm-list")
         row = self._append_conn(vmlist.get_model(), conn)
+        vmlist.get_selection().unselect_all()
         vmlist.get_selection().select_iter(row)
 
         # Try to make sure that 2 row descriptions don't collide
@@ -830,6 +869,52 @@ class vmmManager(vmmGObjectUI):
 
         self.vm_row_updated(vm)
 
+    def vm_thumbnail_changed(self, vm):
+        self._thumbnails.pop(self.vm_row_key(vm), None)
+
+    def _get_thumbnail_pixbuf(self, vm):
+        path = vm.get_thumbnail()
+        if not path:
+            return None
+
+        key = self.vm_row_key(vm)
+        cached = self._thumbnails.get(key)
+        if cached and cached[0] == path:
+            return cached[1]
+
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+        except:
+            logging.debug("Error loading thumbnail %s", path, exc_info=True)
+            pixbuf = None
+        self._thumbnails[key] = (path, pixbuf)
+        return pixbuf
+
+    def _vmlist_query_tooltip(self, vmlist, x, y, keyboard_mode, tooltip):
+        if keyboard_mode:
+            path = vmlist.get_cursor()[0]
+        else:
+            x, y = vmlist.convert_widget_to_bin_window_coords(x, y)
+            pathinfo = vmlist.get_path_at_pos(x, y)
+            path = pathinfo and pathinfo[0] or None
+        if path is None:
+            return False
+
+        row = vmlist.get_model()[path]
+        hint = row[ROW_HINT]
+        pixbuf = None
+        if row[ROW_IS_VM]:
+            pixbuf = self._get_thumbnail_pixbuf(row[ROW_HANDLE])
+        if not hint and not pixbuf:
+            return False
+
+        # Hints are markup, as they were for set_tooltip_column
+        tooltip.set_markup(hint or
+                           util.xml_escape(row[ROW_HANDLE].get_name()))
+        tooltip.set_icon(pixbuf)
+        vmlist.set_tooltip_row(tooltip, path)
+        return True
+
     def conn_state_changed(self, conn, newname=None):
         row = self.rows[conn.get_uri()]
         if newname:
@@ -908,9 +993,14 @@ class vmmManager(vmmGObjectUI):
             return False
 
         vmlist = self.widget("vm-list")
-        treeselection = vmlist.get_selection()
-        model, _iter = treeselection.get_selected()
-        self.popup_vm_menu(model, _iter, event)
+        if len(self.current_vms()) > 1:
+            self.popup_multi_vm_menu(event)
+            return True
+
+        row = self.current_row()
+        if row is None:
+            return False
+        self.popup_vm_menu(vmlist.get_model(), row.iter, event)
         return True
 
     def popup_vm_menu_button(self, widget, event):
@@ -924,9 +1014,21 @@ class vmmManager(vmmGObjectUI):
         model = widget.get_model()
         _iter = model.get_iter(path)
 
+        if (widget.get_selection().path_is_selected(path) and
+            len(self.current_vms()) > 1):
+            # Keep the selection, instead of letting the click
+            # select just this row
+            self.popup_multi_vm_menu(event)
+            return True
+
         self.popup_vm_menu(model, _iter, event)
         return False
 
+    def popup_multi_vm_menu(self, event):
+        self.vmmenu.update_multi_widget_states()
+        self.vmmenu.popup(  # pylint: disable=E1101
+            None, None, None, None, 0, event.time)
+
     def popup_vm_menu(self, model, _iter, event):
         if model.iter_parent(_iter) is not None:
             # Popup the vm menu
@@ -75,6 +75,7 @@ class vmmMediaDevice(vmmGObject):
         self.nodedev_obj = nodedev_obj
         self.do_poll = False
         self.last_tick = 0
+        self._last_xml = None
 
     def _cleanup(self):
         pass
@@ -130,6 +131,11 @@ class vmmMediaDevice(vmmGObject):
             # Assume the device was removed
             return
 
+        # Nothing changed, don't bother parsing it again
+        if xml == self._last_xml:
+            return
+        self._last_xml = xml
+
         try:
             vobj = NodeDevice.parse(self.nodedev_obj.conn.get_backend(), xml)
             has_media = vobj.media_available or False
@@ -25,6 +25,7 @@
 import logging
 import time
 import re
+import threading
 import traceback
 
 from types import FunctionType
@@ -77,3 +78,205 @@ def wrap_module(module, regex=None, tb=False):
             wrap_func(module, obj, tb)
         if type(obj) is ClassType or type(obj) is type:
             wrap_class(obj, tb)
+
+
+#############################
+# Aggregating tick profiler #
+#############################
+
+# Invoke this with virt-manager --profile. Instead of logging every call,
+# libvirt API latency is aggregated per connection, object type and API,
+# alongside connection tick timings and main loop callback stats. A
+# summary is logged periodically and shown in Help->Profiler.
+
+# The profiler instance when profiling is enabled, None otherwise
+profiler = None
+
+# Latency samples kept per key for percentile calculation
+_MAX_SAMPLES = 1000
+
+
+class _Stats(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = []
+        self._pos = 0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+        # Ring buffer of the most recent samples
+        if len(self._samples) < _MAX_SAMPLES:
+            self._samples.append(elapsed)
+        else:
+            self._samples[self._pos] = elapsed
+            self._pos = (self._pos + 1) % _MAX_SAMPLES
+
+    def percentile(self, pct):
+        if not self._samples:
+            return 0.0
+        samples = sorted(self._samples)
+        idx = min(len(samples) - 1, int(len(samples) * pct / 100.0))
+        return samples[idx]
+
+
+class Profiler(object):
+    """
+    Thread safe collection of timing stats. Times are in seconds.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn_uris = {}
+        self.reset()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self.start_time = time.time()
+            # (uri, objtype, api) -> _Stats
+            self.api_stats = {}
+            # (uri, section) -> _Stats
+            self.tick_stats = {}
+            # callback name -> _Stats
+            self.mainloop_stats = {}
+            self.idle_depth = 0
+            self.idle_depth_max = 0
+        finally:
+            self._lock.release()
+
+    def _add(self, statsdict, key, elapsed):
+        self._lock.acquire()
+        try:
+            if key not in statsdict:
+                statsdict[key] = _Stats()
+            statsdict[key].add(elapsed)
+        finally:
+            self._lock.release()
+
+    def record_call(self, uri, objtype, api, elapsed):
+        self._add(self.api_stats, (uri, objtype, api), elapsed)
+
+    def record_tick(self, uri, section, elapsed):
+        self._add(self.tick_stats, (uri, section), elapsed)
+
+    def idle_queued(self):
+        self._lock.acquire()
+        try:
+            self.idle_depth += 1
+            self.idle_depth_max = max(self.idle_depth_max, self.idle_depth)
+        finally:
+            self._lock.release()
+
+    def idle_dequeued(self):
+        self._lock.acquire()
+        try:
+            self.idle_depth = max(0, self.idle_depth - 1)
+        finally:
+            self._lock.release()
+
+    def record_mainloop(self, name, elapsed):
+        self._add(self.mainloop_stats, name, elapsed)
+
+    def lookup_uri(self, conn, geturi):
+        """
+        Cached URI of the virConnect @conn, @geturi is the unwrapped
+        getURI so we don't profile ourselves
+        """
+        key = id(conn)
+        if key not in self._conn_uris:
+            try:
+                self._conn_uris[key] = geturi(conn)
+            except Exception:
+                return "unknown"
+        return self._conn_uris[key]
+
+    def _format_table(self, title, statsdict, limit):
+        self._lock.acquire()
+        try:
+            items = [(key, stats.count, stats.total, stats.percentile(99),
+                      stats.max) for key, stats in statsdict.items()]
+        finally:
+            self._lock.release()
+
+        items.sort(key=lambda i: i[2], reverse=True)
+        lines = ["%s:" % title,
+                 "  %8s %10s %9s %9s  %s" %
+                 ("calls", "total ms", "p99 ms", "max ms", "name")]
+        for key, count, total, p99, maxtime in items[:limit]:
+            if type(key) is tuple:
+                key = " ".join([str(k) for k in key])
+            lines.append("  %8d %10.1f %9.2f %9.2f  %s" %
+                         (count, total * 1000, p99 * 1000,
+                          maxtime * 1000, key))
+        if len(items) > limit:
+            lines.append("  ... %d more" % (len(items) - limit))
+        return lines
+
+    def get_summary(self, limit=20):
+        """
+        Text summary of everything recorded, slowest first
+        """
+        lines = ["Profile over the last %.1f seconds" %
+                 (time.time() - self.start_time),
+                 "Idle queue depth: %d, max %d" %
+                 (self.idle_depth, self.idle_depth_max), ""]
+        lines += self._format_table("Connection ticks", self.tick_stats,
+                                    limit)
+        lines.append("")
+        lines += self._format_table("Libvirt APIs", self.api_stats, limit)
+        lines.append("")
+        lines += self._format_table("Main loop callbacks",
+                                    self.mainloop_stats, limit)
+        return "\n".join(lines)
+
+
+def generate_profile_wrapper(origfunc, objtype, name, geturi):
+    def newfunc(obj, *args, **kwargs):
+        start = time.time()
+        try:
+            return origfunc(obj, *args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            if objtype == "virConnect":
+                conn = obj
+            else:
+                conn = getattr(obj, "_conn", None)
+            uri = conn and profiler.lookup_uri(conn, geturi) or "unknown"
+            profiler.record_call(uri, objtype, name, elapsed)
+
+    return newfunc
+
+
+def profile_module(module):
+    """
+    Time every public method of the vir* classes in @module, meant for
+    the libvirt module
+    """
+    geturi = module.virConnect.getURI
+    for clsname in dir(module):
+        classobj = getattr(module, clsname)
+        if (not clsname.startswith("vir") or
+            type(classobj) not in [ClassType, type]):
+            continue
+
+        for name in dir(classobj):
+            if name.startswith("_") or name == "c_pointer":
+                continue
+            methodobj = getattr(classobj, name)
+            if (type(methodobj) is not MethodType or
+                methodobj.im_self is not None):
+                continue
+            setattr(classobj, name,
+                    generate_profile_wrapper(methodobj.im_func, clsname,
+                                             name, geturi))
+
+
+def enable_profiling(module):
+    global profiler
+    logging.debug("Enabling profiling for %s", module.__name__)
+    profiler = Profiler()
+    profile_module(module)
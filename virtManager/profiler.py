@@ -0,0 +1,82 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import logging
+
+# pylint: disable=E0611
+from gi.repository import Pango
+# pylint: enable=E0611
+
+from virtManager import module_trace
+from virtManager.baseclass import vmmGObjectUI
+
+# Milliseconds between refreshes while the window is visible
+REFRESH_INTERVAL = 2000
+
+
+class vmmProfiler(vmmGObjectUI):
+    """
+    Debug window showing the summary collected with virt-manager --profile
+    """
+    def __init__(self):
+        vmmGObjectUI.__init__(self, "profiler.ui", "vmm-profiler")
+        self._timer = None
+
+        self.builder.connect_signals({
+            "on_vmm_profiler_delete_event": self.close,
+            "on_profile_close_clicked": self.close,
+            "on_profile_reset_clicked": self._reset,
+        })
+        self.bind_escape_key_close()
+
+        self.widget("profile-text").override_font(
+            Pango.FontDescription("monospace"))
+
+    def show(self, parent):
+        logging.debug("Showing profiler")
+        self._refresh()
+        if self._timer is None:
+            self._timer = self.timeout_add(REFRESH_INTERVAL, self._refresh)
+        self.topwin.set_transient_for(parent)
+        self.topwin.present()
+
+    def close(self, ignore1=None, ignore2=None):
+        logging.debug("Closing profiler")
+        if self._timer is not None:
+            self.remove_gobject_timeout(self._timer)
+            self._timer = None
+        self.topwin.hide()
+        return 1
+
+    def _cleanup(self):
+        pass
+
+    def _refresh(self):
+        if not module_trace.profiler:
+            text = _("Profiling is not enabled. Start virt-manager "
+                     "with --profile.")
+        else:
+            text = module_trace.profiler.get_summary(limit=50)
+        self.widget("profile-text").get_buffer().set_text(text)
+        return 1
+
+    def _reset(self, ignore):
+        if module_trace.profiler:
+            module_trace.profiler.reset()
+        self._refresh()
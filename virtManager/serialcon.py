@@ -24,6 +24,8 @@ import tty
 import pty
 import fcntl
 import logging
+import re
+import threading
 
 # pylint: disable=E0611
 from gi.repository import Gdk
@@ -36,6 +38,111 @@ import libvirt
 
 from virtManager.baseclass import vmmGObject
 
+# Guest output we queue for the terminal before we stop reading
+_OUTPUT_BUFFER_SIZE = 1024 * 1024
+# Typed input we queue while the stream is busy
+_INPUT_BUFFER_SIZE = 64 * 1024
+# Feed the terminal at most every _FEED_INTERVAL ms, _FEED_MAX_BYTES
+# at a time, so a chatty guest can't starve the main loop
+_FEED_INTERVAL = 40
+_FEED_MAX_BYTES = 256 * 1024
+# Console logs are rotated to .1 when they grow past this
+_LOG_MAX_SIZE = 10 * 1024 * 1024
+
+
+class _RingBuffer(object):
+    """
+    Fixed size byte FIFO. Data is copied in once and handed out as
+    read only buffer() slices of the backing store, so draining the
+    queue doesn't copy what's left behind.
+    """
+    def __init__(self, size):
+        self._buf = bytearray(size)
+        self._size = size
+        self._start = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def free(self):
+        return self._size - self._len
+
+    def write(self, data):
+        """
+        Append as much of @data as fits, return the number of bytes taken
+        """
+        count = min(len(data), self.free())
+        if not count:
+            return 0
+
+        view = memoryview(data)
+        end = (self._start + self._len) % self._size
+        first = min(count, self._size - end)
+        self._buf[end:end + first] = view[:first]
+        if count > first:
+            self._buf[:count - first] = view[first:count]
+        self._len += count
+        return count
+
+    def peek(self, limit=None):
+        """
+        Return the next contiguous chunk of queued data
+        """
+        count = min(self._len, self._size - self._start)
+        if limit is not None:
+            count = min(count, limit)
+        return buffer(self._buf, self._start, count)
+
+    def consume(self, count):
+        self._len -= count
+        self._start = self._len and (self._start + count) % self._size or 0
+
+    def clear(self):
+        self._start = 0
+        self._len = 0
+
+
+class _ConsoleLog(object):
+    """
+    Append only log of everything the guest printed, rotated to
+    @path.1 once it reaches @max_size
+    """
+    def __init__(self, path, max_size=_LOG_MAX_SIZE):
+        self.path = path
+        self._max_size = max_size
+        self._file = None
+        self._size = 0
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "ab")
+        self._size = os.fstat(self._file.fileno()).st_size
+
+    def _rotate(self):
+        self._file.close()
+        os.rename(self.path, self.path + ".1")
+        self._open()
+
+    def write(self, data):
+        if not self._file:
+            return
+        try:
+            if self._size and self._size + len(data) > self._max_size:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+        except (IOError, OSError):
+            logging.exception("Error writing console log %s, disabling it",
+                              self.path)
+            self.close()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+        self._file = None
+
 
 class ConsoleConnection(vmmGObject):
     def __init__(self, vm):
@@ -43,13 +150,101 @@ class ConsoleConnection(vmmGObject):
 
         self.vm = vm
         self.conn = vm.conn
+        self.log = None
+
+        # Guest output may be queued from the libvirt event thread
+        # while the main loop drains it into the terminal
+        self._output = _RingBuffer(_OUTPUT_BUFFER_SIZE)
+        self._output_lock = threading.Lock()
+        self._output_paused = False
+        self._feed_source = None
 
     def _cleanup(self):
         self.close()
 
+        self._output_lock.acquire()
+        try:
+            if self._feed_source:
+                GLib.source_remove(self._feed_source)
+            self._feed_source = None
+            self._output.clear()
+        finally:
+            self._output_lock.release()
+
+        if self.log:
+            self.log.close()
+        self.log = None
+
         self.vm = None
         self.conn = None
 
+    def _pause_reading(self):
+        """
+        The output buffer is full, stop reading from the guest
+        """
+        raise NotImplementedError()
+    def _resume_reading(self):
+        raise NotImplementedError()
+
+    def _output_room(self):
+        """
+        Bytes of guest output we can queue right now
+        """
+        return self._output.free()
+
+    def _queue_output(self, data, terminal):
+        """
+        Queue guest output for the terminal, never more than
+        _output_room() bytes. Pauses reading if the buffer filled up.
+        """
+        if self.log:
+            self.log.write(data)
+
+        self._output_lock.acquire()
+        try:
+            self._output.write(data)
+            if self._feed_source is None:
+                self._feed_source = GLib.timeout_add(_FEED_INTERVAL,
+                    self._feed_terminal, terminal)
+            pause = not self._output.free() and not self._output_paused
+            if pause:
+                self._output_paused = True
+        finally:
+            self._output_lock.release()
+
+        if pause:
+            logging.debug("Console output buffer full, pausing reads")
+            self._pause_reading()
+
+    def _feed_terminal(self, terminal):
+        # Copy out under the lock, feed the terminal without it
+        self._output_lock.acquire()
+        try:
+            chunks = []
+            budget = _FEED_MAX_BYTES
+            while budget and len(self._output):
+                chunk = str(self._output.peek(budget))
+                self._output.consume(len(chunk))
+                budget -= len(chunk)
+                chunks.append(chunk)
+
+            resume = (self._output_paused and
+                      self._output.free() * 2 >= _OUTPUT_BUFFER_SIZE)
+            if resume:
+                self._output_paused = False
+
+            more = bool(len(self._output))
+            if not more:
+                self._feed_source = None
+        finally:
+            self._output_lock.release()
+
+        if chunks:
+            terminal.feed("".join(chunks))
+        if resume and self.is_open():
+            self._resume_reading()
+        return more
+
     def is_open(self):
         raise NotImplementedError()
     def open(self, dev, terminal):
@@ -71,6 +266,19 @@ class LocalConsoleConnection(ConsoleConnection):
         self.fd = None
         self.source = None
         self.origtermios = None
+        self.terminal = None
+
+    def _pause_reading(self):
+        if self.source:
+            GLib.source_remove(self.source)
+        self.source = None
+
+    def _resume_reading(self):
+        if self.source or self.fd is None:
+            return
+        self.source = GLib.io_add_watch(self.fd,
+                            GLib.IO_IN | GLib.IO_ERR | GLib.IO_HUP,
+                            self.display_data, self.terminal)
 
     def is_open(self):
         return self.fd is not None
@@ -86,9 +294,8 @@ class LocalConsoleConnection(ConsoleConnection):
 
         self.fd = pty.slave_open(ipty)
         fcntl.fcntl(self.fd, fcntl.F_SETFL, os.O_NONBLOCK)
-        self.source = GLib.io_add_watch(self.fd,
-                            GLib.IO_IN | GLib.IO_ERR | GLib.IO_HUP,
-                            self.display_data, terminal)
+        self.terminal = terminal
+        self._resume_reading()
 
         # Save term settings & set to raw mode
         self.origtermios = termios.tcgetattr(self.fd)
@@ -109,9 +316,9 @@ class LocalConsoleConnection(ConsoleConnection):
         os.close(self.fd)
         self.fd = None
 
-        GLib.source_remove(self.source)
-        self.source = None
+        self._pause_reading()
         self.origtermios = None
+        self.terminal = None
 
     def send_data(self, src, text, length, terminal):
         ignore = src
@@ -130,9 +337,10 @@ class LocalConsoleConnection(ConsoleConnection):
             self.close()
             return False
 
-        data = os.read(self.fd, 1024)
-        terminal.feed(data)
-        return True
+        data = os.read(self.fd, min(64 * 1024, self._output_room()))
+        self._queue_output(data, terminal)
+        # _queue_output may have paused us already
+        return self.source is not None
 
 
 class LibvirtConsoleConnection(ConsoleConnection):
@@ -141,8 +349,29 @@ class LibvirtConsoleConnection(ConsoleConnection):
 
         self.stream = None
 
-        self.streamToTerminal = ""
-        self.terminalToStream = ""
+        self._input = _RingBuffer(_INPUT_BUFFER_SIZE)
+        self._input_lock = threading.Lock()
+
+    def _update_events(self):
+        """
+        Only ask for the events we can handle: nothing to read while the
+        output buffer is full, nothing to write without queued input
+        """
+        if not self.stream:
+            return
+
+        events = (libvirt.VIR_STREAM_EVENT_ERROR |
+                  libvirt.VIR_STREAM_EVENT_HANGUP)
+        if not self._output_paused:
+            events |= libvirt.VIR_STREAM_EVENT_READABLE
+        if len(self._input):
+            events |= libvirt.VIR_STREAM_EVENT_WRITABLE
+        self.stream.eventUpdateCallback(events)
+
+    def _pause_reading(self):
+        self._update_events()
+    def _resume_reading(self):
+        self._update_events()
 
     def _event_on_stream(self, stream, events, opaque):
         ignore = stream
@@ -154,9 +383,10 @@ class LibvirtConsoleConnection(ConsoleConnection):
             self.close()
             return
 
-        if events & libvirt.VIR_EVENT_HANDLE_READABLE:
+        if (events & libvirt.VIR_EVENT_HANDLE_READABLE and
+            self._output_room()):
             try:
-                got = self.stream.recv(1024 * 100)
+                got = self.stream.recv(min(1024 * 100, self._output_room()))
             except:
                 logging.exception("Error receiving stream data")
                 self.close()
@@ -170,32 +400,31 @@ class LibvirtConsoleConnection(ConsoleConnection):
                 self.close()
                 return
 
-            queued_text = bool(self.streamToTerminal)
-            self.streamToTerminal += got
-            if not queued_text:
-                self.idle_add(self.display_data, terminal)
+            self._queue_output(got, terminal)
 
         if (events & libvirt.VIR_EVENT_HANDLE_WRITABLE and
-            self.terminalToStream):
+            len(self._input)):
 
+            self._input_lock.acquire()
             try:
-                done = self.stream.send(self.terminalToStream)
-            except:
-                logging.exception("Error sending stream data")
+                try:
+                    done = self.stream.send(self._input.peek())
+                except:
+                    logging.exception("Error sending stream data")
+                    done = None
+
+                if done is not None and done != -2:
+                    # -2 is basically EAGAIN
+                    self._input.consume(done)
+            finally:
+                self._input_lock.release()
+
+            if done is None:
                 self.close()
                 return
 
-            if done == -2:
-                # This is basically EAGAIN
-                return
-
-            self.terminalToStream = self.terminalToStream[done:]
-
-        if not self.terminalToStream:
-            self.stream.eventUpdateCallback(libvirt.VIR_STREAM_EVENT_READABLE |
-                                            libvirt.VIR_STREAM_EVENT_ERROR |
-                                            libvirt.VIR_STREAM_EVENT_HANGUP)
-
+        if not len(self._input):
+            self._update_events()
 
     def is_open(self):
         return self.stream is not None
@@ -232,6 +461,7 @@ class LibvirtConsoleConnection(ConsoleConnection):
                 logging.exception("Error finishing stream")
 
         self.stream = None
+        self._input.clear()
 
     def send_data(self, src, text, length, terminal):
         ignore = src
@@ -241,19 +471,16 @@ class LibvirtConsoleConnection(ConsoleConnection):
         if self.stream is None:
             return
 
-        self.terminalToStream += text
-        if self.terminalToStream:
-            self.stream.eventUpdateCallback(libvirt.VIR_STREAM_EVENT_READABLE |
-                                            libvirt.VIR_STREAM_EVENT_WRITABLE |
-                                            libvirt.VIR_STREAM_EVENT_ERROR |
-                                            libvirt.VIR_STREAM_EVENT_HANGUP)
-
-    def display_data(self, terminal):
-        if not self.streamToTerminal:
-            return
+        self._input_lock.acquire()
+        try:
+            queued = self._input.write(text)
+        finally:
+            self._input_lock.release()
 
-        terminal.feed(self.streamToTerminal)
-        self.streamToTerminal = ""
+        if queued < len(text):
+            logging.debug("Console input buffer full, dropped %d bytes",
+                          len(text) - queued)
+        self._update_events()
 
 
 class vmmSerialConsole(vmmGObject):
@@ -308,6 +535,8 @@ class vmmSerialConsole(vmmGObject):
             self.console = LibvirtConsoleConnection(self.vm)
         else:
             self.console = LocalConsoleConnection(self.vm)
+        if self.config.get_console_log_serial():
+            self.console.log = self._open_log()
 
         self.serial_popup = None
         self.serial_copy = None
@@ -324,11 +553,28 @@ class vmmSerialConsole(vmmGObject):
 
         self.vm.connect("status-changed", self.vm_status_changed)
 
+    def _open_log(self):
+        name = re.sub(r"[^\w.-]", "_", self.name)
+        path = os.path.join(self.vm.get_cache_dir(), "console-%s.log" % name)
+        try:
+            log = _ConsoleLog(path)
+            logging.debug("Logging serial console '%s' to %s",
+                          self.name, path)
+            return log
+        except (IOError, OSError):
+            logging.exception("Error opening console log %s", path)
+            return None
+
     def init_terminal(self):
         self.terminal = Vte.Terminal()
         self.terminal.set_cursor_blink_mode(Vte.TerminalCursorBlinkMode.ON)
         self.terminal.set_emulation("xterm")
-        self.terminal.set_scrollback_lines(1000)
+        # With a console log the full history is on disk, so the
+        # terminal only needs to keep a screenful or so around
+        if self.console.log:
+            self.terminal.set_scrollback_lines(200)
+        else:
+            self.terminal.set_scrollback_lines(1000)
         self.terminal.set_audible_bell(False)
         self.terminal.set_visible_bell(True)
         self.terminal.set_backspace_binding(
@@ -60,9 +60,7 @@ def host_disk_space(conn):
 
     avail = 0
     if pool and pool.is_active():
-        # FIXME: make sure not inactive?
-        # FIXME: use a conn specific function after we send pool-added
-        pool.refresh()
+        # Uses the last refresh, see update_host_space
         avail = int(pool.get_available())
 
     elif not conn.is_remote() and os.path.exists(path):
@@ -72,7 +70,7 @@ def host_disk_space(conn):
     return float(avail / 1024.0 / 1024.0 / 1024.0)
 
 
-def update_host_space(conn, widget):
+def _set_host_space_label(conn, widget):
     try:
         max_storage = host_disk_space(conn)
     except:
@@ -88,6 +86,26 @@ def update_host_space(conn, widget):
     widget.set_markup(hd_label)
 
 
+def update_host_space(conn, widget):
+    """
+    Show the space we know about now, and update it once a background
+    refresh of the default pool finishes. Refreshing in the main loop
+    would wait behind every other queued pool refresh.
+    """
+    _set_host_space_label(conn, widget)
+
+    pool = conn.get_default_pool()
+    if not pool or not pool.is_active():
+        return
+
+    def cb(error):
+        if error:
+            logging.debug("Error refreshing default pool: %s", error)
+            return
+        _set_host_space_label(conn, widget)
+    pool.refresh_async(cb)
+
+
 def check_default_pool_active(err, conn):
     default_pool = conn.get_default_pool()
     if default_pool and not default_pool.is_active():
@@ -670,10 +688,15 @@ class _VMMenu(Gtk.Menu):
     # pylint: disable=E1101
     # pylint can't detect functions we inheirit from Gtk, ex self.add
 
-    def __init__(self, src, current_vm_cb, show_open=True):
+    # Actions that can operate on multiple selected VMs at once
+    _multi_actions = ["delete"]
+
+    def __init__(self, src, current_vm_cb, show_open=True,
+                 current_vms_cb=None):
         Gtk.Menu.__init__(self)
         self._parent = src
         self._current_vm_cb = current_vm_cb
+        self._current_vms_cb = current_vms_cb
         self._show_open = show_open
 
         self._init_state()
@@ -700,6 +723,14 @@ class _VMMenu(Gtk.Menu):
         return item
 
     def _action_cb(self, src):
+        if (self._current_vms_cb and
+            src.vmm_widget_name in self._multi_actions):
+            vms = self._current_vms_cb()
+            if len(vms) > 1:
+                self._parent.emit("action-%s-domains" % src.vmm_widget_name,
+                    [(vm.conn.get_uri(), vm.get_uuid()) for vm in vms])
+                return
+
         vm = self._current_vm_cb()
         if not vm:
             return
@@ -781,11 +812,27 @@ class VMActionMenu(_VMMenu):
             name = getattr(child, "vmm_widget_name", None)
             if hasattr(child, "update_widget_states"):
                 child.update_widget_states(vm)
-            if name in statemap:
-                child.set_sensitive(statemap[name])
+            if name is not None:
+                # Undo update_multi_widget_states
+                child.set_sensitive(statemap.get(name, True))
             if name in vismap:
                 child.set_visible(vismap[name])
 
+    def update_multi_widget_states(self):
+        """
+        Several VMs are selected, only offer the actions that can
+        handle all of them at once
+        """
+        for child in self.get_children():
+            name = getattr(child, "vmm_widget_name", None)
+            if name is None:
+                continue
+            child.set_sensitive(name in self._multi_actions)
+            if name == "suspend":
+                child.set_visible(True)
+            elif name == "resume":
+                child.set_visible(False)
+
     def change_run_text(self, text):
         for child in self.get_children():
             if getattr(child, "vmm_widget_name", None) == "run":
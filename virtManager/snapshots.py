@@ -22,7 +22,7 @@ import datetime
 import glob
 import logging
 import os
-import StringIO
+import threading
 
 # pylint: disable=E0611
 from gi.repository import Gdk
@@ -44,6 +44,10 @@ mimemap = {
 }
 
 
+# Largest dimension of the screenshot shown for a snapshot
+_THUMBNAIL_SIZE = 450
+
+
 def _mime_to_ext(val, reverse=False):
     for m, e in mimemap.items():
         if val == m and not reverse:
@@ -63,6 +67,11 @@ class vmmSnapshotPage(vmmGObjectUI):
         self.vm = vm
 
         self._initial_populate = False
+        # Bumped for every list refresh, so a slow background load
+        # doesn't clobber a newer one
+        self._populate_gen = 0
+        # Same for screenshots taken for the new snapshot dialog
+        self._screenshot_gen = 0
 
         self._snapmenu = None
         self._init_ui()
@@ -117,7 +126,7 @@ class vmmSnapshotPage(vmmGObjectUI):
         self.widget("snapshot-new-description").set_buffer(buf)
 
         # [name, row label, tooltip, icon name, sortname]
-        model = Gtk.ListStore(str, str, str, str, str)
+        model = Gtk.TreeStore(str, str, str, str, str)
         model.set_sort_column_id(4, Gtk.SortType.ASCENDING)
 
         col = Gtk.TreeViewColumn("")
@@ -132,14 +141,10 @@ class vmmSnapshotPage(vmmGObjectUI):
         col.add_attribute(txt, 'markup', 1)
         col.add_attribute(img, 'icon-name', 3)
 
-        def _sep_cb(_model, _iter, ignore):
-            return not bool(_model[_iter][0])
-
         slist = self.widget("snapshot-list")
         slist.set_model(model)
         slist.set_tooltip_column(2)
         slist.append_column(col)
-        slist.set_row_separator_func(_sep_cb, None)
 
         # Snapshot popup menu
         menu = Gtk.Menu()
@@ -184,6 +189,22 @@ class vmmSnapshotPage(vmmGObjectUI):
             pass
         return None
 
+    def _get_screenshot_basename(self, name):
+        return os.path.join(self.vm.get_cache_dir(),
+                            "snap-screenshot-%s" % name)
+
+    def _get_thumbnail_path(self, name):
+        return os.path.join(self.vm.get_cache_dir(),
+                            "snap-thumbnail-%s.png" % name)
+
+    def _remove_screenshot_files(self, name):
+        basesn = self._get_screenshot_basename(name)
+        paths = [basesn + "." + ext for ext in mimemap.values()]
+        paths.append(self._get_thumbnail_path(name))
+        for p in paths:
+            if os.path.exists(p):
+                os.unlink(p)
+
     def _refresh_snapshots(self, select_name=None):
         self.vm.refresh_snapshots()
         self._populate_snapshot_list(select_name)
@@ -198,47 +219,88 @@ class vmmSnapshotPage(vmmGObjectUI):
         self.widget("snapshot-error-label").set_text(msg)
 
     def _populate_snapshot_list(self, select_name=None):
-        cursnap = self._get_selected_snapshot()
-        model = self.widget("snapshot-list").get_model()
-        model.clear()
+        """
+        Fetching the XML of hundreds of snapshots takes a while, so
+        build the rows in a thread and fill in the tree once done
+        """
+        # Don't look up the snapshot object here, list_snapshots() may
+        # need to refetch every snapshot's XML
+        currow = uiutil.get_list_selection(self.widget("snapshot-list"))
+        select_name = select_name or (currow and currow[0] or None)
+        self._initial_populate = True
 
+        self._populate_gen += 1
+        self.widget("snapshot-list").get_model().clear()
+        self._set_error_page(_("Loading snapshot list..."))
+
+        t = threading.Thread(target=self._populate_thread,
+                             args=(self.vm, self._populate_gen, select_name),
+                             name="snapshot list populate")
+        t.daemon = True
+        t.start()
+
+    def _populate_thread(self, vm, gen, select_name):
+        rows = []
+        error = None
         try:
-            snapshots = self.vm.list_snapshots()
+            for snap in vm.list_snapshots():
+                desc = snap.get_description()
+                if not uiutil.can_set_row_none:
+                    desc = desc or ""
+
+                name = snap.get_name()
+                state = util.xml_escape(snap.run_status())
+                external = ""
+                if snap.is_external():
+                    external = " (%s)" % _("External")
+
+                label = "%s\n<span size='small'>%s: %s%s</span>" % (
+                    (util.xml_escape(name), _("VM State"), state, external))
+                sortname = "%020d%s" % (snap.get_creation_time(), name)
+                rows.append((snap.get_parent_name(),
+                             [name, label, desc,
+                              snap.run_status_icon_name(), sortname]))
         except Exception, e:
             logging.exception(e)
+            error = str(e)
+
+        self.idle_add(self._populate_done, gen, rows, error, select_name)
+
+    def _populate_done(self, gen, rows, error, select_name):
+        if gen != self._populate_gen or not self.vm:
+            return
+
+        if error:
             self._set_error_page(_("Error refreshing snapshot list: %s") %
-                                str(e))
+                                 error)
             return
 
-        has_external = False
-        has_internal = False
-        for snap in snapshots:
-            desc = snap.get_xmlobj().description
-            if not uiutil.can_set_row_none:
-                desc = desc or ""
-
-            name = snap.get_name()
-            state = util.xml_escape(snap.run_status())
-            if snap.is_external():
-                has_external = True
-                sortname = "3%s" % name
-                external = " (%s)" % _("External")
+        # Snapshots taken one after the other form a long chain. Nesting
+        # every link would indent the list off the screen, so a child is
+        # only nested under its parent when the tree branches there.
+        children = {}
+        names = set([row[0] for parent, row in rows])
+        roots = []
+        for parent, row in rows:
+            if parent in names:
+                children.setdefault(parent, []).append(row)
             else:
-                has_internal = True
-                external = ""
-                sortname = "1%s" % name
-
-            label = "%s\n<span size='small'>%s: %s%s</span>" % (
-                (name, _("VM State"), state, external))
-            model.append([name, label, desc, snap.run_status_icon_name(),
-                          sortname])
+                roots.append(row)
 
-        if has_internal and has_external:
-            model.append([None, None, None, None, "2"])
+        model = self.widget("snapshot-list").get_model()
+        model.clear()
+        stack = [(row, None) for row in roots]
+        while stack:
+            row, parent_iter = stack.pop()
+            _iter = model.append(parent_iter, row)
+            kids = children.get(row[0], [])
+            if len(kids) == 1:
+                stack.append((kids[0], parent_iter))
+            else:
+                stack.extend([(kid, _iter) for kid in kids])
 
-        select_name = select_name or (cursnap and cursnap.get_name() or None)
+        self.widget("snapshot-list").expand_all()
         uiutil.set_row_selection(self.widget("snapshot-list"), select_name)
-        self._initial_populate = True
 
     def _make_screenshot_pixbuf(self, mime, sdata):
         loader = GdkPixbuf.PixbufLoader.new_with_mime_type(mime)
@@ -246,7 +308,7 @@ class vmmSnapshotPage(vmmGObjectUI):
         pixbuf = loader.get_pixbuf()
         loader.close()
 
-        maxsize = 450
+        maxsize = _THUMBNAIL_SIZE
         def _scale(big, small, maxsize):
             if big <= maxsize:
                 return big, small
@@ -267,8 +329,14 @@ class vmmSnapshotPage(vmmGObjectUI):
         if not name:
             return
 
-        cache_dir = self.vm.get_cache_dir()
-        basename = os.path.join(cache_dir, "snap-screenshot-%s" % name)
+        thumbpath = self._get_thumbnail_path(name)
+        if os.path.exists(thumbpath):
+            try:
+                return GdkPixbuf.Pixbuf.new_from_file(thumbpath)
+            except:
+                logging.debug("Error reading %s", thumbpath, exc_info=True)
+
+        basename = self._get_screenshot_basename(name)
         files = glob.glob(basename + ".*")
         if not files:
             return
@@ -277,14 +345,23 @@ class vmmSnapshotPage(vmmGObjectUI):
         mime = _mime_to_ext(os.path.splitext(filename)[1][1:], reverse=True)
         if not mime:
             return
-        return self._make_screenshot_pixbuf(mime, file(filename, "rb").read())
+        pixbuf = self._make_screenshot_pixbuf(mime,
+                                              file(filename, "rb").read())
+        self._write_thumbnail(pixbuf, thumbpath)
+        return pixbuf
+
+    def _write_thumbnail(self, pixbuf, thumbpath):
+        try:
+            logging.debug("Writing screenshot thumbnail to %s", thumbpath)
+            pixbuf.savev(thumbpath, "png", [], [])
+        except:
+            logging.debug("Error writing %s", thumbpath, exc_info=True)
 
     def _set_snapshot_state(self, snap=None):
         self.widget("snapshot-notebook").set_current_page(0)
 
-        xmlobj = snap and snap.get_xmlobj() or None
-        name = snap and xmlobj.name or ""
-        desc = snap and xmlobj.description or ""
+        name = snap and snap.get_name() or ""
+        desc = snap and snap.get_description() or ""
         state = snap and snap.run_status() or ""
         icon = snap and snap.run_status_icon_name() or None
         is_external = snap and snap.is_external() or False
@@ -292,7 +369,7 @@ class vmmSnapshotPage(vmmGObjectUI):
         timestamp = ""
         if snap:
             timestamp = str(datetime.datetime.fromtimestamp(
-                xmlobj.creationTime))
+                snap.get_creation_time()))
 
         title = ""
         if name:
@@ -310,8 +387,8 @@ class vmmSnapshotPage(vmmGObjectUI):
         uiutil.set_grid_row_visible(self.widget("snapshot-mode"),
                                        is_external)
         if is_external:
-            is_mem = xmlobj.memory_type == "external"
-            is_disk = [d.snapshot == "external" for d in xmlobj.disks]
+            is_mem = snap.get_memory_type() == "external"
+            is_disk = "external" in snap.get_disk_snapshot_modes()
             if is_mem and is_disk:
                 mode = _("External disk and memory")
             elif is_mem:
@@ -336,54 +413,77 @@ class vmmSnapshotPage(vmmGObjectUI):
     # 'New' handling #
     ##################
 
-    def _take_screenshot(self):
-        stream = None
+    def _screenshot_to_pixbuf(self, mime, sdata):
+        ext = _mime_to_ext(mime)
+        if not ext:
+            return
+
+        newpix = self._make_screenshot_pixbuf(mime, sdata)
+        setattr(newpix, "vmm_mimetype", mime)
+        setattr(newpix, "vmm_sndata", sdata)
+        return newpix
+
+    def _get_cached_screenshot(self):
+        """
+        The latest thumbnail from vmmThumbnailService, shown until a
+        fresh screenshot comes in. It's small and may be old, so it has
+        no screenshot data attached and is never saved with a snapshot.
+        """
+        path = self.vm.get_thumbnail()
+        if not path or not os.path.exists(path):
+            return
+
         try:
-            stream = self.vm.conn.get_backend().newStream(0)
-            screen = 0
-            flags = 0
-            mime = self.vm.get_backend().screenshot(stream, screen, flags)
-
-            ret = StringIO.StringIO()
-            def _write_cb(_stream, data, userdata):
-                ignore = stream
-                ignore = userdata
-                ret.write(data)
-
-            stream.recvAll(_write_cb, None)
-            return mime, ret.getvalue()
-        finally:
-            try:
-                if stream:
-                    stream.finish()
-            except:
-                pass
+            return GdkPixbuf.Pixbuf.new_from_file(path)
+        except:
+            logging.debug("Error loading thumbnail %s", path, exc_info=True)
+
+    def _set_new_screenshot(self, sn):
+        uiutil.set_grid_row_visible(
+            self.widget("snapshot-new-screenshot"), bool(sn))
+        if sn:
+            self.widget("snapshot-new-screenshot").set_from_pixbuf(sn)
 
-    def _get_screenshot(self):
+    def _start_screenshot(self):
+        self._screenshot_gen += 1
         if not self.vm.is_active():
             logging.debug("Skipping screenshot since VM is not active")
+            self._set_new_screenshot(None)
             return
         if not self.vm.get_graphics_devices():
             logging.debug("Skipping screenshot since VM has no graphics")
+            self._set_new_screenshot(None)
             return
 
+        self._set_new_screenshot(self._get_cached_screenshot())
+
+        # take_screenshot can wait on the connection's screenshot limit,
+        # keep that out of the main loop
+        t = threading.Thread(target=self._screenshot_thread,
+                             args=(self.vm, self._screenshot_gen),
+                             name="snapshot screenshot")
+        t.daemon = True
+        t.start()
+
+    def _screenshot_thread(self, vm, gen):
         try:
-            mime, sdata = self._take_screenshot()
+            mime, sdata = vm.take_screenshot()
         except:
             logging.exception("Error taking screenshot")
             return
+        self.idle_add(self._screenshot_done, gen, mime, sdata)
 
-        ext = _mime_to_ext(mime)
-        if not ext:
+    def _screenshot_done(self, gen, mime, sdata):
+        if (gen != self._screenshot_gen or not self.vm or
+            not self._snapshot_new.get_visible()):
             return
 
-        newpix = self._make_screenshot_pixbuf(mime, sdata)
-        setattr(newpix, "vmm_mimetype", mime)
-        setattr(newpix, "vmm_sndata", sdata)
-        return newpix
+        sn = self._screenshot_to_pixbuf(mime, sdata)
+        if sn:
+            self._set_new_screenshot(sn)
 
     def _reset_new_state(self):
-        collidelist = [s.get_xmlobj().name for s in self.vm.list_snapshots()]
+        collidelist = [s.get_name() for s in self.vm.list_snapshots()]
         default_name = DomainSnapshot.find_free_name(
             self.vm.get_backend(), collidelist)
 
@@ -395,11 +495,7 @@ class vmmSnapshotPage(vmmGObjectUI):
         self.widget("snapshot-new-status-icon").set_from_icon_name(
             self.vm.run_status_icon_name(), Gtk.IconSize.BUTTON)
 
-        sn = self._get_screenshot()
-        uiutil.set_grid_row_visible(
-            self.widget("snapshot-new-screenshot"), bool(sn))
-        if sn:
-            self.widget("snapshot-new-screenshot").set_from_pixbuf(sn)
+        self._start_screenshot()
 
 
     def _snapshot_new_name_changed(self, src):
@@ -434,37 +530,35 @@ class vmmSnapshotPage(vmmGObjectUI):
     def _get_screenshot_data_for_save(self):
         snwidget = self.widget("snapshot-new-screenshot")
         if not snwidget.is_visible():
-            return None, None
+            return None, None, None
 
         sn = snwidget.get_pixbuf()
         if not sn:
-            return None, None
+            return None, None, None
 
         mime = getattr(sn, "vmm_mimetype", None)
         sndata = getattr(sn, "vmm_sndata", None)
-        return mime, sndata
+        return mime, sndata, sn
 
-    def _do_create_snapshot(self, asyncjob, xml, name, mime, sndata):
+    def _do_create_snapshot(self, asyncjob, xml, name, mime, sndata, sn):
         ignore = asyncjob
 
         self.vm.create_snapshot(xml)
 
         try:
-            cachedir = self.vm.get_cache_dir()
-            basesn = os.path.join(cachedir, "snap-screenshot-%s" % name)
-
             # Remove any pre-existing screenshots so we don't show stale data
-            for ext in mimemap.values():
-                p = basesn + "." + ext
-                if os.path.exists(basesn + "." + ext):
-                    os.unlink(p)
+            self._remove_screenshot_files(name)
 
             if not mime or not sndata:
                 return
 
-            filename = basesn + "." + _mime_to_ext(mime)
+            filename = (self._get_screenshot_basename(name) + "." +
+                        _mime_to_ext(mime))
             logging.debug("Writing screenshot to %s", filename)
             file(filename, "wb").write(sndata)
+
+            # sn is already scaled down for the 'new' dialog
+            self._write_thumbnail(sn, self._get_thumbnail_path(name))
         except:
             logging.exception("Error saving screenshot")
 
@@ -475,7 +569,7 @@ class vmmSnapshotPage(vmmGObjectUI):
 
         xml = snap.get_xml_config()
         name = snap.name
-        mime, sndata = self._get_screenshot_data_for_save()
+        mime, sndata, sn = self._get_screenshot_data_for_save()
 
         self.topwin.set_sensitive(False)
         self.topwin.get_window().set_cursor(
@@ -483,7 +577,7 @@ class vmmSnapshotPage(vmmGObjectUI):
 
         self._snapshot_new_close()
         progWin = vmmAsyncJob(
-                    self._do_create_snapshot, [xml, name, mime, sndata],
+                    self._do_create_snapshot, [xml, name, mime, sndata, sn],
                     self._new_finish_cb, [name],
                     _("Creating snapshot"),
                     _("Creating virtual machine snapshot"),
@@ -570,13 +664,20 @@ class vmmSnapshotPage(vmmGObjectUI):
             return
 
         logging.debug("Deleting snapshot '%s'", snap.get_name())
-        vmmAsyncJob.simple_async(snap.delete, [], self,
+        vmmAsyncJob.simple_async(self._do_delete_snapshot, [snap], self,
                         _("Deleting snapshot"),
                         _("Deleting snapshot '%s'") % snap.get_name(),
                         _("Error deleting snapshot '%s'") % snap.get_name(),
                         finish_cb=self._refresh_snapshots)
 
 
+    def _do_delete_snapshot(self, snap):
+        snap.delete()
+        try:
+            self._remove_screenshot_files(snap.get_name())
+        except:
+            logging.exception("Error removing snapshot screenshots")
+
     def _snapshot_selected(self, selection):
         ignore = selection
         snap = self._get_selected_snapshot()
@@ -19,6 +19,7 @@
 #
 
 import logging
+import time
 
 # pylint: disable=E0611
 from gi.repository import GObject
@@ -30,6 +31,10 @@ from virtManager.createvol import vmmCreateVolume
 from virtManager.baseclass import vmmGObjectUI
 from virtManager import uiutil
 
+# Don't refresh a pool again on selection if we did within this many
+# seconds, flicking through the pool list shouldn't queue a refresh each
+_POOL_REFRESH_INTERVAL = 30
+
 
 class vmmStorageBrowser(vmmGObjectUI):
     __gsignals__ = {
@@ -44,6 +49,8 @@ class vmmStorageBrowser(vmmGObjectUI):
         self.finish_cb_id = None
         self.can_new_volume = True
         self._first_run = False
+        # Pool UUID -> time we last refreshed it on selection
+        self._pool_refresh_times = {}
 
         # Add Volume wizard
         self.addvol = None
@@ -172,6 +179,8 @@ class vmmStorageBrowser(vmmGObjectUI):
                                      self.refresh_storage_pool))
         ids.append(self.conn.connect("pool-stopped",
                                      self.refresh_storage_pool))
+        ids.append(self.conn.connect("pool-refreshed",
+                                     self.storage_pool_refreshed))
         self.conn_signal_ids = ids
 
         # FIXME: Need a connection specific "vol-added" function?
@@ -247,6 +256,14 @@ class vmmStorageBrowser(vmmGObjectUI):
         # update vol list
         self.pool_selected(self.widget("pool-list").get_selection())
 
+    def storage_pool_refreshed(self, src_ignore, uuid):
+        pool_list = self.widget("pool-list")
+        host.refresh_pool_in_list(pool_list, self.conn, uuid)
+        curpool = self.current_pool()
+        if not curpool or curpool.get_uuid() != uuid:
+            return
+        self.populate_storage_volumes()
+
     def repopulate_storage_pools(self, src_ignore=None, uuid_ignore=None):
         pool_list = self.widget("pool-list")
         host.populate_storage_pools(pool_list, self.conn, self.current_pool())
@@ -265,7 +282,16 @@ class vmmStorageBrowser(vmmGObjectUI):
         newvol = newvol and self.allow_create()
         self.widget("new-volume").set_sensitive(newvol)
 
+        # Show the cached volume list now, and pick up any new files once
+        # the background refresh finishes
         self.populate_storage_volumes()
+        if pool:
+            now = time.time()
+            uuid = pool.get_uuid()
+            if (now - self._pool_refresh_times.get(uuid, 0) >
+                _POOL_REFRESH_INTERVAL):
+                self._pool_refresh_times[uuid] = now
+                pool.refresh_async()
 
     def vol_selected(self, ignore=None):
         vol = self.current_vol_row()
@@ -276,16 +302,21 @@ class vmmStorageBrowser(vmmGObjectUI):
         cp = self.current_pool()
         if cp is None:
             return
-        cp.refresh()
 
-        self.refresh_storage_pool(None, cp.get_uuid())
+        def cb(error):
+            if error:
+                return
 
-        vol_list = self.widget("vol-list")
-        def select_volume(model, path, it, volume_name):
-            if model.get(it, 0)[0] == volume_name:
-                uiutil.set_list_selection(vol_list, path)
+            vol_list = self.widget("vol-list")
+            def select_volume(model, path, it, volume_name):
+                if model.get(it, 0)[0] == volume_name:
+                    uiutil.set_list_selection(vol_list, path)
+
+            vol_list.get_model().foreach(select_volume, createvol.vol.name)
 
-        vol_list.get_model().foreach(select_volume, createvol.vol.name)
+        # The volume list is updated by the pool-refreshed signal, which
+        # is emitted before cb is called
+        cp.refresh_async(cb)
 
     def new_volume(self, src_ignore):
         pool = self.current_pool()
@@ -22,6 +22,10 @@
 from gi.repository import GObject
 # pylint: enable=E0611
 
+import logging
+import Queue
+import threading
+
 from virtinst import pollhelpers
 from virtinst import StoragePool, StorageVolume
 from virtinst import util
@@ -89,6 +93,80 @@ class vmmStorageVolume(vmmLibvirtObject):
         return "%s (%s)" % (name, key)
 
 
+POOL_REFRESH_WORKERS = 4
+
+
+class _PoolRefreshRequest(object):
+    def __init__(self, pool):
+        self.pool = pool
+        self.callbacks = []
+        self.error = None
+        self.event = threading.Event()
+
+
+class _PoolRefreshQueue(object):
+    """
+    Runs virStoragePool.refresh, which can take many seconds for network
+    and LVM pools, on a small set of worker threads. Each pool has at most
+    one refresh waiting in the queue: asking for another one while it is
+    still waiting just piggybacks on the queued request.
+    """
+    def __init__(self, max_workers):
+        self._max_workers = max_workers
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._threads = []
+
+    def submit(self, pool, cb=None):
+        self._lock.acquire()
+        try:
+            req = self._pending.get(pool)
+            if req is None:
+                req = _PoolRefreshRequest(pool)
+                self._pending[pool] = req
+                self._queue.put(req)
+                self._start_worker()
+            else:
+                logging.debug("Refresh of pool '%s' already queued",
+                              pool.get_name())
+            if cb:
+                req.callbacks.append(cb)
+            return req
+        finally:
+            self._lock.release()
+
+    def _start_worker(self):
+        if len(self._threads) >= self._max_workers:
+            return
+        t = threading.Thread(target=self._worker,
+                             name="Storage pool refresh thread")
+        t.daemon = True
+        t.start()
+        self._threads.append(t)
+
+    def _worker(self):
+        while True:
+            req = self._queue.get()
+            self._lock.acquire()
+            try:
+                # From here on a new refresh needs a new request, since
+                # the pool contents may change while this one is running
+                self._pending.pop(req.pool, None)
+            finally:
+                self._lock.release()
+
+            try:
+                req.pool._refresh_thread(req)
+            except Exception, e:
+                logging.debug("Error refreshing pool", exc_info=True)
+                req.error = e
+                req.pool.idle_add(req.pool._finish_refresh, req, None)
+            req.event.set()
+
+_refresh_queue = _PoolRefreshQueue(POOL_REFRESH_WORKERS)
+
+
 class vmmStoragePool(vmmLibvirtObject):
     __gsignals__ = {
         "refreshed": (GObject.SignalFlags.RUN_FIRST, None, [])
@@ -101,9 +179,11 @@ class vmmStoragePool(vmmLibvirtObject):
         self._support_isactive = None
 
         self._volumes = {}
+        # Bumped whenever volumes are added or removed
+        self._volumes_generation = 0
 
         self.tick()
-        self.refresh()
+        self.refresh_async()
 
 
     ##########################
@@ -139,6 +219,8 @@ class vmmStoragePool(vmmLibvirtObject):
         self.idle_emit(state and "started" or "stopped")
         self._active = state
         self.refresh_xml()
+        if state:
+            self.refresh_async()
 
     def _kick_conn(self):
         self.conn.schedule_priority_tick(pollpool=True)
@@ -173,16 +255,41 @@ class vmmStoragePool(vmmLibvirtObject):
         self._kick_conn()
 
     def refresh(self):
+        """
+        Refresh the pool and wait for the backend work to complete. The
+        new volume list is applied from the main loop afterwards.
+        """
         if not self.is_active():
             return
+        req = _refresh_queue.submit(self)
+        req.event.wait()
+        if req.error:
+            raise req.error
+
+    def refresh_async(self, cb=None):
+        """
+        Queue a pool refresh on the worker threads. 'refreshed' is emitted
+        once the results are applied, and @cb, if passed, is then called
+        from the main loop with the error (or None)
+        """
+        if not self.is_active():
+            if cb:
+                self.idle_add(cb, None)
+            return
+        _refresh_queue.submit(self, cb)
 
-        def cb():
-            self.refresh_xml()
-            self.update_volumes(refresh=True)
-            self.emit("refreshed")
-
+    def _refresh_thread(self, req):
         self._backend.refresh(0)
-        self.idle_add(cb)
+        self.refresh_xml()
+        result = self._fetch_volumes(refresh=True)
+        self.idle_add(self._finish_refresh, req, result)
+
+    def _finish_refresh(self, req, result):
+        if result is not None:
+            self._set_volumes(*result)
+            self.emit("refreshed")
+        for cb in req.callbacks:
+            cb(req.error)
 
     def define_name(self, newname):
         return self._define_name_helper("storagepool",
@@ -200,21 +307,38 @@ class vmmStoragePool(vmmLibvirtObject):
 
     def get_volume(self, uuid):
         return self._volumes[uuid]
-
-    def update_volumes(self, refresh=False):
+    def get_volumes_generation(self):
+        return self._volumes_generation
+
+    def _fetch_volumes(self, refresh=False):
+        """
+        Diff the current volume list against libvirt. Only new volumes
+        get a new object, and existing ones just have their XML refreshed.
+        """
         if not self.is_active():
-            self._volumes = {}
-            return
+            return self._volumes.copy(), {}, {}
 
-        (ignore, new, allvols) = pollhelpers.fetch_volumes(
+        (gone, new, allvols) = pollhelpers.fetch_volumes(
             self.conn.get_backend(), self.get_backend(), self._volumes.copy(),
             lambda obj, key: vmmStorageVolume(self.conn, obj, key))
 
-        for volname in allvols:
-            if volname not in new and refresh:
-                allvols[volname].refresh_xml()
+        if refresh:
+            # Fetch XML for new volumes too, so the UI thread doesn't
+            # have to when it indexes them
+            for vol in allvols.values():
+                vol.refresh_xml()
+        return gone, new, allvols
+
+    def _set_volumes(self, gone, new, allvols):
+        if gone or new:
+            logging.debug("pool=%s volumes removed=%s added=%s",
+                          self.get_name(), gone.keys(), new.keys())
+            self._volumes_generation += 1
         self._volumes = allvols
 
+    def update_volumes(self, refresh=False):
+        self._set_volumes(*self._fetch_volumes(refresh=refresh))
+
 
     #################
     # XML accessors #
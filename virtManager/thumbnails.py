@@ -0,0 +1,243 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+from Queue import Queue
+from threading import Lock, Thread
+import logging
+import os
+import time
+
+# pylint: disable=E0611
+from gi.repository import GdkPixbuf
+# pylint: enable=E0611
+
+import libvirt
+
+from virtManager.baseclass import vmmGObject
+
+_THUMBNAIL_DIR = "thumbnails"
+# How many thumbnails to keep on disk per VM
+_THUMBNAIL_KEEP = 2
+# How often we look for VMs that are due a new thumbnail, in ms
+_SCHEDULE_INTERVAL = 5 * 1000
+
+
+def _list_thumbnails(vm):
+    """
+    Return the VM's thumbnail files, newest first. Names are the
+    capture timestamp.
+    """
+    thumbdir = os.path.join(vm.get_cache_dir(), _THUMBNAIL_DIR)
+    if not os.path.exists(thumbdir):
+        return []
+
+    ret = []
+    for f in os.listdir(thumbdir):
+        base, ext = os.path.splitext(f)
+        if ext == ".png" and base.isdigit():
+            ret.append((int(base), os.path.join(thumbdir, f)))
+    ret.sort(reverse=True)
+    return [path for ignore, path in ret]
+
+
+class _TokenBucket(object):
+    """
+    Shared screenshot bandwidth budget, in bytes/sec. Screenshot sizes
+    aren't known up front, so a capture is charged once it's done and
+    the next one waits until the budget recovers.
+    """
+    def __init__(self, rate):
+        self._rate = rate
+        self._tokens = rate
+        self._last = time.time()
+        self._lock = Lock()
+
+    def consume(self, count):
+        if self._rate <= 0:
+            return
+
+        self._lock.acquire()
+        try:
+            now = time.time()
+            self._tokens = min(self._rate, self._tokens +
+                               (now - self._last) * self._rate)
+            self._last = now
+            self._tokens -= count
+            wait = max(0, -self._tokens / float(self._rate))
+        finally:
+            self._lock.release()
+
+        if wait:
+            logging.debug("Screenshot budget used up, waiting %.1fs", wait)
+            time.sleep(wait)
+
+
+class vmmThumbnailService(vmmGObject):
+    """
+    Periodically grab low resolution screenshots of running VMs, for the
+    manager window and snapshot page. Screenshots are decoded and
+    scaled by worker threads, and saved in the VM's cache dir so the
+    last one is still around for stopped VMs and after a restart.
+
+    vmmDomain.take_screenshot limits the number of screenshot streams
+    per connection, the service limits the total with its worker count
+    and a shared bandwidth budget.
+    """
+    # Can't find a way to make Thread release our reference
+    _leak_check = False
+
+    def __init__(self):
+        vmmGObject.__init__(self)
+
+        self._interval = self.config.get_thumbnail_interval()
+        self._size = self.config.get_thumbnail_size()
+        self._bucket = _TokenBucket(
+            self.config.get_thumbnail_bandwidth() * 1024)
+
+        self._work = Queue()
+        self._workers = []
+        self._conns = {}
+        # VM UUID -> time of last capture attempt
+        self._last = {}
+        # VM UUIDs queued or being captured
+        self._pending = set()
+        self._lock = Lock()
+
+    def _cleanup(self):
+        self._work = Queue()
+        self._workers = []
+        self._conns = {}
+        self._last = {}
+
+    def conn_added(self, engine_ignore, conn):
+        self._conns[conn.get_uri()] = conn
+        conn.connect("vm-added", self._vm_added)
+
+    def conn_removed(self, engine_ignore, uri):
+        self._conns.pop(uri, None)
+
+    def _vm_added(self, conn, uuid):
+        # Show whatever we captured last time straight away
+        vm = conn.get_vm(uuid)
+        try:
+            thumbs = _list_thumbnails(vm)
+            if thumbs and not vm.get_thumbnail():
+                vm.set_thumbnail(thumbs[0])
+        except:
+            logging.debug("Error loading cached thumbnail for %s",
+                          vm.get_name(), exc_info=True)
+
+    def start(self):
+        nworkers = max(1, self.config.get_thumbnail_workers())
+        logging.debug("Starting %d thumbnail workers, interval=%ds "
+                      "size=%d", nworkers, self._interval, self._size)
+        for idx in range(nworkers):
+            t = Thread(name="thumbnail worker %d" % idx,
+                       target=self._worker)
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+
+        self.timeout_add(_SCHEDULE_INTERVAL, self._schedule)
+
+
+    ##############
+    # Scheduling #
+    ##############
+
+    def _schedule(self):
+        # Runs in the main loop, and only looks at cached VM state
+        now = time.time()
+        for conn in self._conns.values():
+            if not conn.is_active():
+                continue
+
+            for uuid in conn.list_vm_uuids():
+                try:
+                    vm = conn.get_vm(uuid)
+                    if (vm.status() != libvirt.VIR_DOMAIN_RUNNING or
+                        not vm.get_graphics_devices()):
+                        continue
+                    if now - self._last.get(uuid, 0) < self._interval:
+                        continue
+
+                    self._lock.acquire()
+                    try:
+                        if uuid in self._pending:
+                            continue
+                        self._pending.add(uuid)
+                    finally:
+                        self._lock.release()
+
+                    self._last[uuid] = now
+                    self._work.put(vm)
+                except:
+                    logging.debug("Error scheduling thumbnail for %s",
+                                  uuid, exc_info=True)
+        return True
+
+
+    ###########
+    # Capture #
+    ###########
+
+    def _worker(self):
+        while True:
+            vm = self._work.get()
+            try:
+                self._capture(vm)
+            except:
+                logging.debug("Error capturing thumbnail for %s",
+                              vm.get_name(), exc_info=True)
+
+            self._lock.acquire()
+            try:
+                self._pending.discard(vm.get_uuid())
+            finally:
+                self._lock.release()
+
+    def _scale(self, pixbuf):
+        width = pixbuf.get_width()
+        height = pixbuf.get_height()
+        factor = float(self._size) / max(width, height)
+        if factor >= 1:
+            return pixbuf
+        return pixbuf.scale_simple(max(1, int(width * factor)),
+                                   max(1, int(height * factor)),
+                                   GdkPixbuf.InterpType.BILINEAR)
+
+    def _capture(self, vm):
+        mime, sdata = vm.take_screenshot()
+        self._bucket.consume(len(sdata))
+
+        loader = GdkPixbuf.PixbufLoader.new_with_mime_type(mime)
+        loader.write(sdata)
+        loader.close()
+        pixbuf = self._scale(loader.get_pixbuf())
+
+        thumbdir = os.path.join(vm.get_cache_dir(), _THUMBNAIL_DIR)
+        if not os.path.exists(thumbdir):
+            os.makedirs(thumbdir, 0755)
+        path = os.path.join(thumbdir, "%d.png" % int(time.time()))
+        pixbuf.savev(path, "png", [], [])
+
+        for old in _list_thumbnails(vm)[_THUMBNAIL_KEEP:]:
+            os.unlink(old)
+
+        self.idle_add(vm.set_thumbnail, path)
@@ -73,10 +73,14 @@ def set_row_selection(listwidget, prevkey):
     model = listwidget.get_model()
     _iter = None
     if prevkey:
-        for row in model:
+        rows = list(model)
+        while rows:
+            row = rows.pop(0)
             if row[0] == prevkey:
                 _iter = row.iter
                 break
+            # Search tree models too
+            rows.extend(row.iterchildren())
     if not _iter:
         _iter = model.get_iter_first()
 
@@ -22,10 +22,16 @@
 import subprocess
 import shutil
 import errno
+import hashlib
+import json
 import sys
 import os
 import re
 import logging
+import Queue
+import tarfile
+import tempfile
+import threading
 
 
 DISK_FORMAT_NONE = 0
@@ -80,6 +86,12 @@ checksum_types = {
     CSUM_SHA256 : "sha256",
 }
 
+_COPY_BLOCK_SIZE = 1024 * 1024
+_MAX_WORKERS = 4
+
+# qemu-img convert -p prints '    (12.34/100%)' lines separated by \r
+_QEMU_PROGRESS_RE = re.compile(r"\((\d+(?:\.\d+)?)/100%\)")
+
 
 def ensuredirs(path):
     """
@@ -101,8 +113,115 @@ def run_cmd(cmd):
     proc = subprocess.Popen(cmd, stderr=subprocess.PIPE,
                             stdout=subprocess.PIPE,
                             close_fds=True)
-    ret = proc.wait()
-    return ret, proc.stdout.readlines(), proc.stderr.readlines()
+    stdout, stderr = proc.communicate()
+    return (proc.returncode, stdout.splitlines(True),
+            stderr.splitlines(True))
+
+
+def run_qemu_img(args, progresscb=None, size=0):
+    """
+    Run qemu-img (or kvm-img if that's what is installed) with @args.
+    If @progresscb is passed, '-p' progress output is parsed and
+    reported as a byte count scaled against @size.
+
+    Returns the stderr output, raises RuntimeError on failure.
+    """
+    errfile = tempfile.TemporaryFile()
+    try:
+        proc = None
+        for prog in ["qemu-img", "kvm-img"]:
+            cmd = [prog] + args
+            logging.debug("Running command: %s", " ".join(cmd))
+            try:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                        stderr=errfile, close_fds=True)
+                break
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+        if not proc:
+            raise RuntimeError(_("qemu-img is not installed"))
+
+        # stderr goes to a file, so we can't deadlock reading stdout
+        buf = ""
+        while True:
+            data = os.read(proc.stdout.fileno(), 4096)
+            if not data:
+                break
+            buf = (buf + data)[-256:]
+            matches = _QEMU_PROGRESS_RE.findall(buf)
+            if matches and progresscb:
+                progresscb(long(size * float(matches[-1]) / 100))
+        ret = proc.wait()
+
+        errfile.seek(0)
+        stderr = errfile.read()
+    finally:
+        errfile.close()
+
+    if ret != 0:
+        raise RuntimeError("Disk conversion failed with "
+            "exit status %d: %s" % (ret, stderr))
+    return stderr
+
+
+def get_virtual_size(path):
+    """
+    Return the guest visible size of the disk image at @path in bytes
+    """
+    try:
+        ret, stdout, stderr = run_cmd(["qemu-img", "info",
+                                       "--output=json", path])
+        if ret == 0:
+            return long(json.loads("".join(stdout))["virtual-size"])
+        logging.debug("qemu-img info failed: %s", "".join(stderr))
+    except (OSError, ValueError, KeyError):
+        logging.debug("Error querying virtual size of %s", path,
+                      exc_info=True)
+    return os.path.getsize(path)
+
+
+def _sparse_copy_fileobj(src, dst, progresscb=None, datacb=None):
+    """
+    Copy the file object @src to the file @dst, seeking over blocks of
+    zeros rather than writing them. @datacb sees every block read.
+    """
+    zeros = "\0" * _COPY_BLOCK_SIZE
+    done = 0
+    while True:
+        data = src.read(_COPY_BLOCK_SIZE)
+        if not data:
+            break
+        if datacb:
+            datacb(data)
+        if data == zeros[:len(data)]:
+            dst.seek(len(data), 1)
+        else:
+            dst.write(data)
+        done += len(data)
+        if progresscb:
+            progresscb(done)
+
+    # Sets the size if the file ends in a hole
+    dst.truncate(done)
+    return done
+
+
+def sparse_copy(infile, outfile, progresscb=None):
+    """
+    Copy @infile to @outfile, seeking over blocks of zeros rather than
+    writing them so the copy stays sparse.
+    """
+    src = open(infile, "rb")
+    try:
+        dst = open(outfile, "wb")
+        try:
+            _sparse_copy_fileobj(src, dst, progresscb)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    shutil.copymode(infile, outfile)
 
 
 def run_vdiskadm(args):
@@ -128,8 +247,13 @@ class disk(object):
         self.bus = bus
         self.type = typ
         self.clean = []
+        self.clean_vols = []
         self.csum_dict = {}
 
+        # OVA archive holding the disk as member @path, if any
+        self.archive = None
+        self.archive_size = 0
+
     def cleanup(self):
         """
         Remove any generated output.
@@ -141,13 +265,21 @@ class disk(object):
             if os.path.isdir(path):
                 os.removedirs(path)
 
+        for vol in self.clean_vols:
+            try:
+                vol.delete(0)
+            except Exception:
+                logging.debug("Error removing volume %s", vol.name(),
+                              exc_info=True)
+
         self.clean = []
+        self.clean_vols = []
 
-    def copy_file(self, infile, outfile):
+    def copy_file(self, infile, outfile, progresscb=None):
         """Copy an individual file."""
         self.clean += [outfile]
         ensuredirs(outfile)
-        shutil.copy(infile, outfile)
+        sparse_copy(infile, outfile, progresscb)
 
     def out_file(self, out_format):
         """Return the relative path of the output file."""
@@ -172,29 +304,200 @@ class disk(object):
 
         run_vdiskadm(["import", "-fp", absin, absout])
 
-    def qemu_convert(self, absin, absout, out_format):
+    def qemu_convert(self, absin, absout, out_format, progresscb=None,
+                     target_exists=False):
         """
         Use qemu-img to convert the given disk.  Note that at least some
         version of qemu-img cannot handle multi-file VMDKs, so this can
         easily go wrong.
         Gentoo, Debian, and Ubuntu (potentially others) install kvm-img
         with kvm and qemu-img with qemu. Both would work.
+
+        @target_exists: @absout is a preallocated volume, write into it
+            rather than creating it
         """
+        args = ["convert", "-p", "-O", qemu_formats[out_format]]
+        if target_exists:
+            args.append("-n")
+        else:
+            self.clean += [absout]
 
+        stderr = run_qemu_img(args + [absin, absout], progresscb,
+                              os.path.getsize(absin))
+        if stderr:
+            print >> sys.stderr, stderr
+
+    def pool_convert(self, absin, relout, out_format, conn, pool,
+                     progresscb=None):
+        """
+        Create a volume in the storage pool @pool and convert the disk
+        straight into it. Returns the new volume path.
+        """
+        vol = self._new_pool_volume(relout, get_virtual_size(absin),
+                                    out_format, conn, pool)
+        self.qemu_convert(absin, vol.path(), out_format, progresscb,
+                          target_exists=True)
+        return vol.path()
+
+    def _new_pool_volume(self, relout, capacity, out_format, conn, pool):
+        from virtinst import StorageVolume
+
+        vol_install = StorageVolume(conn)
+        vol_install.pool = pool
+        vol_install.name = StorageVolume.find_free_name(
+            pool, os.path.basename(relout))
+        vol_install.capacity = capacity
+        vol_install.allocation = 0
+        if vol_install.supports_property("format"):
+            vol_install.format = qemu_formats[out_format]
+        elif out_format != DISK_FORMAT_RAW:
+            raise RuntimeError(_("Storage pool '%(pool)s' only supports "
+                                 "raw disks, not %(format)s") %
+                               {"pool": pool.name(),
+                                "format": qemu_formats[out_format]})
+        vol_install.validate()
+
+        vol = vol_install.install()
+        self.clean_vols.append(vol)
+        return vol
+
+    def _read_archive(self, copycb):
+        """
+        Open our member of the OVA archive and pass the file object
+        and a hashing callback to @copycb, then check the digest against
+        the manifest. Returns what @copycb returned.
+        """
+        from virtinst import checksum
+
+        csumtype, csumvalue = checksum.pick_checksum(self.csum_dict)
+        m = csumtype and hashlib.new(csumtype) or None
+
+        tar = tarfile.open(self.archive, "r:")
+        try:
+            src = tar.extractfile(self.path)
+            ret = copycb(src, m and m.update or None)
+        finally:
+            tar.close()
+
+        if m and m.hexdigest() != csumvalue:
+            logging.debug("Disk signature for %s does not match "
+                          "Expected: %s  Received: %s",
+                          self.path, csumvalue, m.hexdigest())
+            raise RuntimeError(_("Disk signature for %s does not match") %
+                               self.path)
+        return ret
+
+    def extract_archive(self, absout, progresscb=None):
+        """
+        Stream the disk out of the OVA archive into the sparse file
+        @absout, verifying it on the fly.
+        """
         self.clean += [absout]
+        ensuredirs(absout)
+        dst = open(absout, "wb")
+        try:
+            self._read_archive(lambda src, datacb:
+                _sparse_copy_fileobj(src, dst, progresscb, datacb))
+        finally:
+            dst.close()
+
+    def upload_archive(self, relout, conn, pool, progresscb=None):
+        """
+        Stream the raw disk out of the OVA archive straight into a new
+        volume in @pool. Returns the new volume path.
+        """
+        vol = self._new_pool_volume(relout, self.archive_size,
+                                    DISK_FORMAT_RAW, conn, pool)
+        stream = conn.newStream(0)
+        vol.upload(stream, 0, self.archive_size, 0)
+
+        def _send(src, datacb):
+            done = 0
+            while True:
+                data = src.read(_COPY_BLOCK_SIZE)
+                if not data:
+                    break
+                if datacb:
+                    datacb(data)
+                while data:
+                    sent = stream.send(data)
+                    data = data[sent:]
+                    done += sent
+                if progresscb:
+                    progresscb(done)
+
+        try:
+            self._read_archive(_send)
+            stream.finish()
+        except:
+            try:
+                stream.abort()
+            except Exception:
+                logging.debug("Error aborting upload stream", exc_info=True)
+            raise
+        return vol.path()
 
-        ret, ignore, stderr = run_cmd(["qemu-img", "convert", "-O",
-            qemu_formats[out_format], absin, absout])
-        if ret == 127:
-            ret, ignore, stderr = run_cmd(["kvm-img", "convert", "-O",
-                qemu_formats[out_format], absin, absout])
-        if ret != 0:
-            raise RuntimeError("Disk conversion failed with "
-                "exit status %d: %s" % (ret, "".join(stderr)))
-        if len(stderr):
-            print >> sys.stderr, stderr
+    def archive_convert(self, outdir, out_format, progresscb=None,
+                        conn=None, pool=None):
+        """
+        Convert a disk that is still inside an OVA archive. Copies and
+        raw uploads are streamed straight to their destination. qemu-img
+        can't read from a pipe, so conversions go through a temporary
+        file in @outdir that is removed afterwards.
+        """
+        if out_format == DISK_FORMAT_NONE:
+            out_format = self.format
+        if out_format == DISK_FORMAT_VDISK:
+            raise NotImplementedError(_("Cannot convert OVA disks to "
+                                        "vdisk"))
+        if os.path.isabs(self.path):
+            raise NotImplementedError(_("Cannot convert disk with absolute"
+                " path %s") % self.path)
+
+        relout = self.out_file(out_format)
+        absout = os.path.join(outdir, relout)
+
+        if out_format == self.format and pool is None:
+            self.extract_archive(absout, progresscb)
+            self.path = relout
+            return
+
+        if os.getenv("VIRTCONV_TEST_NO_DISK_CONVERSION"):
+            self.format = out_format
+            self.path = relout
+            return
+
+        if out_format == self.format == DISK_FORMAT_RAW:
+            self.path = self.upload_archive(relout, conn, pool, progresscb)
+            return
+
+        # Input is processed twice, report each pass as half the work
+        half = self.archive_size / 2
+        extractcb = convertcb = None
+        if progresscb:
+            extractcb = lambda done: progresscb(done / 2)
+            convertcb = lambda done: progresscb(half + done / 2)
+
+        ensuredirs(absout)
+        fd, tmpin = tempfile.mkstemp(prefix=".ova-", dir=outdir)
+        os.close(fd)
+        try:
+            self.extract_archive(tmpin, extractcb)
+            if pool is not None:
+                relout = self.pool_convert(tmpin, relout, out_format,
+                                           conn, pool, convertcb)
+            else:
+                self.qemu_convert(tmpin, absout, out_format, convertcb)
+        finally:
+            if os.path.exists(tmpin):
+                os.unlink(tmpin)
+            if tmpin in self.clean:
+                self.clean.remove(tmpin)
+
+        self.format = out_format
+        self.path = relout
 
-    def copy(self, indir, outdir, out_format):
+    def copy(self, indir, outdir, out_format, progresscb=None):
         """
         If needed, copy top-level disk files to outdir.  If the copy is
         done, then self.path is updated as needed.
@@ -231,7 +534,7 @@ class disk(object):
                     raise RuntimeError("Disk conversion failed: "
                         "invalid vdisk '%s'" % self.path)
                 self.clean += [absout]
-                self.copy_file(absin, absout)
+                self.copy_file(absin, absout, progresscb)
                 self.path = relout
             return True, need_conversion
 
@@ -241,7 +544,7 @@ class disk(object):
         #
         if not need_conversion:
             self.clean += [absout]
-            self.copy_file(absin, absout)
+            self.copy_file(absin, absout, progresscb)
             self.path = relout
             return True, False
 
@@ -251,10 +554,15 @@ class disk(object):
         #
         return False, True
 
-    def convert(self, indir, outdir, output_format):
+    def convert(self, indir, outdir, output_format, progresscb=None,
+                conn=None, pool=None):
         """
         Convert a disk into the requested format if possible, in the
         given output directory.  Raises RuntimeError or other failures.
+
+        @progresscb: called with the number of input bytes processed
+        @pool: virStoragePool to create the converted disk in instead
+            of @outdir, @conn is the matching VirtualConnection
         """
 
         if self.type != DISK_TYPE_DISK:
@@ -275,7 +583,22 @@ class disk(object):
         indir = os.path.normpath(os.path.abspath(indir))
         outdir = os.path.normpath(os.path.abspath(outdir))
 
-        input_in_outdir, need_conversion = self.copy(indir, outdir, out_format)
+        if self.archive:
+            self.archive_convert(outdir, out_format, progresscb, conn, pool)
+            return
+
+        if pool is not None:
+            if out_format == DISK_FORMAT_VDISK:
+                raise NotImplementedError(_("Cannot convert to vdisk in a "
+                                            "storage pool"))
+            if out_format == DISK_FORMAT_NONE:
+                out_format = self.format
+            # Everything goes through qemu-img, which also does the copy
+            input_in_outdir, need_conversion = False, True
+        else:
+            input_in_outdir, need_conversion = self.copy(indir, outdir,
+                                                         out_format,
+                                                         progresscb)
 
         if not need_conversion:
             assert(input_in_outdir)
@@ -293,21 +616,129 @@ class disk(object):
         relout = self.out_file(out_format)
         absout = os.path.join(outdir, relout)
 
-        ensuredirs(absout)
-
         if os.getenv("VIRTCONV_TEST_NO_DISK_CONVERSION"):
             self.format = out_format
             self.path = self.out_file(self.format)
             return
 
-        if out_format == DISK_FORMAT_VDISK:
+        if pool is not None:
+            relout = self.pool_convert(absin, relout, out_format,
+                                       conn, pool, progresscb)
+        elif out_format == DISK_FORMAT_VDISK:
+            ensuredirs(absout)
             self.vdisk_convert(absin, absout)
         else:
-            self.qemu_convert(absin, absout, out_format)
+            ensuredirs(absout)
+            self.qemu_convert(absin, absout, out_format, progresscb)
 
         self.format = out_format
         self.path = relout
 
+    def get_input_size(self, indir):
+        """
+        Bytes of input convert() will process for progress reporting
+        """
+        if self.type != DISK_TYPE_DISK or not self.path:
+            return 0
+        if self.archive:
+            return self.archive_size
+        try:
+            return os.path.getsize(os.path.join(indir, self.path))
+        except OSError:
+            return 0
+
+
+class _ConvertProgress(object):
+    """
+    Thread safe progress accounting across all disks being converted
+    """
+    def __init__(self, meter):
+        self._meter = meter
+        self._lock = threading.Lock()
+        self._done = {}
+
+    def get_callback(self, key):
+        def cb(done):
+            self._lock.acquire()
+            try:
+                self._done[key] = done
+                self._meter.update(sum(self._done.values()))
+            finally:
+                self._lock.release()
+        return cb
+
+
+def convert_disks(disks, indir, outdir, output_format, meter=None,
+                  max_workers=None, conn=None, pool=None):
+    """
+    Convert every disk in the list @disks concurrently, with at most
+    @max_workers conversions running at once. Disks sharing an input
+    file are converted one after another by the same worker. Raises
+    RuntimeError listing every failed disk.
+
+    Other parameters are as for disk.convert()
+    """
+    import urlgrabber.progress
+
+    if meter is None:
+        meter = urlgrabber.progress.BaseMeter()
+    if max_workers is None:
+        max_workers = _MAX_WORKERS
+
+    groups = {}
+    for d in disks:
+        key = d.path and os.path.join(indir, d.path) or id(d)
+        groups.setdefault(key, []).append(d)
+    if not groups:
+        return
+
+    total = sum([d.get_input_size(indir) for d in disks])
+    if len(disks) == 1:
+        text = _("Converting disk %s") % disks[0].path
+    else:
+        text = _("Converting %d disks") % len(disks)
+    meter.start(size=total, text=text)
+    progress = _ConvertProgress(meter)
+
+    queue = Queue.Queue()
+    for group in groups.values():
+        queue.put(group)
+    errors = []
+
+    def _worker():
+        while True:
+            try:
+                group = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            for d in group:
+                try:
+                    d.convert(indir, outdir, output_format,
+                              progresscb=progress.get_callback(id(d)),
+                              conn=conn, pool=pool)
+                except Exception, e:
+                    # Anything escaping here would only kill the thread,
+                    # and we'd report success
+                    logging.debug("Error converting %s", d.path,
+                                  exc_info=True)
+                    errors.append("%s: %s" %
+                                  (d.path, getattr(e, "strerror", None) or
+                                   str(e)))
+
+    threads = []
+    for ignore in range(min(max_workers, len(groups))):
+        t = threading.Thread(target=_worker, name="Disk conversion thread")
+        t.daemon = True
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+    meter.end(total)
+    if errors:
+        raise RuntimeError("\n".join(errors))
+
 
 def disk_formats():
     """
@@ -20,6 +20,7 @@
 #
 
 import os
+import tarfile
 
 _parsers = []
 
@@ -33,6 +34,9 @@ class parser(object):
     change at will.
     """
 
+    # True if import_file() accepts tar archives (OVA)
+    can_import_archive = False
+
     @staticmethod
     def identify_file(input_file):
         """
@@ -115,14 +119,20 @@ def find_input(path, fmt=None):
     then only search using a matching format parser.
     """
 
+    is_archive = False
     if os.path.isdir(path):
         files = os.listdir(path)
+    elif os.path.isfile(path):
+        # Don't have every parser read a multi gigabyte archive
+        is_archive = tarfile.is_tarfile(path)
 
     for p in _parsers:
         if not p.can_identify:
             continue
         if fmt and fmt != p.name:
             continue
+        if is_archive and not p.can_import_archive:
+            continue
 
         if os.path.isfile(path):
             if p.identify_file(path):
@@ -19,6 +19,8 @@
 #
 
 import logging
+import re
+import tarfile
 
 from virtinst import util
 
@@ -76,6 +78,57 @@ DEVICE_GRAPHICS = "24"
 
 
 
+# Manifest lines look like 'SHA1(disk1.vmdk)= 0123abcd...'
+_MANIFEST_RE = re.compile(r"^\s*(SHA1|SHA256|SHA512)\s*\((.+)\)\s*=\s*"
+                          r"([0-9a-fA-F]+)\s*$")
+
+
+def _is_ova(input_file):
+    try:
+        return tarfile.is_tarfile(input_file)
+    except (IOError, OSError):
+        return False
+
+
+def _read_ova(input_file):
+    """
+    Read the OVF descriptor and manifest from the OVA archive, without
+    touching the disk image data.
+
+    Returns (ovf xml, {member name: {csumtype: value}},
+    {member name: member size})
+    """
+    tar = tarfile.open(input_file, "r:")
+    try:
+        xml = None
+        manifest = ""
+        sizes = {}
+        for member in tar.getmembers():
+            if not member.isfile():
+                continue
+            sizes[member.name] = member.size
+
+            # The spec requires the descriptor to come first, but be
+            # lenient about the order
+            if member.name.endswith(".ovf") and xml is None:
+                xml = tar.extractfile(member).read()
+            elif member.name.endswith(".mf"):
+                manifest = tar.extractfile(member).read()
+    finally:
+        tar.close()
+
+    if xml is None:
+        raise ValueError(_("No OVF descriptor found in %s") % input_file)
+
+    csums = {}
+    for line in manifest.splitlines():
+        match = _MANIFEST_RE.match(line)
+        if match:
+            csumtype, name, value = match.groups()
+            csums.setdefault(name, {})[csumtype.lower()] = value.lower()
+    return xml, csums, sizes
+
+
 def ovf_register_namespace(ctx):
     ctx.xpathRegisterNs("ovf", "http://schemas.dmtf.org/ovf/envelope/1")
     ctx.xpathRegisterNs("ovfenv", "http://schemas.dmtf.org/ovf/environment/1")
@@ -253,15 +306,23 @@ class ovf_parser(formats.parser):
     can_import = True
     can_export = False
     can_identify = True
+    can_import_archive = True
 
     @staticmethod
     def identify_file(input_file):
         """
         Return True if the given file is of this format.
         """
-        infile = open(input_file, "r")
-        xml = infile.read()
-        infile.close()
+        if _is_ova(input_file):
+            try:
+                xml = _read_ova(input_file)[0]
+            except Exception, e:
+                logging.debug("Error reading OVA: %s", str(e))
+                return False
+        else:
+            infile = open(input_file, "r")
+            xml = infile.read()
+            infile.close()
 
         res = False
         try:
@@ -278,16 +339,34 @@ class ovf_parser(formats.parser):
         """
         Import a configuration file.  Raises if the file couldn't be
         opened, or parsing otherwise failed.
-        """
 
-        infile = open(input_file, "r")
-        xml = infile.read()
-        infile.close()
+        @input_file can also be an OVA archive, in which case the disks
+        are left in the archive and streamed out when converted.
+        """
+        is_ova = _is_ova(input_file)
+        if is_ova:
+            xml, csums, sizes = _read_ova(input_file)
+        else:
+            infile = open(input_file, "r")
+            xml = infile.read()
+            infile.close()
         logging.debug("Importing OVF XML:\n%s", xml)
 
-        return util.xml_parse_wrapper(xml, ovf_parser._import_file,
+        vm = util.xml_parse_wrapper(xml, ovf_parser._import_file,
                                     register_namespace=ovf_register_namespace)
 
+        if is_ova:
+            for disk in vm.disks.values():
+                if not disk.path:
+                    continue
+                if disk.path not in sizes:
+                    raise ValueError(_("Disk '%s' not found in OVA "
+                                       "archive") % disk.path)
+                disk.archive = input_file
+                disk.archive_size = sizes[disk.path]
+                disk.csum_dict = csums.get(disk.path, {})
+        return vm
+
     @staticmethod
     def _import_file(doc, ctx):
         ignore = doc
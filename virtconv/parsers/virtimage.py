@@ -255,6 +255,7 @@ class virtimage_parser(formats.parser):
                 typ=diskcfg.DISK_TYPE_DISK)
             vm.disks[devid].format = fmt
             vm.disks[devid].path = disk.file
+            vm.disks[devid].csum_dict = disk.csum.copy()
             nr_disk = nr_disk + 1
 
         nics = domain.interface
@@ -15,56 +15,107 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 # MA 02110-1301 USA.
 
+import importlib
+import sys
+import types
+
 from virtcli import cliconfig, cliutils
 stable_defaults = cliconfig.stable_defaults
 cliutils.setup_i18n()
 
 
-from virtinst import util
-from virtinst import support
-
-from virtinst.osxml import OSXML
-from virtinst.domainfeatures import DomainFeatures
-from virtinst.domainnumatune import DomainNumatune
-from virtinst.clock import Clock
-from virtinst.cpu import CPU, CPUFeature
-from virtinst.seclabel import Seclabel
-
-import virtinst.capabilities as CapabilitiesParser
-from virtinst.interface import Interface, InterfaceProtocol
-from virtinst.network import Network
-from virtinst.nodedev import NodeDevice
-from virtinst.storage import StoragePool, StorageVolume
-
-from virtinst.device import VirtualDevice
-from virtinst.deviceinterface import VirtualNetworkInterface
-from virtinst.devicegraphics import VirtualGraphics
-from virtinst.deviceaudio import VirtualAudio
-from virtinst.deviceinput import VirtualInputDevice
-from virtinst.devicedisk import VirtualDisk
-from virtinst.devicehostdev import VirtualHostDevice
-from virtinst.devicechar import (VirtualChannelDevice,
-                                 VirtualConsoleDevice,
-                                 VirtualParallelDevice,
-                                 VirtualSerialDevice)
-from virtinst.devicevideo import VirtualVideoDevice
-from virtinst.devicecontroller import VirtualController
-from virtinst.devicewatchdog import VirtualWatchdog
-from virtinst.devicefilesystem import VirtualFilesystem
-from virtinst.devicesmartcard import VirtualSmartCardDevice
-from virtinst.deviceredirdev import VirtualRedirDevice
-from virtinst.devicememballoon import VirtualMemballoon
-from virtinst.devicetpm import VirtualTPMDevice
-from virtinst.devicerng import VirtualRNGDevice
-from virtinst.devicepanic import VirtualPanicDevice
-
-from virtinst.installer import (ContainerInstaller, ImportInstaller,
-                                LiveCDInstaller, PXEInstaller, Installer)
-
-from virtinst.distroinstaller import DistroInstaller
-
-from virtinst.guest import Guest
-from virtinst.cloner import Cloner
-from virtinst.snapshot import DomainSnapshot
-
-from virtinst.connection import VirtualConnection
+# Public API names mapped to (module, attribute). Nothing is imported
+# until the name is first accessed, so 'import virtinst' is cheap for
+# things like 'virt-install --version'. An attribute of None means the
+# name is the module itself.
+_LAZY_ATTRS = {
+    "util": ("virtinst.util", None),
+    "support": ("virtinst.support", None),
+    "osdict": ("virtinst.osdict", None),
+    "xmlbuilder": ("virtinst.xmlbuilder", None),
+    "CapabilitiesParser": ("virtinst.capabilities", None),
+}
+
+
+def _add_lazy(modname, *names):
+    for name in names:
+        _LAZY_ATTRS[name] = (modname, name)
+
+
+_add_lazy("virtinst.osxml", "OSXML")
+_add_lazy("virtinst.domainfeatures", "DomainFeatures")
+_add_lazy("virtinst.domainnumatune", "DomainNumatune")
+_add_lazy("virtinst.clock", "Clock")
+_add_lazy("virtinst.cpu", "CPU", "CPUFeature")
+_add_lazy("virtinst.seclabel", "Seclabel")
+
+_add_lazy("virtinst.interface", "Interface", "InterfaceProtocol")
+_add_lazy("virtinst.network", "Network")
+_add_lazy("virtinst.nodedev", "NodeDevice")
+_add_lazy("virtinst.storage", "StoragePool", "StorageVolume")
+
+_add_lazy("virtinst.device", "VirtualDevice")
+_add_lazy("virtinst.deviceinterface", "VirtualNetworkInterface")
+_add_lazy("virtinst.devicegraphics", "VirtualGraphics")
+_add_lazy("virtinst.deviceaudio", "VirtualAudio")
+_add_lazy("virtinst.deviceinput", "VirtualInputDevice")
+_add_lazy("virtinst.devicedisk", "VirtualDisk")
+_add_lazy("virtinst.devicehostdev", "VirtualHostDevice")
+_add_lazy("virtinst.devicechar", "VirtualChannelDevice",
+          "VirtualConsoleDevice", "VirtualParallelDevice",
+          "VirtualSerialDevice")
+_add_lazy("virtinst.devicevideo", "VirtualVideoDevice")
+_add_lazy("virtinst.devicecontroller", "VirtualController")
+_add_lazy("virtinst.devicewatchdog", "VirtualWatchdog")
+_add_lazy("virtinst.devicefilesystem", "VirtualFilesystem")
+_add_lazy("virtinst.devicesmartcard", "VirtualSmartCardDevice")
+_add_lazy("virtinst.deviceredirdev", "VirtualRedirDevice")
+_add_lazy("virtinst.devicememballoon", "VirtualMemballoon")
+_add_lazy("virtinst.devicetpm", "VirtualTPMDevice")
+_add_lazy("virtinst.devicerng", "VirtualRNGDevice")
+_add_lazy("virtinst.devicepanic", "VirtualPanicDevice")
+
+_add_lazy("virtinst.installer", "ContainerInstaller", "ImportInstaller",
+          "LiveCDInstaller", "PXEInstaller", "Installer")
+
+_add_lazy("virtinst.distroinstaller", "DistroInstaller")
+
+_add_lazy("virtinst.guest", "Guest")
+_add_lazy("virtinst.cloner", "Cloner")
+_add_lazy("virtinst.migrator", "BatchMigrator")
+_add_lazy("virtinst.snapshot", "DomainSnapshot")
+
+_add_lazy("virtinst.connection", "VirtualConnection")
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Stand in for the virtinst package module that imports public names
+    from _LAZY_ATTRS on first access
+    """
+    def __getattr__(self, name):
+        if name not in _LAZY_ATTRS:
+            raise AttributeError("'module' object has no attribute '%s'" %
+                                 name)
+
+        modname, attrname = _LAZY_ATTRS[name]
+        ret = importlib.import_module(modname)
+        if attrname:
+            ret = getattr(ret, attrname)
+        setattr(self, name, ret)
+        return ret
+
+    def __dir__(self):
+        return sorted(set(self.__dict__.keys() + _LAZY_ATTRS.keys()))
+
+
+def _install_lazy_module():
+    origmod = sys.modules[__name__]
+    lazymod = _LazyModule(__name__, __doc__)
+    lazymod.__dict__.update(origmod.__dict__)
+    # Python 2 clears a module's globals when it is freed, and the
+    # functions above still use them, so keep the original alive
+    lazymod.__dict__["_origmodule"] = origmod
+    sys.modules[__name__] = lazymod
+
+_install_lazy_module()
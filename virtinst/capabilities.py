@@ -19,6 +19,10 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 # MA 02110-1301 USA.
 
+import cPickle
+import hashlib
+import logging
+import os
 import re
 
 from virtinst import util
@@ -107,6 +111,9 @@ class CPUValuesArch(object):
         raise ValueError(_("Unknown CPU model '%s'") % model)
 
 
+_CPU_MAP_FILENAME = "/usr/share/libvirt/cpu_map.xml"
+
+
 class CPUValues(object):
     """
     Lists valid values for domain <cpu> parameters, parsed from libvirt's
@@ -115,7 +122,7 @@ class CPUValues(object):
     def __init__(self, cpu_filename=None):
         self.archmap = {}
         if not cpu_filename:
-            cpu_filename = "/usr/share/libvirt/cpu_map.xml"
+            cpu_filename = _CPU_MAP_FILENAME
         xml = file(cpu_filename).read()
 
         util.parse_node_helper(xml, "cpus",
@@ -305,6 +312,10 @@ class Guest(object):
 
         self.features = CapabilityFeatures()
 
+        # (hypervisor type, machine) -> [Domain, ...], None is a wildcard.
+        # Built on first lookup
+        self._domain_index = None
+
         if not node is None:
             self.parseXML(node)
 
@@ -364,14 +375,23 @@ class Guest(object):
         # Fallback, just return last item in list
         return domains[-1]
 
-    def bestDomainType(self, accelerated=None, dtype=None, machine=None):
-        domains = []
+    def _build_domain_index(self):
+        index = {}
         for d in self.domains:
-            if dtype and d.hypervisor_type != dtype.lower():
-                continue
-            if machine and machine not in d.machines:
-                continue
-            domains.append(d)
+            machines = [None] + list(set(d.machines or []))
+            dtypes = [None]
+            if d.hypervisor_type:
+                dtypes.append(d.hypervisor_type)
+            for dtype in dtypes:
+                for machine in machines:
+                    index.setdefault((dtype, machine), []).append(d)
+        self._domain_index = index
+
+    def bestDomainType(self, accelerated=None, dtype=None, machine=None):
+        if self._domain_index is None:
+            self._build_domain_index()
+        domains = self._domain_index.get(
+            (dtype and dtype.lower() or None, machine or None), [])
 
         if len(domains) == 0:
             domainerr = ""
@@ -497,6 +517,12 @@ class Capabilities(object):
         self._topology = None
         self._cpu_values = None
 
+        # (os_type, arch) -> first matching Guest, None is a wildcard.
+        # Built on first lookup
+        self._guest_index = None
+        # os_type -> [arch, ...] in capabilities order
+        self._arch_index = None
+
         util.parse_node_helper(self.xml, "capabilities",
                                self.parseXML,
                                RuntimeError)
@@ -619,9 +645,22 @@ class Capabilities(object):
                 return True
         return False
 
+    def _build_guest_index(self):
+        guests = {}
+        archs = {}
+        for g in self.guests:
+            for typ in set([None, g.os_type]):
+                for arch in set([None, g.arch]):
+                    guests.setdefault((typ, arch), g)
+            archs.setdefault(g.os_type, []).append(g.arch)
+        self._guest_index = guests
+        self._arch_index = archs
+
     def guestForOSType(self, typ=None, arch=None):
         if self.host is None:
             return None
+        if self._guest_index is None:
+            self._build_guest_index()
 
         if arch is None:
             archs = [self.host.cpu.arch, None]
@@ -629,10 +668,17 @@ class Capabilities(object):
             archs = [arch]
 
         for a in archs:
-            for g in self.guests:
-                if (typ is None or g.os_type == typ) and \
-                   (a is None or g.arch == a):
-                    return g
+            g = self._guest_index.get((typ, a))
+            if g:
+                return g
+
+    def get_archs(self, os_type):
+        """
+        Return the list of guest arches available for @os_type
+        """
+        if self._arch_index is None:
+            self._build_guest_index()
+        return self._arch_index.get(os_type, [])[:]
 
     def parseXML(self, node):
         child = node.children
@@ -645,7 +691,7 @@ class Capabilities(object):
 
     def get_cpu_values(self, arch):
         if not self._cpu_values:
-            self._cpu_values = CPUValues()
+            self._cpu_values = load_cpu_values()
 
         return self._cpu_values.get_arch(arch)
 
@@ -721,3 +767,108 @@ class Capabilities(object):
         gobj.emulator = domain.emulator
 
         return gobj
+
+
+#################################
+# Persistent parsed model cache #
+#################################
+
+# Bump this whenever the layout of the parsed classes changes
+_CACHE_VERSION = 2
+_CACHE_MAX_ENTRIES = 20
+_cpu_values_cache = {}
+
+
+def _cache_path(kind, key):
+    return os.path.join(util.get_cache_dir(), "capabilities",
+                        "%s-%s" % (kind, hashlib.sha1(key).hexdigest()))
+
+
+def _cache_load(path, key):
+    try:
+        if not os.path.exists(path):
+            return None
+        f = file(path, "rb")
+        try:
+            version, cachekey, obj = cPickle.load(f)
+        finally:
+            f.close()
+        if version != _CACHE_VERSION or cachekey != key:
+            return None
+        os.utime(path, None)
+        return obj
+    except Exception:
+        logging.debug("Error loading cached %s", path, exc_info=True)
+        return None
+
+
+def _cache_prune(cachedir, kind):
+    entries = [os.path.join(cachedir, f) for f in os.listdir(cachedir)
+               if f.startswith(kind + "-")]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for path in entries[_CACHE_MAX_ENTRIES:]:
+        os.unlink(path)
+
+
+def _cache_store(path, key, kind, obj):
+    try:
+        cachedir = os.path.dirname(path)
+        if not os.path.exists(cachedir):
+            os.makedirs(cachedir, 0700)
+        tmp = path + ".tmp"
+        f = file(tmp, "wb")
+        try:
+            cPickle.dump((_CACHE_VERSION, key, obj), f,
+                         cPickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(tmp, path)
+        _cache_prune(cachedir, kind)
+    except Exception:
+        logging.debug("Error caching %s", path, exc_info=True)
+
+
+def load_capabilities(xml, uri="", version=0, use_cache=True):
+    """
+    Return a Capabilities object for @xml, loading a previously parsed
+    copy from the on disk cache if we have one. The cache is keyed on
+    the connection URI, daemon version and a hash of the XML.
+    """
+    if not use_cache:
+        return Capabilities(xml)
+
+    key = "%s %s %s" % (uri, version, hashlib.sha1(xml).hexdigest())
+    path = _cache_path("caps", key)
+    caps = _cache_load(path, key)
+    if caps is not None:
+        return caps
+
+    caps = Capabilities(xml)
+    _cache_store(path, key, "caps", caps)
+    return caps
+
+
+def load_cpu_values(cpu_filename=None, use_cache=True):
+    """
+    Return the CPUValues for @cpu_filename, parsing the file at most once
+    per process, and only again on disk when the file has changed.
+    """
+    if not cpu_filename:
+        cpu_filename = _CPU_MAP_FILENAME
+    if not use_cache:
+        return CPUValues(cpu_filename)
+
+    st = os.stat(cpu_filename)
+    key = "%s %d %d" % (os.path.realpath(cpu_filename),
+                        st.st_size, st.st_mtime)
+    if key in _cpu_values_cache:
+        return _cpu_values_cache[key]
+
+    path = _cache_path("cpumap", key)
+    values = _cache_load(path, key)
+    if values is None:
+        values = CPUValues(cpu_filename)
+        _cache_store(path, key, "cpumap", values)
+
+    _cpu_values_cache[key] = values
+    return values
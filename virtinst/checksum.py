@@ -0,0 +1,270 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+"""
+Disk image checksum verification, shared by virt-image and virt-convert.
+
+Files are hashed with large mmap'd windows, multiple files are hashed
+concurrently (hashlib drops the GIL for large buffers), and successful
+verifications are recorded in a small cache so unchanged images don't
+need to be read again.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import Queue
+import stat
+import threading
+
+import urlgrabber
+
+from virtinst import util
+
+
+# Strongest first
+CHECKSUM_TYPES = ["sha512", "sha256", "sha1"]
+
+_CHUNK_SIZE = 16 * 1024 * 1024
+_MAX_WORKERS = 4
+
+
+def pick_checksum(csums):
+    """
+    Return the strongest (csumtype, value) pair we support from the
+    passed dictionary, or (None, None)
+    """
+    for csumtype in CHECKSUM_TYPES:
+        if csums.get(csumtype):
+            return csumtype, csums[csumtype].strip().lower()
+    return None, None
+
+
+###################
+# Verified cache  #
+###################
+
+def _get_cache_dir():
+    return os.path.join(util.get_cache_dir(), "checksums")
+
+
+def _cache_key(path):
+    """
+    Identity of the file contents we are willing to trust without
+    reading it again: (path, size, mtime, inode)
+    """
+    st = os.stat(path)
+    return "%s %d %d %d" % (os.path.realpath(path), st.st_size,
+                            int(st.st_mtime), st.st_ino)
+
+
+def _cache_path(path):
+    name = hashlib.sha1(os.path.realpath(path)).hexdigest()
+    return os.path.join(_get_cache_dir(), name)
+
+
+def _cache_lookup(path, csumtype, csumvalue):
+    try:
+        cachefile = _cache_path(path)
+        if not os.path.exists(cachefile):
+            return False
+        lines = file(cachefile).read().splitlines()
+        return lines == [_cache_key(path), "%s %s" % (csumtype, csumvalue)]
+    except (IOError, OSError):
+        logging.debug("Error reading checksum cache for %s", path,
+                      exc_info=True)
+        return False
+
+
+def _cache_store(path, csumtype, csumvalue):
+    try:
+        cachedir = _get_cache_dir()
+        if not os.path.exists(cachedir):
+            os.makedirs(cachedir, 0700)
+        cachefile = _cache_path(path)
+        tmp = cachefile + ".tmp"
+        f = file(tmp, "w")
+        try:
+            f.write("%s\n%s %s\n" % (_cache_key(path), csumtype, csumvalue))
+        finally:
+            f.close()
+        os.rename(tmp, cachefile)
+    except (IOError, OSError):
+        logging.debug("Error writing checksum cache for %s", path,
+                      exc_info=True)
+
+
+##################
+# Hashing engine #
+##################
+
+def _hash_fileobj(f, m, progress_cb):
+    while True:
+        data = f.read(_CHUNK_SIZE)
+        if not data:
+            break
+        m.update(data)
+        progress_cb(len(data))
+
+
+def _hash_mmap(f, size, m, progress_cb):
+    mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    try:
+        offset = 0
+        while offset < size:
+            length = min(_CHUNK_SIZE, size - offset)
+            m.update(buffer(mm, offset, length))
+            offset += length
+            progress_cb(length)
+    finally:
+        mm.close()
+
+
+def compute_checksum(path, csumtype, progress_cb=None):
+    """
+    Return the hex digest of @path using hash algorithm @csumtype.
+
+    :param progress_cb: called with the number of bytes hashed after
+        each chunk has actually been digested
+    """
+    if csumtype not in CHECKSUM_TYPES:
+        raise ValueError(_("Unsupported checksum type '%s'") % csumtype)
+    if progress_cb is None:
+        progress_cb = lambda ignore: None
+
+    m = hashlib.new(csumtype)
+    f = file(path, "rb")
+    try:
+        st = os.fstat(f.fileno())
+        if stat.S_ISREG(st.st_mode) and st.st_size:
+            _hash_mmap(f, st.st_size, m, progress_cb)
+        else:
+            _hash_fileobj(f, m, progress_cb)
+    finally:
+        f.close()
+    return m.hexdigest()
+
+
+def _file_size(path):
+    # Missing or unreadable files are reported by the worker that
+    # tries to hash them
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class _AggregateProgress(object):
+    """
+    Thread safe progress accounting across all files being verified
+    """
+    def __init__(self, meter):
+        self._meter = meter
+        self._lock = threading.Lock()
+        self._done = 0
+
+    def update(self, nbytes):
+        self._lock.acquire()
+        try:
+            self._done += nbytes
+            self._meter.update(self._done)
+        finally:
+            self._lock.release()
+
+
+def verify_checksums(checks, meter=None, use_cache=True, max_workers=None):
+    """
+    Verify a list of (path, csums) pairs, where csums is a dictionary
+    of {csumtype: expected_value}. Files are hashed concurrently. Raises
+    ValueError listing every file that failed to match.
+    """
+    if meter is None:
+        meter = urlgrabber.progress.BaseMeter()
+    if max_workers is None:
+        max_workers = _MAX_WORKERS
+
+    work = []
+    for path, csums in checks:
+        csumtype, csumvalue = pick_checksum(csums)
+        if not csumtype:
+            continue
+        if use_cache and _cache_lookup(path, csumtype, csumvalue):
+            logging.debug("Using cached %s verification for %s",
+                          csumtype, path)
+            continue
+        work.append((path, csumtype, csumvalue))
+
+    if not work:
+        return
+
+    total = sum([_file_size(w[0]) for w in work])
+    if len(work) == 1:
+        text = _("Checking disk signature for %s") % work[0][0]
+    else:
+        text = _("Checking disk signatures for %d disks") % len(work)
+    meter.start(size=total, text=text)
+    progress = _AggregateProgress(meter)
+
+    queue = Queue.Queue()
+    for w in work:
+        queue.put(w)
+    errors = []
+
+    def _worker():
+        while True:
+            try:
+                path, csumtype, csumvalue = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                checksum = compute_checksum(path, csumtype,
+                                            progress_cb=progress.update)
+            except Exception, e:
+                logging.debug("Error computing checksum for %s", path,
+                              exc_info=True)
+                errors.append(_("Error checking disk signature for "
+                                "%(path)s: %(err)s") %
+                              {"path": path, "err": str(e)})
+                continue
+
+            if checksum != csumvalue:
+                logging.debug("Disk signature for %s does not match "
+                              "Expected: %s  Received: %s",
+                              path, csumvalue, checksum)
+                errors.append(_("Disk signature for %s does not match") %
+                              path)
+                continue
+
+            if use_cache:
+                _cache_store(path, csumtype, csumvalue)
+
+    threads = []
+    for ignore in range(min(max_workers, len(work))):
+        t = threading.Thread(target=_worker,
+                             name="Checksum verification thread")
+        t.daemon = True
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+    meter.end(total)
+    if errors:
+        raise ValueError("\n".join(errors))
@@ -40,6 +40,11 @@ force = False
 quiet = False
 doprompt = True
 
+# Set by virt-cli-server workers: commands run on behalf of a client,
+# and getConnection hands out connections from this cache
+in_server = False
+connection_cache = None
+
 
 ####################
 # CLI init helpers #
@@ -195,6 +200,12 @@ def setupLogging(appname, debug_stdout, do_quiet, cli_app=True):
 #######################################
 
 def getConnection(uri):
+    if connection_cache is not None:
+        return connection_cache.get(uri, _openConnection)
+    return _openConnection(uri)
+
+
+def _openConnection(uri):
     logging.debug("Requesting libvirt URI %s", (uri or "default"))
     conn = virtinst.VirtualConnection(uri)
     conn.open(_do_creds_authname)
@@ -1757,7 +1768,9 @@ class ParserDisk(VirtCLIParser):
         return inst
 
 
-parse_disk = ParserDisk("disk").parse
+def parse_disk(*args, **kwargs):
+    # Built on demand, so importing cli doesn't pull in the device modules
+    return ParserDisk("disk").parse(*args, **kwargs)
 
 
 #####################
@@ -2091,19 +2104,27 @@ class _ParserChar(VirtCLIParser):
 
 
 class ParserSerial(_ParserChar):
-    devclass = virtinst.VirtualSerialDevice
+    def _init_params(self):
+        self.devclass = virtinst.VirtualSerialDevice
+        _ParserChar._init_params(self)
 
 
 class ParserParallel(_ParserChar):
-    devclass = virtinst.VirtualParallelDevice
+    def _init_params(self):
+        self.devclass = virtinst.VirtualParallelDevice
+        _ParserChar._init_params(self)
 
 
 class ParserChannel(_ParserChar):
-    devclass = virtinst.VirtualChannelDevice
+    def _init_params(self):
+        self.devclass = virtinst.VirtualChannelDevice
+        _ParserChar._init_params(self)
 
 
 class ParserConsole(_ParserChar):
-    devclass = virtinst.VirtualConsoleDevice
+    def _init_params(self):
+        self.devclass = virtinst.VirtualConsoleDevice
+        _ParserChar._init_params(self)
 
 
 ########################
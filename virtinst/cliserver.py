@@ -0,0 +1,518 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+"""
+Long running server for virt-install, virt-xml and virt-clone.
+
+virt-cli-server listens on a unix socket and runs commands in a pool of
+pre-forked worker processes. Each worker keeps its libvirt connections,
+capabilities and support checks warm across commands. When the
+VIRTINST_CLI_SERVER environment variable names the socket, the CLI
+tools forward their argv to the server and relay output, stdin reads
+and the exit status back to the caller.
+
+The protocol is newline separated JSON messages. The client sends a
+single request with its argv, cwd and environment, the server answers
+with the worker 'pid', 'stream' output messages and 'stdin' read
+requests, and finishes with an 'exit' message. Ctrl-C in the client is
+forwarded to the worker as SIGINT.
+"""
+
+import errno
+import imp
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+SERVER_ENV = "VIRTINST_CLI_SERVER"
+DEFAULT_WORKERS = 4
+
+# prog name -> module name we load it as, same as the test suite
+_TOOLS = {
+    "virt-install": "virtinstall",
+    "virt-xml": "virtxml",
+    "virt-clone": "virtclone",
+}
+
+
+def get_server_address():
+    """
+    Socket path of the server the CLI tools should forward to, if any
+    """
+    return os.environ.get(SERVER_ENV) or None
+
+
+def _default_address():
+    from virtinst import util
+    return os.path.join(util.get_cache_dir(), "cli-server.sock")
+
+
+class _Channel(object):
+    """
+    Newline separated JSON messages over a connected socket
+    """
+    def __init__(self, sock):
+        self._sock = sock
+        self._rfile = sock.makefile("rb")
+
+    def send(self, **msg):
+        self._sock.sendall(json.dumps(msg) + "\n")
+
+    def recv(self):
+        line = self._rfile.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def close(self):
+        self._rfile.close()
+        self._sock.close()
+
+
+##########
+# Client #
+##########
+
+def _client_stdin_reply(chan, msg):
+    mode = msg["stdin"]
+    try:
+        if mode == "readline":
+            data = sys.stdin.readline()
+        elif msg.get("size", -1) < 0:
+            data = sys.stdin.read()
+        else:
+            data = sys.stdin.read(msg["size"])
+    except IOError, e:
+        if e.errno != errno.EINTR:
+            raise
+        # Ctrl-C at a prompt, the worker is being interrupted too
+        data = ""
+    chan.send(data=data.decode("utf-8", "replace"))
+
+
+def _client_environ():
+    # JSON only carries unicode, skip anything that isn't valid UTF-8
+    ret = {}
+    for key, val in os.environ.items():
+        try:
+            ret[key.decode("utf-8")] = val.decode("utf-8")
+        except UnicodeDecodeError:
+            logging.debug("Not forwarding environment variable %r", key)
+    return ret
+
+
+def run_client(prog, address, argv=None):
+    """
+    Run @prog with @argv on the server at @address, relaying its output.
+    Returns the command's exit status.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+    except socket.error, e:
+        print >> sys.stderr, (
+            _("Unable to connect to CLI server at %(path)s: %(err)s") %
+            {"path": address, "err": e})
+        return 1
+
+    return _run_client_session(sock, prog, argv)
+
+
+def _run_client_session(sock, prog, argv):
+    chan = _Channel(sock)
+    workerpid = []
+
+    def forward_sigint(ignore1, ignore2):
+        # Let the command abort and report like it would locally. The
+        # socket reads are retried on EINTR, so we don't lose output.
+        if workerpid:
+            try:
+                os.kill(workerpid[0], signal.SIGINT)
+            except OSError, e:
+                logging.debug("Unable to forward SIGINT: %s", e)
+    origsigint = signal.signal(signal.SIGINT, forward_sigint)
+
+    try:
+        chan.send(prog=prog, argv=argv, cwd=os.getcwd(),
+                  env=_client_environ(),
+                  isatty={"stdin": sys.stdin.isatty(),
+                          "stdout": sys.stdout.isatty(),
+                          "stderr": sys.stderr.isatty()})
+
+        while True:
+            msg = chan.recv()
+            if msg is None:
+                print >> sys.stderr, _("CLI server closed the connection")
+                return 1
+
+            if "pid" in msg:
+                workerpid.append(msg["pid"])
+            elif "stream" in msg:
+                out = msg["stream"] == "stderr" and sys.stderr or sys.stdout
+                out.write(msg["data"].encode("utf-8"))
+                out.flush()
+            elif "stdin" in msg:
+                _client_stdin_reply(chan, msg)
+            elif "exit" in msg:
+                return msg["exit"]
+    finally:
+        signal.signal(signal.SIGINT, origsigint)
+        chan.close()
+
+
+##########
+# Server #
+##########
+
+class _RemoteOutput(object):
+    """
+    Stand in for sys.stdout/sys.stderr that forwards to the client
+    """
+    encoding = "utf-8"
+
+    def __init__(self, chan, name, isatty):
+        self._chan = chan
+        self._name = name
+        self._isatty = isatty
+        self.closed = False
+
+    def write(self, data):
+        if not data:
+            return
+        if type(data) is not unicode:
+            data = data.decode("utf-8", "replace")
+        self._chan.send(stream=self._name, data=data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self._isatty
+
+
+class _RemoteInput(object):
+    """
+    Stand in for sys.stdin that reads from the client on demand
+    """
+    def __init__(self, chan, isatty):
+        self._chan = chan
+        self._isatty = isatty
+        self.closed = False
+
+    def _request(self, mode, size=-1):
+        self._chan.send(stdin=mode, size=size)
+        msg = self._chan.recv()
+        if msg is None:
+            raise IOError(errno.EPIPE, "CLI client went away")
+        return msg["data"].encode("utf-8")
+
+    def read(self, size=-1):
+        return self._request("read", size)
+
+    def readline(self, size=-1):
+        ignore = size
+        return self._request("readline")
+
+    def isatty(self):
+        return self._isatty
+
+
+class _ConnectionCache(object):
+    """
+    Keeps one open connection per URI for the life of a worker
+    """
+    def __init__(self):
+        self._conns = {}
+
+    def _resolve_uri(self, uri):
+        """
+        What libvirt will connect to for @uri in the current command's
+        environment, so a default URI never picks up a connection that
+        was opened for a client with a different default
+        """
+        if uri:
+            return uri
+        if os.environ.get("LIBVIRT_DEFAULT_URI"):
+            return os.environ["LIBVIRT_DEFAULT_URI"]
+        # Otherwise it comes from the user's libvirt.conf
+        return ("default", os.environ.get("XDG_CONFIG_HOME"),
+                os.environ.get("HOME"))
+
+    def get(self, uri, opencb):
+        key = self._resolve_uri(uri)
+        conn = self._conns.get(key)
+        if conn:
+            try:
+                conn.getLibVersion()
+                conn.invalidate_fetch_cache()
+                logging.debug("Reusing connection to %s", conn.uri)
+                return conn
+            except Exception:
+                logging.debug("Cached connection to %s is dead, reopening",
+                              conn.uri, exc_info=True)
+                del(self._conns[key])
+
+        conn = opencb(uri)
+        self._conns[key] = conn
+        return conn
+
+
+class _Worker(object):
+    def __init__(self, listener):
+        self._listener = listener
+        self._tools = {}
+        self._loghandlers = logging.getLogger().handlers[:]
+        self._loglevel = logging.getLogger().level
+
+        from virtinst import cli
+        self._cli = cli
+        cli.connection_cache = _ConnectionCache()
+        cli.in_server = True
+
+        # Commands set these module globals from their options, save
+        # the defaults so one command can't leak them into the next
+        self._clidefaults = dict([(name, getattr(cli, name)) for name in
+                                  ["force", "quiet", "doprompt"]])
+
+        # Only the command we run for a client can be interrupted
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def _load_tool(self, prog):
+        if prog not in self._tools:
+            topdir = os.path.dirname(os.path.dirname(os.path.abspath(
+                __file__)))
+            origbytecode = sys.dont_write_bytecode
+            sys.dont_write_bytecode = True
+            try:
+                self._tools[prog] = imp.load_source(
+                    _TOOLS[prog], os.path.join(topdir, prog))
+            finally:
+                sys.dont_write_bytecode = origbytecode
+        return self._tools[prog]
+
+    def _reset_logging(self):
+        # Drop whatever handlers the command's setupLogging added
+        rootLogger = logging.getLogger()
+        for handler in rootLogger.handlers[:]:
+            rootLogger.removeHandler(handler)
+            if handler not in self._loghandlers:
+                handler.close()
+        for handler in self._loghandlers:
+            rootLogger.addHandler(handler)
+        rootLogger.setLevel(self._loglevel)
+
+    def _set_environ(self, env):
+        # Go through os.environ so libvirt sees the changes too
+        for key in os.environ.keys():
+            if key not in env:
+                del(os.environ[key])
+        os.environ.update(env)
+
+    def _reset_state(self):
+        for name, val in self._clidefaults.items():
+            setattr(self._cli, name, val)
+        self._reset_logging()
+
+    def _run_command(self, chan, request):
+        prog = request.get("prog")
+        if prog not in _TOOLS:
+            chan.send(stream="stderr",
+                      data=_("Unknown command '%s'\n") % prog)
+            return 2
+
+        module = self._load_tool(prog)
+        isatty = request.get("isatty", {})
+
+        origstate = (sys.argv, sys.stdin, sys.stdout, sys.stderr,
+                     sys.excepthook, os.getcwd())
+        origenv = os.environ.copy()
+        ret = 1
+        start = time.time()
+        self._reset_state()
+        try:
+            sys.argv = [prog] + [a.encode("utf-8") for a in
+                                 request.get("argv", [])]
+            sys.stdin = _RemoteInput(chan, isatty.get("stdin", False))
+            sys.stdout = _RemoteOutput(chan, "stdout",
+                                       isatty.get("stdout", False))
+            sys.stderr = _RemoteOutput(chan, "stderr",
+                                       isatty.get("stderr", False))
+            os.chdir((request.get("cwd") or "/").encode("utf-8"))
+            # The default URI, locale and ssh agent are the client's
+            self._set_environ(dict([(key.encode("utf-8"), val.encode("utf-8"))
+                                    for key, val in
+                                    request.get("env", {}).items()]))
+
+            try:
+                signal.signal(signal.SIGINT, signal.default_int_handler)
+                try:
+                    ret = module.main()
+                finally:
+                    signal.signal(signal.SIGINT, signal.SIG_IGN)
+            except SystemExit, e:
+                ret = e.code
+            except KeyboardInterrupt:
+                logging.debug("", exc_info=True)
+                self._cli.print_stderr(_("Aborted at user request"))
+            except Exception, e:
+                self._cli.fail(e, do_exit=False)
+
+            if ret is None:
+                ret = 0
+            elif type(ret) is not int:
+                print >> sys.stderr, ret
+                ret = 1
+        finally:
+            (sys.argv, sys.stdin, sys.stdout, sys.stderr,
+             sys.excepthook, cwd) = origstate
+            os.chdir(cwd)
+            self._set_environ(origenv)
+            self._reset_state()
+
+        logging.debug("%s %s finished with %s in %.3f seconds", prog,
+                      request.get("argv"), ret, time.time() - start)
+        return ret
+
+    def _handle_client(self, sock):
+        chan = _Channel(sock)
+        try:
+            request = chan.recv()
+            if not request:
+                return
+            chan.send(pid=os.getpid())
+            ret = self._run_command(chan, request)
+            chan.send(exit=ret)
+        except (IOError, socket.error), e:
+            logging.debug("Lost CLI client: %s", e)
+        finally:
+            chan.close()
+
+    def serve_forever(self):
+        while True:
+            try:
+                sock = self._listener.accept()[0]
+            except socket.error, e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            self._handle_client(sock)
+
+
+def _check_stale_socket(address):
+    if not os.path.exists(address):
+        return
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+        raise RuntimeError(_("A CLI server is already listening on %s") %
+                           address)
+    except socket.error:
+        logging.debug("Removing stale socket %s", address)
+        os.unlink(address)
+    finally:
+        sock.close()
+
+
+def run_server(address=None, workers=DEFAULT_WORKERS):
+    """
+    Listen on @address and serve commands with @workers processes until
+    we get SIGTERM or SIGINT
+    """
+    address = address or _default_address()
+    _check_stale_socket(address)
+
+    dirname = os.path.dirname(address)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname, 0700)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    origmask = os.umask(0077)
+    try:
+        listener.bind(address)
+    finally:
+        os.umask(origmask)
+    listener.listen(128)
+    logging.debug("CLI server listening on %s with %d workers",
+                  address, workers)
+
+    # Workers are forked before any libvirt connection is opened, so
+    # nothing is shared between them but the listening socket
+    children = set()
+    stopping = []
+
+    def spawn():
+        pid = os.fork()
+        if pid:
+            children.add(pid)
+            return
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            _Worker(listener).serve_forever()
+        except KeyboardInterrupt:
+            pass
+        except:
+            logging.exception("CLI server worker failed")
+        os._exit(0)  # pylint: disable=W0212
+
+    def stop(ignore1, ignore2):
+        stopping.append(True)
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        for ignore in range(workers):
+            spawn()
+
+        while not stopping:
+            try:
+                pid = os.wait()[0]
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            children.discard(pid)
+            if not stopping:
+                logging.debug("CLI server worker %d exited, respawning", pid)
+                # Don't spin if workers die straight away
+                time.sleep(1)
+                spawn()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        listener.close()
+        if os.path.exists(address):
+            os.unlink(address)
+
+    return 0
@@ -63,6 +63,7 @@ class Cloner(object):
         self._preserve = True
         self._clone_running = False
         self._replace = False
+        self._linked = False
 
         # Default clone policy for back compat: don't clone readonly,
         # shareable, or empty disks
@@ -256,6 +257,16 @@ class Cloner(object):
     replace = property(_get_replace, _set_replace,
                        doc="If enabled, don't check for clone name collision, "
                            "simply undefine any conflicting guest.")
+
+    def _get_linked(self):
+        return self._linked
+    def _set_linked(self, val):
+        self._linked = bool(val)
+    linked = property(_get_linked, _set_linked,
+                      doc="If enabled, create qcow2 overlays backed by the "
+                          "original disks instead of copying them. The "
+                          "original guest must not write to its disks "
+                          "afterwards, or the clone is corrupted.")
     # Functional methods
 
     def setup_original(self):
@@ -295,6 +306,28 @@ class Cloner(object):
                 raise RuntimeError(_("Domain with devices to clone must be "
                                      "paused or shutoff."))
 
+        if self.linked:
+            self._validate_linked()
+
+    def _validate_linked(self):
+        """
+        Overlays are only safe if the original can't write to the disks
+        they are backed by: it must be shutoff, or only use them readonly
+        """
+        if not self.original_dom:
+            return
+
+        if self.original_dom.info()[0] == libvirt.VIR_DOMAIN_SHUTOFF:
+            return
+
+        writable = [d.target for d in self._guest.get_devices("disk")
+                    if d.path and not d.read_only and
+                    d.target in [o.target for o in self.original_disks]]
+        if writable:
+            raise RuntimeError(_("Domain must be shutoff to create a linked "
+                                 "clone of its writable disks: %s") %
+                               ", ".join(writable))
+
     def _setup_disk_clone_destination(self, orig_disk, clone_disk):
         """
         Helper that validates the new path location
@@ -302,6 +335,10 @@ class Cloner(object):
         if self.preserve_dest_disks:
             return
 
+        if self.linked and orig_disk.path:
+            self._setup_disk_linked_destination(orig_disk, clone_disk)
+            return
+
         if clone_disk.get_vol_object():
             # XXX We could always do this with vol upload?
 
@@ -352,6 +389,24 @@ class Cloner(object):
         clone_disk.validate()
 
 
+    def _setup_disk_linked_destination(self, orig_disk, clone_disk):
+        """
+        Set up @clone_disk as a qcow2 overlay of @orig_disk. This goes
+        through the storage pool API when the new path is managed
+        """
+        if (clone_disk.get_vol_object() or
+            (clone_disk.path and os.path.exists(clone_disk.path) and
+             not self.conn.is_remote())):
+            raise RuntimeError(
+                _("Linked clone destination '%s' already exists.") %
+                clone_disk.path)
+
+        clone_disk.set_create_storage(size=orig_disk.get_size(),
+                                      fmt="qcow2",
+                                      backing_store=orig_disk.path,
+                                      backing_format=orig_disk.driver_type)
+        clone_disk.validate()
+
     def setup_clone(self):
         """
         Validate and set up all parameters needed for the new (clone) VM
@@ -401,6 +456,9 @@ class Cloner(object):
             xmldisk.type = clone_disk.type
             xmldisk.driver_name = orig_disk.driver_name
             xmldisk.driver_type = orig_disk.driver_type
+            if self.linked and orig_disk.path and self.preserve:
+                xmldisk.driver_name = VirtualDisk.DRIVER_QEMU
+                xmldisk.driver_type = "qcow2"
             xmldisk.path = clone_disk.path
 
         # Save altered clone xml
@@ -460,6 +518,9 @@ class Cloner(object):
         if origpath.count(".") and len(origpath.rsplit(".", 1)[1]) <= 7:
             path, suffix = origpath.rsplit(".", 1)
             suffix = "." + suffix
+        if self.linked:
+            # Linked clone disks are always qcow2 overlays
+            suffix = ".qcow2"
 
         dirname = os.path.dirname(path)
         basename = os.path.basename(path)
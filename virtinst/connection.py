@@ -58,6 +58,89 @@ def _sanitize_xml(xml):
     return xml
 
 
+class _LazyVolume(object):
+    """
+    Cached libvirt volume handle, which only fetches and parses its
+    XML the first time it is needed
+    """
+    def __init__(self, connref, backend):
+        self._connref = connref
+        self.backend = backend
+        self._xmlobj = None
+
+    def get_xmlobj(self):
+        if self._xmlobj is None:
+            self._xmlobj = StorageVolume(self._connref,
+                                         parsexml=self.backend.XMLDesc(0))
+        return self._xmlobj
+
+
+class _PoolVolumeCache(object):
+    """
+    Cached volume list for a single storage pool. @generation is bumped
+    every time the volume list changes or the cache is invalidated,
+    and the path/backing store indexes are rebuilt lazily after that.
+    """
+    def __init__(self):
+        self.generation = 0
+        self.stale = True
+        self._vols = {}
+        self._index_generation = -1
+        self._path_index = {}
+        self._backing_index = {}
+
+    def invalidate(self):
+        self._vols = {}
+        self.stale = True
+        self.generation += 1
+
+    def sync(self, conn, pool, force):
+        """
+        Update our volume list from @pool. Only volumes we haven't seen
+        before have their XML fetched.
+        """
+        if not self.stale and not force:
+            return
+
+        connref = weakref.ref(conn)
+        removed, new, allvols = pollhelpers.fetch_volumes(
+            conn, pool, self._vols.copy(),
+            lambda obj, ignore: _LazyVolume(connref, obj))
+
+        if new or removed:
+            self.generation += 1
+        self._vols = allvols
+        self.stale = False
+
+    def get_vols(self):
+        return [vol.get_xmlobj() for vol in self._vols.values()]
+
+    def _build_index(self):
+        if self._index_generation == self.generation:
+            return
+
+        self._path_index = {}
+        self._backing_index = {}
+        for xmlobj in self.get_vols():
+            self._path_index.setdefault(xmlobj.target_path, []).append(xmlobj)
+            if xmlobj.backing_store:
+                self._backing_index.setdefault(
+                    xmlobj.backing_store, []).append(xmlobj)
+        self._index_generation = self.generation
+
+    def lookup_path(self, path):
+        self._build_index()
+        return self._path_index.get(path, [])
+
+    def lookup_backing_store(self, path):
+        self._build_index()
+        return self._backing_index.get(path, [])
+
+    def get_backing_index(self):
+        self._build_index()
+        return self._backing_index
+
+
 class VirtualConnection(object):
     """
     Wrapper for libvirt connection that provides various bits like
@@ -95,6 +178,9 @@ class VirtualConnection(object):
         self._support_cache = {}
         self._fetch_cache = {}
 
+        # Mapping of pool name -> _PoolVolumeCache
+        self._vol_cache = {}
+
         # Setting this means we only do fetch_all* once and just carry
         # the result. For the virt-* CLI tools this ensures any revalidation
         # isn't hammering the connection over and over
@@ -127,8 +213,13 @@ class VirtualConnection(object):
 
     def _get_caps(self):
         if not self._caps:
-            self._caps = CapabilitiesParser.Capabilities(
-                                        self.libvirtconn.getCapabilities())
+            # Don't cache for the test driver or the test suite's fake
+            # connections
+            use_cache = not (self.is_test() or self._test_opts)
+            self._caps = CapabilitiesParser.load_capabilities(
+                self.libvirtconn.getCapabilities(), uri=self.uri,
+                version=use_cache and self.daemon_version() or 0,
+                use_cache=use_cache)
         return self._caps
     caps = property(_get_caps)
 
@@ -141,10 +232,20 @@ class VirtualConnection(object):
         self._libvirtconn = None
         self._uri = None
         self._fetch_cache = {}
+        self._vol_cache = {}
 
     def invalidate_caps(self):
         self._caps = None
 
+    def invalidate_fetch_cache(self):
+        """
+        Drop cached object lists but keep caps and support checks, for
+        when one connection is reused by several CLI commands
+        """
+        self._fetch_cache = {}
+        for cache in self._vol_cache.values():
+            cache.invalidate()
+
     def is_open(self):
         return bool(self._libvirtconn)
 
@@ -168,7 +269,7 @@ class VirtualConnection(object):
 
     _FETCH_KEY_GUESTS = "vms"
     _FETCH_KEY_POOLS = "pools"
-    _FETCH_KEY_VOLS = "vols"
+    _FETCH_KEY_POOL_HANDLES = "poolhandles"
 
     def _fetch_all_guests_cached(self):
         key = self._FETCH_KEY_GUESTS
@@ -212,21 +313,38 @@ class VirtualConnection(object):
             return self.cb_fetch_all_pools()  # pylint: disable=E1102
         return self._fetch_all_pools_cached()
 
-    def _fetch_all_vols_cached(self):
-        key = self._FETCH_KEY_VOLS
+    def _sync_vol_cache(self):
+        """
+        Bring the per pool volume cache up to date. Unless
+        cache_object_fetch is set, every pool's volume list is checked
+        for additions and removals, but only new volumes are parsed.
+        """
+        key = self._FETCH_KEY_POOL_HANDLES
         if key in self._fetch_cache:
-            return self._fetch_cache[key]
+            pools = self._fetch_cache[key]
+        else:
+            ignore, ignore, pools = pollhelpers.fetch_pools(
+                self, {}, lambda obj, ignore: obj)
+            pools = dict((pool.name(), pool) for pool in pools.values())
+            if self.cache_object_fetch:
+                self._fetch_cache[key] = pools
 
-        ret = []
-        for xmlobj in self.fetch_all_pools():
-            pool = self._libvirtconn.storagePoolLookupByName(xmlobj.name)
-            ignore, ignore, vols = pollhelpers.fetch_volumes(
-                self, pool, {}, lambda obj, ignore: obj)
-            ret += [StorageVolume(weakref.ref(self), parsexml=obj.XMLDesc(0))
-                    for obj in vols.values()]
+        for name in self._vol_cache.keys():
+            if name not in pools:
+                del self._vol_cache[name]
 
-        if self.cache_object_fetch:
-            self._fetch_cache[key] = ret
+        force = not self.cache_object_fetch
+        for name, pool in pools.items():
+            if name not in self._vol_cache:
+                self._vol_cache[name] = _PoolVolumeCache()
+            self._vol_cache[name].sync(self, pool, force)
+
+        return self._vol_cache.values()
+
+    def _fetch_all_vols_cached(self):
+        ret = []
+        for cache in self._sync_vol_cache():
+            ret += cache.get_vols()
         return ret
 
     def fetch_all_vols(self):
@@ -237,6 +355,57 @@ class VirtualConnection(object):
             return self.cb_fetch_all_vols()  # pylint: disable=E1102
         return self._fetch_all_vols_cached()
 
+    def fetch_vols_by_path(self, path):
+        """
+        Returns a list of StorageVolume objects with target path @path
+        """
+        if self.cb_fetch_all_vols:
+            return [vol for vol in self.fetch_all_vols()
+                    if vol.target_path == path]
+
+        ret = []
+        for cache in self._sync_vol_cache():
+            ret += cache.lookup_path(path)
+        return ret
+
+    def fetch_vols_by_backing_store(self, path):
+        """
+        Returns a list of StorageVolume objects backed by @path
+        """
+        if self.cb_fetch_all_vols:
+            return [vol for vol in self.fetch_all_vols()
+                    if vol.backing_store == path]
+
+        ret = []
+        for cache in self._sync_vol_cache():
+            ret += cache.lookup_backing_store(path)
+        return ret
+
+    def fetch_backing_store_index(self):
+        """
+        Returns a dict of backing store path -> list of StorageVolume
+        objects backed by it, for walking whole backing chains with a
+        single volume cache sync
+        """
+        ret = {}
+        if self.cb_fetch_all_vols:
+            for vol in self.fetch_all_vols():
+                if vol.backing_store:
+                    ret.setdefault(vol.backing_store, []).append(vol)
+            return ret
+
+        for cache in self._sync_vol_cache():
+            for path, vols in cache.get_backing_index().items():
+                ret.setdefault(path, []).extend(vols)
+        return ret
+
+    def invalidate_pool_volumes(self, poolname):
+        """
+        Force the cached volume list for @poolname to be refetched
+        """
+        if poolname in self._vol_cache:
+            self._vol_cache[poolname].invalidate()
+
     def clear_cache(self, pools=False):
         if self.cb_clear_cache:
             self.cb_clear_cache(pools=pools)  # pylint: disable=E1102
@@ -244,6 +413,9 @@ class VirtualConnection(object):
 
         if pools:
             self._fetch_cache.pop(self._FETCH_KEY_POOLS, None)
+            self._fetch_cache.pop(self._FETCH_KEY_POOL_HANDLES, None)
+            for cache in self._vol_cache.values():
+                cache.invalidate()
 
 
     #########################
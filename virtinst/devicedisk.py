@@ -99,7 +99,7 @@ def _is_dir_searchable(uid, username, path):
 
 def _distill_storage(conn, do_create, nomanaged,
                      path, vol_object, vol_install,
-                     clone_path, backing_store,
+                     clone_path, backing_store, backing_format,
                      *args):
     """
     Validates and updates params when the backing storage is changed
@@ -133,7 +133,8 @@ def _distill_storage(conn, do_create, nomanaged,
     if path or vol_install or pool or clone_path:
         creator = diskbackend.StorageCreator(conn, path, pool,
                                              vol_install, clone_path,
-                                             backing_store, *args)
+                                             backing_store, backing_format,
+                                             *args)
     return backend, creator
 
 
@@ -346,15 +347,16 @@ class VirtualDisk(VirtualDevice):
             return []
 
         # Find all volumes that have 'path' somewhere in their backing chain
+        backing_index = conn.fetch_backing_store_index()
         vols = []
-        volmap = dict((vol.backing_store, vol)
-                      for vol in conn.fetch_all_vols() if vol.backing_store)
         backpath = path
-        while backpath in volmap:
-            vol = volmap[backpath]
-            if vol in vols:
+        while True:
+            children = backing_index.get(backpath)
+            if not children:
+                break
+            backpath = children[-1].target_path
+            if backpath in vols:
                 break
-            backpath = vol.target_path
             vols.append(backpath)
 
         ret = []
@@ -591,13 +593,14 @@ class VirtualDisk(VirtualDevice):
     def set_create_storage(self, size=None, sparse=True,
                            fmt=None, vol_install=None,
                            clone_path=None, backing_store=None,
-                           fake=False):
+                           backing_format=None, fake=False):
         """
         Function that sets storage creation parameters. If this isn't
         called, we assume that no storage creation is taking place and
         will error accordingly.
 
         @size is in gigs
+        @backing_format: Format of @backing_store, so it isn't probed
         @fake: If true, make like we are creating storage but fail
             if we ever asked to do so.
         """
@@ -634,7 +637,7 @@ class VirtualDisk(VirtualDevice):
 
         ignore, creator = _distill_storage(
             self.conn, True, self.nomanaged, path, None,
-            vol_install, clone_path, backing_store,
+            vol_install, clone_path, backing_store, backing_format,
             size, sparse, fmt)
 
         self._storage_creator = creator
@@ -661,7 +664,7 @@ class VirtualDisk(VirtualDevice):
     def _change_backend(self, path, vol_object):
         backend, ignore = _distill_storage(
                                 self.conn, False, self.nomanaged,
-                                path, vol_object, None, None, None)
+                                path, vol_object, None, None, None, None)
         self._storage_backend = backend
 
     def sync_path_props(self):
@@ -21,6 +21,7 @@
 import logging
 import os
 import statvfs
+import subprocess
 
 import libvirt
 
@@ -171,7 +172,7 @@ class _StorageBase(object):
 
 class StorageCreator(_StorageBase):
     def __init__(self, conn, path, pool,
-                 vol_install, clone_path, backing_store,
+                 vol_install, clone_path, backing_store, backing_format,
                  size, sparse, fmt):
         _StorageBase.__init__(self)
 
@@ -182,13 +183,15 @@ class StorageCreator(_StorageBase):
         self._size = size
         self._sparse = sparse
         self._clone_path = clone_path
+        self._backing_store = None
+        self._backing_format = None
         self.fake = False
 
         if not self._vol_install and self._pool:
             self._vol_install = build_vol_install(conn, path, pool,
                                                    size, sparse)
+        self._set_backing_store(backing_store, backing_format)
         self._set_format(fmt)
-        self._set_backing_store(backing_store)
 
         if self._vol_install:
             self._path = None
@@ -213,17 +216,26 @@ class StorageCreator(_StorageBase):
             if self._vol_install.format != val:
                 self._vol_install.format = val
 
-        elif val != "raw":
+        elif val != "raw" and not (val == "qcow2" and self._backing_store):
             raise RuntimeError(_("Format cannot be specified for "
                                  "unmanaged storage."))
 
-    def _set_backing_store(self, val):
+    def _set_backing_store(self, val, fmt):
         if val is None:
             return
-        if not self._vol_install:
+        if self._vol_install:
+            self._vol_install.backing_store = val
+            if fmt:
+                self._vol_install.backing_format = fmt
+            return
+
+        # Unmanaged overlays are created with qemu-img, which only
+        # works for local paths
+        if self._conn.is_remote():
             raise RuntimeError(_("Cannot set backing store for unmanaged "
                                  "storage."))
-        self._vol_install.backing_store = val
+        self._backing_store = val
+        self._backing_format = fmt
 
 
     ##############
@@ -264,6 +276,8 @@ class StorageCreator(_StorageBase):
         if self._vol_install:
             if self._vol_install.supports_property("format"):
                 return self._vol_install.format
+        if self._backing_store:
+            return "qcow2"
         return "raw"
 
     def is_managed(self):
@@ -293,6 +307,9 @@ class StorageCreator(_StorageBase):
     def is_size_conflict(self):
         if self._vol_install:
             return self._vol_install.is_size_conflict()
+        if self._backing_store:
+            # Overlays start out empty
+            return (False, None)
 
         ret = False
         msg = None
@@ -329,7 +346,11 @@ class StorageCreator(_StorageBase):
             (not self._clone_path or self._vol_install.input_vol)):
             return self._vol_install.install(meter=progresscb)
 
-        if self._clone_path:
+        if self._backing_store:
+            text = (_("Creating overlay %(path)s for %(srcfile)s") %
+                    {'path': os.path.basename(self._path),
+                     'srcfile': os.path.basename(self._backing_store)})
+        elif self._clone_path:
             text = (_("Cloning %(srcfile)s") %
                     {'srcfile' : os.path.basename(self._clone_path)})
         else:
@@ -339,7 +360,10 @@ class StorageCreator(_StorageBase):
         progresscb.start(filename=self._path, size=long(size_bytes),
                          text=text)
 
-        if self._clone_path:
+        if self._backing_store:
+            # qcow2 overlay, no data is copied
+            self._create_local_overlay(progresscb, size_bytes)
+        elif self._clone_path:
             # Plain file clone
             self._clone_local(progresscb, size_bytes)
         else:
@@ -381,6 +405,31 @@ class StorageCreator(_StorageBase):
                 os.close(fd)
             progresscb.end(size_bytes)
 
+    def _create_local_overlay(self, progresscb, size_bytes):
+        """
+        Create a qcow2 overlay at self.path backed by self._backing_store
+        """
+        cmd = ["qemu-img", "create", "-f", "qcow2",
+               "-b", self._backing_store]
+        if self._backing_format:
+            # Don't let qemu-img probe the backing file's format
+            cmd += ["-F", self._backing_format]
+        cmd.append(self._path)
+        logging.debug("Creating local overlay with cmd=%s", cmd)
+
+        try:
+            proc = subprocess.Popen(cmd,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            ignore, err = proc.communicate()
+            if proc.returncode != 0:
+                raise RuntimeError(err.strip())
+        except (OSError, RuntimeError), e:
+            raise RuntimeError(_("Error creating overlay %s: %s") %
+                               (self._path, str(e)))
+        finally:
+            progresscb.end(size_bytes)
+
     def _clone_local(self, meter, size_bytes):
         if self._clone_path == "/dev/null":
             # Not really sure why this check is here,
@@ -0,0 +1,359 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+"""
+In process helpers for injecting files into an install initrd.
+
+The kernel accepts multiple concatenated cpio archives as an initramfs,
+so for regular initrds we just stream a small newc archive onto the end
+of the existing file. The generated archive is cached on disk keyed on
+the injected files, so bulk installs with the same kickstart only build
+it once, and appending it never needs a copy of the whole initrd.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import subprocess
+
+
+_BLOCKSIZE = 1024 * 1024
+_CACHE_DIRNAME = "initrd-inject-cache"
+_CACHE_MAX_ENTRIES = 10
+
+
+def _pad4(size):
+    return (4 - (size % 4)) % 4
+
+
+class CpioNewcWriter(object):
+    """
+    Minimal streaming writer for the SVR4 'newc' cpio format, which is
+    the format the kernel initramfs unpacker understands.
+    """
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._ino = 0
+
+    def _write_header(self, name, mode, size, mtime, nlink=1):
+        self._ino += 1
+        namesize = len(name) + 1
+        fields = [self._ino, mode, 0, 0, nlink, int(mtime), size,
+                  0, 0, 0, 0, namesize, 0]
+        header = "070701" + "".join(["%08X" % f for f in fields])
+        self._fileobj.write(header)
+        self._fileobj.write(name + "\0")
+        self._fileobj.write("\0" * _pad4(len(header) + namesize))
+
+    def add_dir(self, name, perms=0755, mtime=0):
+        self._write_header(name, stat.S_IFDIR | perms, 0, mtime, nlink=2)
+
+    def add_file(self, name, path):
+        """
+        Stream the local file @path into the archive as @name
+        """
+        st = os.stat(path)
+        size = st.st_size
+        self._write_header(name, stat.S_IFREG | stat.S_IMODE(st.st_mode),
+                           size, st.st_mtime)
+
+        written = 0
+        f = open(path, "rb")
+        try:
+            while True:
+                data = f.read(_BLOCKSIZE)
+                if not data:
+                    break
+                self._fileobj.write(data)
+                written += len(data)
+        finally:
+            f.close()
+
+        if written != size:
+            raise RuntimeError("%s changed size while building initrd "
+                               "archive" % path)
+        self._fileobj.write("\0" * _pad4(size))
+
+    def close(self):
+        self._write_header("TRAILER!!!", 0, 0, 0, nlink=1)
+
+
+def _hash_file(path):
+    m = hashlib.sha256()
+    f = open(path, "rb")
+    try:
+        while True:
+            data = f.read(_BLOCKSIZE)
+            if not data:
+                break
+            m.update(data)
+    finally:
+        f.close()
+    return m.hexdigest()
+
+
+def _build_cache_key(injections, compress):
+    """
+    Key for the archive generated from @injections. Everything that ends
+    up in the cpio headers is part of it, not just the file contents.
+    """
+    m = hashlib.sha256()
+    m.update(compress and "gz" or "raw")
+    for filename in injections:
+        st = os.stat(filename)
+        m.update("\0%s\0%o\0%d\0" % (os.path.basename(filename),
+                                      stat.S_IMODE(st.st_mode),
+                                      int(st.st_mtime)))
+        m.update(_hash_file(filename))
+    return m.hexdigest()
+
+
+def _replace_file(src, dest):
+    """
+    Atomically replace @dest with a copy of @src. We don't hardlink
+    since the initrd may be modified or unlinked behind our back.
+    """
+    tmp = dest + ".tmp"
+    shutil.copyfile(src, tmp)
+    os.rename(tmp, dest)
+
+
+def _prepare_cache_dir(cachedir):
+    if not os.path.exists(cachedir):
+        os.makedirs(cachedir, 0750)
+
+
+def _prune_cache(cachedir):
+    try:
+        entries = [os.path.join(cachedir, f) for f in os.listdir(cachedir)]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for path in entries[_CACHE_MAX_ENTRIES:]:
+            logging.debug("Removing stale cached initrd %s", path)
+            os.unlink(path)
+    except OSError:
+        logging.debug("Failed to prune initrd cache", exc_info=True)
+
+
+##################
+# RHEL4 handling #
+##################
+
+def _is_ext2_initrd(initrd):
+    # ext2 superblock starts at offset 1024, magic is at offset 56 in it
+    try:
+        f = gzip.open(initrd, "rb")
+        try:
+            data = f.read(1024 + 58)
+        finally:
+            f.close()
+    except IOError:
+        logging.debug("Error reading initrd header", exc_info=True)
+        return False
+    return len(data) == 1082 and data[1080:1082] == "\x53\xef"
+
+
+def _rhel4_initrd_inject(initrd, injections):
+    # Uncompress the initrd
+    newinitrd = initrd + ".new"
+    src = gzip.open(initrd, "rb")
+    dest = open(newinitrd, "wb")
+    try:
+        shutil.copyfileobj(src, dest, _BLOCKSIZE)
+    finally:
+        src.close()
+        dest.close()
+
+    try:
+        # We have an ext2 filesystem, use a single debugfs run to
+        # inject all the files
+        cmds = "".join(["write %s %s\n" % (filename,
+                                            os.path.basename(filename))
+                        for filename in injections])
+        cmd = ["debugfs", "-w", "-f", "-", newinitrd]
+        logging.debug("Copying %s to the initrd with cmd=%s",
+                      injections, cmd)
+
+        debugfs_proc = subprocess.Popen(cmd,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+        ignore, debugfserr = debugfs_proc.communicate(cmds)
+        if debugfserr:
+            logging.debug("debugfs stderr=%s", debugfserr)
+
+        # Recompress the initrd
+        src = open(newinitrd, "rb")
+        dest = gzip.open(initrd, "wb")
+        try:
+            shutil.copyfileobj(src, dest, _BLOCKSIZE)
+        finally:
+            src.close()
+            dest.close()
+    finally:
+        os.unlink(newinitrd)
+
+
+def _rhel4_perform_injections(initrd, injections, cachedir):
+    """
+    debugfs rewrites the whole initrd, so the only thing worth caching
+    is the result, keyed on the original initrd as well
+    """
+    cachepath = None
+    if cachedir:
+        try:
+            key = hashlib.sha256(_hash_file(initrd) +
+                                 _build_cache_key(injections, False))
+            cachepath = os.path.join(cachedir, "initrd-" + key.hexdigest())
+        except (IOError, OSError):
+            logging.debug("Error building initrd cache key", exc_info=True)
+
+    if cachepath and os.path.exists(cachepath):
+        logging.debug("Using cached injected initrd %s", cachepath)
+        os.utime(cachepath, None)
+        _replace_file(cachepath, initrd)
+        return
+
+    _rhel4_initrd_inject(initrd, injections)
+
+    if not cachepath:
+        return
+
+    try:
+        _prepare_cache_dir(cachedir)
+        _replace_file(initrd, cachepath)
+        _prune_cache(cachedir)
+    except (IOError, OSError):
+        logging.debug("Failed to cache injected initrd", exc_info=True)
+
+
+####################
+# Archive handling #
+####################
+
+def _write_archive(fileobj, injections, compress):
+    out = fileobj
+    if compress:
+        out = gzip.GzipFile(filename="", mode="wb", fileobj=fileobj)
+    try:
+        writer = CpioNewcWriter(out)
+        writer.add_dir(".", perms=0775)
+        for filename in injections:
+            writer.add_file(os.path.basename(filename), filename)
+        writer.close()
+    finally:
+        if out is not fileobj:
+            out.close()
+
+
+def _append_to_initrd(initrd, compress, writecb):
+    f = open(initrd, "ab")
+    try:
+        if not compress:
+            # The kernel only looks for an uncompressed archive on a
+            # 4 byte boundary, and skips any zero padding before it
+            f.seek(0, 2)
+            f.write("\0" * _pad4(f.tell()))
+        writecb(f)
+    finally:
+        f.close()
+
+
+def _get_cached_archive(injections, compress, cachedir):
+    """
+    Return the path of the archive for @injections in @cachedir,
+    building it if needed, or None if the cache isn't usable
+    """
+    try:
+        key = _build_cache_key(injections, compress)
+        cachepath = os.path.join(cachedir, "cpio-" + key)
+        if os.path.exists(cachepath):
+            logging.debug("Using cached initrd archive %s", cachepath)
+            os.utime(cachepath, None)
+            return cachepath
+
+        _prepare_cache_dir(cachedir)
+        tmp = cachepath + ".tmp"
+        f = open(tmp, "wb")
+        try:
+            _write_archive(f, injections, compress)
+        finally:
+            f.close()
+        os.rename(tmp, cachepath)
+        _prune_cache(cachedir)
+        return cachepath
+    except (IOError, OSError):
+        logging.debug("Failed to cache initrd archive", exc_info=True)
+        return None
+
+
+###############
+# Public APIs #
+###############
+
+def append_injections(initrd, injections, compress=True):
+    """
+    Append a cpio archive containing @injections to @initrd. The archive
+    is streamed straight into the initrd without any temporary copies.
+
+    :param compress: gzip the appended archive. The kernel happily
+        accepts an uncompressed trailing archive, which saves some CPU.
+    """
+    logging.debug("Appending %s to the initrd, compress=%s",
+                  injections, compress)
+    _append_to_initrd(initrd, compress,
+                      lambda f: _write_archive(f, injections, compress))
+
+
+def perform_injections(initrd, injections, scratchdir,
+                       compress=True, use_cache=True):
+    """
+    Insert files into the root directory of the initial ram disk,
+    reusing a previously generated archive if we have one cached.
+    """
+    if not injections:
+        return
+
+    cachedir = None
+    if use_cache:
+        cachedir = os.path.join(scratchdir, _CACHE_DIRNAME)
+
+    if _is_ext2_initrd(initrd):
+        logging.debug("Is RHEL4 initrd")
+        _rhel4_perform_injections(initrd, injections, cachedir)
+        return
+
+    archive = None
+    if cachedir:
+        archive = _get_cached_archive(injections, compress, cachedir)
+    if not archive:
+        append_injections(initrd, injections, compress=compress)
+        return
+
+    logging.debug("Appending %s to the initrd from %s",
+                  injections, archive)
+
+    def _copy_archive(f):
+        src = open(archive, "rb")
+        try:
+            shutil.copyfileobj(src, f, _BLOCKSIZE)
+        finally:
+            src.close()
+    _append_to_initrd(initrd, compress, _copy_archive)
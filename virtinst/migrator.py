@@ -0,0 +1,352 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+"""
+Batch migration of guests between two connections, used by virt-migrate
+and the virt-manager host dialog to evacuate a host.
+
+Guests are migrated a few at a time. The most expensive guests (large
+and busy, so likely to dirty a lot of memory) are started first so the
+long migrations overlap with the short ones. Transient failures are
+retried, and progress is reported as a single meter over the memory of
+every guest in the batch.
+"""
+
+import logging
+import Queue
+import threading
+import time
+
+import libvirt
+import urlgrabber.progress
+
+
+# libvirt error codes we expect to go away if we just try again
+_TRANSIENT_ERRORS = ["VIR_ERR_OPERATION_TIMEOUT",
+                     "VIR_ERR_OPERATION_FAILED",
+                     "VIR_ERR_RPC",
+                     "VIR_ERR_SYSTEM_ERROR",
+                     "VIR_ERR_AGENT_UNRESPONSIVE"]
+
+_POLL_INTERVAL = .5
+
+
+def _is_transient(e):
+    if not isinstance(e, libvirt.libvirtError):
+        return False
+    codes = [getattr(libvirt, name) for name in _TRANSIENT_ERRORS
+             if hasattr(libvirt, name)]
+    return e.get_error_code() in codes
+
+
+class MigrationJob(object):
+    """
+    State of a single guest in the batch
+    """
+    STATE_QUEUED = "queued"
+    STATE_RUNNING = "running"
+    STATE_DONE = "done"
+    STATE_FAILED = "failed"
+    STATE_CANCELED = "canceled"
+
+    def __init__(self, dom):
+        self.dom = dom
+        self.name = dom.name()
+
+        info = dom.info()
+        self.memory = long(info[2]) * 1024
+        self.vcpus = max(1, info[3])
+        self.busy = 0.0
+
+        self.state = self.STATE_QUEUED
+        self.error = None
+        self.attempts = 0
+        # Fraction of the current attempt that has been transferred
+        self.fraction = 0.0
+        self.downtime_set = False
+
+    def _get_cost(self):
+        return self.memory * (1 + self.busy)
+    cost = property(_get_cost)
+
+
+class BatchMigrator(object):
+    """
+    Migrate a batch of guests from @conn to @destconn, at most
+    @max_parallel at a time.
+    """
+    def __init__(self, conn, destconn):
+        self.conn = conn
+        self.destconn = destconn
+        self.jobs = []
+
+        self.max_parallel = 2
+        # Per migration bandwidth cap in MiB/s, 0 means unlimited
+        self.bandwidth = 0
+        # Maximum tolerable downtime in milliseconds, 0 means default
+        self.max_downtime = 0
+        self.migrate_uri = None
+        self.live = True
+        self.tunnelled = False
+        self.unsafe = False
+        self.undefine_source = False
+        self.retries = 2
+        self.retry_delay = 5
+
+        self._cancel = threading.Event()
+
+    def add_domain(self, dom):
+        for job in self.jobs:
+            if job.dom.UUIDString() == dom.UUIDString():
+                return job
+        job = MigrationJob(dom)
+        self.jobs.append(job)
+        return job
+
+    def add_running_domains(self):
+        """
+        Add every running guest on the source connection
+        """
+        if hasattr(self.conn, "listAllDomains"):
+            doms = self.conn.listAllDomains(
+                libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE)
+        else:
+            doms = [self.conn.lookupByID(domid) for domid in
+                    self.conn.listDomainsID()]
+
+        for dom in doms:
+            # Skip dom0
+            if dom.ID() == 0 and dom.name() == "Domain-0":
+                continue
+            self.add_domain(dom)
+
+    def cancel(self):
+        """
+        Stop starting new migrations and abort the running ones
+        """
+        self._cancel.set()
+        for job in self.jobs:
+            if job.state != MigrationJob.STATE_RUNNING:
+                continue
+            try:
+                job.dom.abortJob()
+            except libvirt.libvirtError, e:
+                logging.debug("Error aborting migration of %s: %s",
+                              job.name, e)
+
+    def _get_canceled(self):
+        return self._cancel.isSet()
+    canceled = property(_get_canceled)
+
+
+    ############
+    # Ordering #
+    ############
+
+    def order_jobs(self, sample_time=1.0):
+        """
+        Sort the jobs most expensive first. There's no cheap way to get
+        the rate a guest dirties memory, so we use its vCPU utilization
+        over @sample_time seconds as a stand in.
+        """
+        start = time.time()
+        before = {}
+        for job in self.jobs:
+            try:
+                before[job] = job.dom.info()[4]
+            except libvirt.libvirtError:
+                logging.debug("Error sampling %s", job.name, exc_info=True)
+
+        if before and sample_time:
+            time.sleep(sample_time)
+        elapsed = max(time.time() - start, 0.001) * 1000000000
+
+        for job, cputime in before.items():
+            try:
+                used = job.dom.info()[4] - cputime
+                job.busy = min(1.0, max(0.0, used / (elapsed * job.vcpus)))
+            except libvirt.libvirtError:
+                logging.debug("Error sampling %s", job.name, exc_info=True)
+
+        self.jobs.sort(key=lambda j: j.cost, reverse=True)
+        logging.debug("Migration order: %s",
+                      ", ".join(["%s (%d MiB, %.0f%% busy)" %
+                                 (j.name, j.memory / 1024 / 1024,
+                                  j.busy * 100) for j in self.jobs]))
+
+
+    ##############
+    # Migrations #
+    ##############
+
+    def _get_flags(self, job):
+        flags = 0
+        if self.live and job.dom.isActive():
+            flags |= libvirt.VIR_MIGRATE_LIVE
+        if self.tunnelled:
+            flags |= (libvirt.VIR_MIGRATE_PEER2PEER |
+                      libvirt.VIR_MIGRATE_TUNNELLED)
+        if self.unsafe:
+            flags |= libvirt.VIR_MIGRATE_UNSAFE
+        if job.dom.isPersistent():
+            flags |= libvirt.VIR_MIGRATE_PERSIST_DEST
+            if self.undefine_source:
+                flags |= libvirt.VIR_MIGRATE_UNDEFINE_SOURCE
+        return flags
+
+    def _migrate_one(self, job):
+        while not self.canceled:
+            job.attempts += 1
+            job.fraction = 0.0
+            job.downtime_set = False
+            job.state = MigrationJob.STATE_RUNNING
+            flags = self._get_flags(job)
+            logging.debug("Migrating %s, attempt %d, flags=%s uri=%s "
+                          "bandwidth=%s", job.name, job.attempts, flags,
+                          self.migrate_uri, self.bandwidth)
+
+            try:
+                job.dom.migrate(self.destconn, flags, None,
+                                self.migrate_uri, self.bandwidth)
+                job.fraction = 1.0
+                job.state = MigrationJob.STATE_DONE
+                logging.debug("Migrated %s", job.name)
+                return
+            except Exception, e:
+                job.error = str(e)
+                logging.debug("Migrating %s failed: %s", job.name, e)
+
+                if self.canceled:
+                    break
+                if not _is_transient(e) or job.attempts > self.retries:
+                    job.state = MigrationJob.STATE_FAILED
+                    return
+                try:
+                    if not job.dom.isActive():
+                        # Already gone, the error was most likely
+                        # about something after the migration
+                        job.state = MigrationJob.STATE_FAILED
+                        return
+                except libvirt.libvirtError:
+                    job.state = MigrationJob.STATE_FAILED
+                    return
+
+            job.state = MigrationJob.STATE_QUEUED
+            self._cancel.wait(self.retry_delay)
+
+        job.state = MigrationJob.STATE_CANCELED
+
+    def _poll_job(self, job):
+        try:
+            jobinfo = job.dom.jobInfo()
+        except libvirt.libvirtError:
+            return
+
+        data_total = float(jobinfo[3])
+        data_remaining = float(jobinfo[5])
+        if data_total:
+            job.fraction = (data_total - data_remaining) / data_total
+
+        if self.max_downtime and not job.downtime_set and data_total:
+            try:
+                job.dom.migrateSetMaxDowntime(self.max_downtime, 0)
+                job.downtime_set = True
+            except libvirt.libvirtError, e:
+                if e.get_error_code() != libvirt.VIR_ERR_OPERATION_INVALID:
+                    logging.debug("Error setting max downtime for %s: %s",
+                                  job.name, e)
+                    job.downtime_set = True
+
+    def _get_done(self):
+        done = 0
+        for job in self.jobs:
+            if job.state == MigrationJob.STATE_DONE:
+                done += job.memory
+            elif job.state == MigrationJob.STATE_RUNNING:
+                done += long(job.memory * job.fraction)
+        return done
+
+    def run(self, meter=None, sample_time=1.0):
+        """
+        Migrate all the jobs. Raises RuntimeError listing every guest that
+        failed, once everything else has finished.
+        """
+        if meter is None:
+            meter = urlgrabber.progress.BaseMeter()
+        if not self.jobs:
+            return
+
+        self.order_jobs(sample_time)
+
+        total = sum([job.memory for job in self.jobs])
+        if len(self.jobs) == 1:
+            text = _("Migrating %s") % self.jobs[0].name
+        else:
+            text = _("Migrating %d guests") % len(self.jobs)
+        meter.start(size=total, text=text)
+
+        queue = Queue.Queue()
+        for job in self.jobs:
+            queue.put(job)
+
+        def _worker():
+            while not self.canceled:
+                try:
+                    job = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    self._migrate_one(job)
+                except Exception, e:
+                    logging.exception("Error migrating %s", job.name)
+                    job.error = str(e)
+                    job.state = MigrationJob.STATE_FAILED
+
+        threads = []
+        for ignore in range(max(1, min(self.max_parallel, len(self.jobs)))):
+            thread = threading.Thread(target=_worker,
+                                      name="Batch migration thread")
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        while [thread for thread in threads if thread.isAlive()]:
+            for job in self.jobs:
+                if job.state == MigrationJob.STATE_RUNNING:
+                    self._poll_job(job)
+            meter.update(self._get_done())
+            time.sleep(_POLL_INTERVAL)
+        for thread in threads:
+            thread.join()
+
+        meter.end(self._get_done())
+
+        for job in self.jobs:
+            if job.state == MigrationJob.STATE_QUEUED:
+                job.state = MigrationJob.STATE_CANCELED
+
+        errors = ["%s: %s" % (job.name, job.error)
+                  for job in self.jobs
+                  if job.state == MigrationJob.STATE_FAILED]
+        if self.canceled:
+            errors.append(_("Migration canceled, %d guests were not "
+                            "migrated") %
+                          len([j for j in self.jobs
+                               if j.state == MigrationJob.STATE_CANCELED]))
+        if errors:
+            raise RuntimeError("\n".join(errors))
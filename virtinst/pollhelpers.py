@@ -19,6 +19,8 @@
 
 import logging
 
+import libvirt
+
 from virtinst import util
 
 
@@ -176,20 +178,38 @@ def fetch_interfaces(backend, origmap, build_func):
                                 lookup_func, build_func)
 
 
-def fetch_nodedevs(backend, origmap, build_func):
-    name = "nodedev"
-    if backend.check_support(
-            backend.SUPPORT_CONN_LISTALLDEVICES):
-        return _new_poll_helper(origmap, name,
-                                backend.listAllDevices,
-                                "name", build_func)
-    else:
-        active_list = lambda: backend.listDevices(None, 0)
-        inactive_list = lambda: []
-        lookup_func = backend.nodeDeviceLookupByName
-        return _old_poll_helper(origmap, name,
-                                active_list, inactive_list,
-                                lookup_func, build_func)
+# Node device capability -> listAllDevices flag that filters on it
+_NODEDEV_CAP_FLAGS = {
+    "system": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_SYSTEM",
+    "pci": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_PCI_DEV",
+    "usb_device": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_USB_DEV",
+    "usb": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_USB_INTERFACE",
+    "net": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_NET",
+    "scsi_host": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_SCSI_HOST",
+    "scsi_target": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_SCSI_TARGET",
+    "scsi": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_SCSI",
+    "storage": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_STORAGE",
+    "fc_host": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_FC_HOST",
+    "vports": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_VPORTS",
+    "scsi_generic": "VIR_CONNECT_LIST_NODE_DEVICES_CAP_SCSI_GENERIC",
+}
+
+
+def list_nodedevs(backend, devtype=None):
+    """
+    List the node devices with capability @devtype, or every device if
+    @devtype is None. Returns a dict of name -> virNodeDevice. The old
+    style API only gives us names, in which case the value is None and
+    callers look up the handles they actually need.
+    """
+    flagname = devtype and _NODEDEV_CAP_FLAGS.get(devtype)
+    if (backend.check_support(backend.SUPPORT_CONN_LISTALLDEVICES) and
+        (not devtype or hasattr(libvirt, flagname or ""))):
+        flags = flagname and getattr(libvirt, flagname) or 0
+        return dict([(dev.name(), dev)
+                     for dev in backend.listAllDevices(flags)])
+
+    return dict([(name, None) for name in backend.listDevices(devtype, 0)])
 
 
 def _old_fetch_vms(backend, origmap, build_func):
@@ -594,6 +594,7 @@ class StorageVolume(_StorageObject):
     format = XMLProperty("./target/format/@type", default_cb=_default_format)
     target_path = XMLProperty("./target/path")
     backing_store = XMLProperty("./backingStore/path")
+    backing_format = XMLProperty("./backingStore/format/@type")
 
 
     ######################
@@ -674,6 +675,7 @@ class StorageVolume(_StorageObject):
             meter.end(self.capacity)
             logging.debug("Storage volume '%s' install complete.",
                           self.name)
+            self.conn.invalidate_pool_volumes(self.pool.name())
             return vol
         except libvirt.libvirtError, e:
             if util.is_error_nosupport(e):
@@ -258,6 +258,12 @@ SUPPORT_CONN_LISTALLINTERFACES = _make(function="virConnect.listAllInterfaces",
                                 args=())
 SUPPORT_CONN_LISTALLDEVICES = _make(function="virConnect.listAllDevices",
                                     args=())
+SUPPORT_CONN_GETALLDOMAINSTATS = _make(version=1002008,
+                                       function="virConnect.getAllDomainStats")
+SUPPORT_CONN_NODEDEV_EVENTS = _make(version=2002000,
+                            function="virConnect.nodeDeviceEventRegisterAny")
+SUPPORT_CONN_JOB_COMPLETED_EVENT = _make(version=1003003,
+                            function="virConnect.domainEventRegisterAny")
 SUPPORT_CONN_VIRTIO_MMIO = _make(version=1001002,
                                  drv_version=[("qemu", 1006000)])
 SUPPORT_CONN_DISK_SD = _make(version=1001002)
@@ -327,6 +333,8 @@ SUPPORT_POOL_LISTALLVOLUMES = _make(function="virStoragePool.listAllVolumes",
 SUPPORT_POOL_METADATA_PREALLOC = _make(
     flag="VIR_STORAGE_VOL_CREATE_PREALLOC_METADATA",
     version="1000001")
+SUPPORT_STORAGE_VOL_WIPE_PATTERN = _make(
+    function="virStorageVol.wipePattern", version=9010)
 
 
 # Interface checks
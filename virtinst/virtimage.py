@@ -19,15 +19,13 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 # MA 02110-1301 USA.
 
-import logging
 import os
 
-import urlgrabber
-
 from virtinst import CapabilitiesParser
 from virtinst import Installer
 from virtinst import VirtualDisk
 from virtinst import util
+from virtinst import checksum
 
 
 class Image(object):
@@ -61,6 +59,14 @@ class Image(object):
            to self.BASE"""
         return os.path.abspath(os.path.join(self.base, p))
 
+    def check_disk_signatures(self, meter=None, use_cache=True):
+        """
+        Verify the checksums of all our storage concurrently
+        """
+        checks = [(self.abspath(d.file), d.csum)
+                  for d in self.storage.values()]
+        checksum.verify_checksums(checks, meter=meter, use_cache=use_cache)
+
     def parseXML(self, node):
         self.name = xpathString(node, "name")
         self.label = xpathString(node, "label")
@@ -245,54 +251,9 @@ class Disk(object):
                  _("The format for disk %s must be one of %s") %
                  (self.file, ",".join(formats)))
 
-    def check_disk_signature(self, meter=None):
-        try:
-            import hashlib
-            sha = None
-        except:
-            import sha
-            hashlib = None
-
-        if meter is None:
-            meter = urlgrabber.progress.BaseMeter()
-
-        m = None
-        if hashlib:
-            if "sha256" in self.csum:
-                csumvalue = self.csum["sha256"]
-                m = hashlib.sha256()  # pylint: disable-msg=E1101
-
-            elif "sha1" in self.csum:
-                csumvalue = self.csum["sha1"]
-                m = hashlib.sha1()
-        else:
-            if "sha1" in self.csum:
-                csumvalue = self.csum["sha1"]
-                m = sha.new()
-
-        if not m:
-            return
-
-        meter_ct = 0
-        disk_size = os.path.getsize(self.file)
-        meter.start(size=disk_size,
-                    text=_("Checking disk signature for %s" % self.file))
-
-        f = file(self.file)
-        while 1:
-            chunk = f.read(65536)
-            if not chunk:
-                break
-            meter.update(meter_ct)
-            meter_ct = meter_ct + 65536
-            m.update(chunk)
-        checksum = m.hexdigest()
-        if checksum != csumvalue:
-            logging.debug(_("Disk signature for %s does not match "
-                            "Expected: %s  Received: %s" % (self.file,
-                             csumvalue, checksum)))
-            raise ValueError(_("Disk signature for %s does not "
-                               "match" % self.file))
+    def check_disk_signature(self, meter=None, use_cache=True):
+        checksum.verify_checksums([(self.file, self.csum)], meter=meter,
+                                  use_cache=use_cache)
 
 
 def validate(cond, msg):